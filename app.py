@@ -1,13 +1,14 @@
 # Enhanced main application
+from data_processing import enhance_movie_data_batch, load_and_process_data
 from rag_two_tower import RAGTwoTowerRecommender
 from evaluation_metrics import RecSysEvaluator
 
 def main():
-    # Load your existing data
-    movies_df = load_movie_data()
+    # Load MovieLens movies and ratings
+    movies_df, ratings_df = load_and_process_data()
     
     # Enhance with LLM features
-    enhanced_movies = enhance_movie_data_with_llm(movies_df)
+    enhanced_movies = enhance_movie_data_batch(movies_df)
     
     # Initialize RAG-enhanced recommender
     recommender = RAGTwoTowerRecommender(enhanced_movies)
@@ -20,7 +21,15 @@ def main():
     for idx, movie in recommendations.iterrows():
         print(f"- {movie['title']} (Themes: {movie['llm_themes']}, Tone: {movie['llm_tone']})")
     
-    # Evaluate system
-    evaluator = RecSysEvaluator(test_data)
-    metrics = evaluator.evaluate_all(recommendations['movieId'].tolist(), ground_truth_movies)
-    print(f"Evaluation Metrics: {metrics}")
+    # Evaluate system against the movies one user rated 4 or higher
+    user_id = int(ratings_df['userId'].iloc[0])
+    liked = ratings_df[(ratings_df['userId'] == user_id) & (ratings_df['rating'] >= 4)]
+    ground_truth_movies = liked['movieId'].tolist()
+    evaluator = RecSysEvaluator({user_id: ground_truth_movies})
+    recommended_ids = enhanced_movies.loc[recommendations.index, 'movieId'].tolist()
+    metrics = evaluator.evaluate_all(recommended_ids, ground_truth_movies)
+    print(f"Evaluation Metrics (user {user_id}): {metrics}")
+
+
+if __name__ == "__main__":
+    main()
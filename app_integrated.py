@@ -1,20 +1,10 @@
 from flask import Flask, render_template, request, jsonify
-import pandas as pd
-import numpy as np
-from enhanced_two_tower import EnhancedTwoTowerRecommender
-from data_processing import load_and_process_data  # Your existing data processing
+from recommendation_service import RecommendationService
 
 app = Flask(__name__)
 
-# Load data using your existing pipeline
-print("Loading movie data...")
-movies_df, ratings_df = load_and_process_data()
-print("Data loaded successfully!")
-
-# Initialize enhanced recommender
-print("Initializing Enhanced Two-Tower Recommender with LLM+RAG...")
-recommender = EnhancedTwoTowerRecommender(movies_df)
-print("Enhanced recommender ready!")
+# Recommender, ratings, checkpoint and micro-batcher, loaded once per process
+service = RecommendationService.load()
 
 @app.route('/')
 def home():
@@ -24,45 +14,21 @@ def home():
 @app.route('/recommend', methods=['POST'])
 def recommend():
     """Enhanced recommendation endpoint"""
-    try:
-        data = request.get_json()
-        
-        if 'query' in data:
-            # Enhanced LLM+RAG recommendations
-            user_query = data['query']
-            recommendations, search_criteria = recommender.recommend_from_query(
-                user_query, top_k=10, use_llm=True, alpha=0.7
-            )
-            
-            # Convert to JSON format
-            result = {
-                'query': user_query,
-                'search_criteria': search_criteria,
-                'recommendations': [],
-                'type': 'enhanced'
-            }
-            
-            for _, movie in recommendations.iterrows():
-                result['recommendations'].append({
-                    'title': movie.get('title', 'Unknown'),
-                    'score': float(movie.get('similarity_score', 0)),
-                    'genres': movie.get('llm_genres', []),
-                    'themes': movie.get('llm_themes', []),
-                    'tone': movie.get('llm_tone', ''),
-                    'explanation': movie.get('explanation', ''),
-                    'year': movie.get('year', '')
-                })
-            
-            return jsonify(result)
-            
-        elif 'user_id' in data:
-            # Fallback to traditional recommendations for user ID
-            user_id = data['user_id']
-            # You can implement user-based enhanced recommendations here
-            return jsonify({'error': 'User-based enhanced recommendations not implemented yet'})
-            
-    except Exception as e:
-        return jsonify({'error': str(e)})
+    body = service.handle_recommend(request.get_json(silent=True))
+    return app.response_class(body, mimetype='application/json')
+
+@app.route('/events', methods=['POST'])
+def events():
+    """
+    Ingest new ratings, either as JSON {'events': [[user_id, item_id, rating, timestamp], ...]}
+    or as a plain-text body in u.data format. Reflected by the next /recommend call.
+    """
+    return jsonify(service.handle_events(request.get_json(silent=True), request.get_data(as_text=True)))
+
+@app.route('/metrics')
+def metrics():
+    """Micro-batching queue depth and batch-size counters"""
+    return jsonify(service.metrics())
 
 @app.route('/traditional_recommend', methods=['POST'])
 def traditional_recommend():
@@ -0,0 +1,217 @@
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from recommendation_service import RecommendationService
+
+MAX_BODY_BYTES = 1 << 20
+
+
+class RecommenderASGI:
+    def __init__(self, service_factory: Callable[[], RecommendationService] = RecommendationService.load,
+                 max_workers: int = 4, max_pending: int = 64, request_timeout: float = 10.0,
+                 drain_timeout: float = 30.0):
+        """
+        Async serving entry point with the same /recommend JSON contract as app_integrated.
+
+        Loading happens in the ASGI lifespan startup, not at import, and GET /ready reports
+        503 until it finishes. Query requests are submitted to the service's micro-batcher
+        straight from the event loop, so every admitted query can join the same batch;
+        building their responses, user requests and events run on a pool of max_workers
+        threads (NumPy releases the GIL in the matmuls), so the event loop only parses
+        and replies.
+        At most max_pending requests are admitted at once; beyond that the server answers
+        429 straight away, and a request still waiting after request_timeout gets 503.
+        Shutdown stops admitting requests and drains the in-flight ones.
+
+        Each server process memory-maps the same embedding store, so under
+        `uvicorn asgi_app:app --workers N` the catalog matrices share the page cache.
+        """
+        self.service_factory = service_factory
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.request_timeout = request_timeout
+        self.drain_timeout = drain_timeout
+        self.service: Optional[RecommendationService] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.ready = False
+        self.in_flight = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.routes = {
+            ('POST', '/recommend'): self._recommend,
+            ('POST', '/events'): self._events,
+            ('GET', '/metrics'): self._metrics,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def startup(self) -> None:
+        self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='recommend')
+        self.service = await asyncio.get_running_loop().run_in_executor(self.executor, self.service_factory)
+        self.ready = True
+
+    async def shutdown(self) -> None:
+        self.ready = False
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.drain_timeout
+        while self.in_flight and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        if self.service is not None:
+            self.service.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        method, path = scope['method'], scope['path']
+        if path == '/health':
+            return await _respond(send, 200, {'status': 'ok'})
+        if path == '/ready':
+            return await _respond(send, 200 if self.ready else 503, {'ready': self.ready})
+
+        handler = self.routes.get((method, path))
+        if handler is None:
+            return await _respond(send, 404, {'error': f'No route for {method} {path}'})
+        if not self.ready:
+            return await _respond(send, 503, {'error': 'Service is not ready'})
+        if self.in_flight >= self.max_pending:
+            self.rejected += 1
+            return await _respond(send, 429, {'error': 'Too many requests'}, retry_after=1)
+
+        self.in_flight += 1
+        try:
+            body = await _read_body(receive)
+            if body is None:
+                return await _respond(send, 413, {'error': f'Body exceeds {MAX_BODY_BYTES} bytes'})
+            status, payload = await handler(scope, body)
+            await _respond(send, status, payload)
+        finally:
+            self.in_flight -= 1
+
+    async def _await(self, future) -> Tuple[int, Union[Dict, str]]:
+        """Await a concurrent Future; 503 if it does not finish within request_timeout"""
+        try:
+            return 200, await asyncio.wait_for(asyncio.wrap_future(future), self.request_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            return 503, {'error': 'Timed out waiting for a worker'}
+
+    async def _offload(self, fn, *args) -> Tuple[int, Union[Dict, str]]:
+        """Run fn on the worker pool; 503 if it does not finish within request_timeout"""
+        return await self._await(self.executor.submit(fn, *args))
+
+    async def _recommend(self, scope, body: bytes) -> Tuple[int, Union[Dict, str]]:
+        try:
+            data = json.loads(body or b'null')
+        except ValueError:
+            data = None
+        try:
+            request = self.service.parse_recommend(data)
+        except (TypeError, ValueError) as e:
+            return 200, {'error': str(e)}
+        if 'query' not in request:
+            return await self._offload(self.service.handle_recommend, data)
+        # Waiting on the batcher holds no pool thread, so batches are not capped at max_workers
+        try:
+            status, result = await self._await(self.service.submit_query(request['query']))
+        except Exception as e:
+            return 200, {'error': str(e)}
+        if status != 200:
+            return status, result
+        return await self._offload(self.service.query_response, request['query'], *result,
+                                   request['compact'], request['explain'])
+
+    async def _events(self, scope, body: bytes) -> Tuple[int, Dict]:
+        try:
+            data = json.loads(body) if _content_type(scope) == 'application/json' else None
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        return await self._offload(self.service.handle_events, data, body.decode('utf-8', 'replace'))
+
+    async def _metrics(self, scope, body: bytes) -> Tuple[int, Dict]:
+        metrics = self.service.metrics()
+        metrics['server'] = {'in_flight': self.in_flight, 'max_pending': self.max_pending,
+                             'rejected': self.rejected, 'timed_out': self.timed_out,
+                             'max_workers': self.max_workers}
+        return 200, metrics
+
+
+def _content_type(scope) -> str:
+    for name, value in scope.get('headers', []):
+        if name == b'content-type':
+            return value.decode('latin-1').split(';')[0].strip().lower()
+    return ''
+
+
+async def _read_body(receive) -> Optional[bytes]:
+    """Whole request body, or None once it grows past MAX_BODY_BYTES"""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+
+async def _respond(send, status: int, payload: Union[Dict, str], retry_after: Optional[int] = None) -> None:
+    """Send a JSON response; payload is a dict or an already serialized JSON body"""
+    body = (payload if isinstance(payload, str) else json.dumps(payload)).encode('utf-8')
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    if retry_after is not None:
+        headers.append((b'retry-after', str(retry_after).encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+app = RecommenderASGI(
+    max_workers=int(os.getenv('ASGI_MAX_WORKERS', '4')),
+    max_pending=int(os.getenv('ASGI_MAX_PENDING', '64')),
+    request_timeout=float(os.getenv('ASGI_REQUEST_TIMEOUT', '10'))
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the recommender over ASGI (requires uvicorn)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--workers', type=int, default=1, help="server processes sharing the embedding store")
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("uvicorn is not installed; `pip install uvicorn` or use any other ASGI server "
+                         "with asgi_app:app")
+    uvicorn.run('asgi_app:app', host=args.host, port=args.port, workers=args.workers, lifespan='on')
+
+
+if __name__ == "__main__":
+    main()
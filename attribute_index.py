@@ -0,0 +1,148 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Filter field -> catalog column; list-valued columns index every label in the list
+FIELDS = {
+    'genre': 'llm_genres',
+    'theme': 'llm_themes',
+    'tone': 'llm_tone',
+    'ml_genre': 'genres',  # the 19 MovieLens genre flags from u.item, lowercased
+}
+
+
+def _labels(value) -> List[str]:
+    if isinstance(value, str):
+        return [value.lower()]
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [str(label).lower() for label in value]
+    return []
+
+
+class Filter:
+    def __init__(self, op: str, args: Tuple):
+        """
+        A boolean expression over catalog attributes, combined with &, | and ~ and
+        evaluated against an AttributeIndex as packed bitsets, e.g.
+            any_of('genre', ['comedy', 'romance']) & ~term('ml_genre', 'horror')
+        """
+        self.op = op
+        self.args = args
+
+    def __and__(self, other: 'Filter') -> 'Filter':
+        return Filter('and', (self, other))
+
+    def __or__(self, other: 'Filter') -> 'Filter':
+        return Filter('or', (self, other))
+
+    def __invert__(self) -> 'Filter':
+        return Filter('not', (self,))
+
+    def __repr__(self):
+        if self.op == 'any':
+            return f"{self.args[0]}:{'|'.join(self.args[1])}"
+        if self.op == 'not':
+            return f"~({self.args[0]!r})"
+        if self.op == 'all':
+            return "*"
+        return f"({self.args[0]!r} {'&' if self.op == 'and' else '|'} {self.args[1]!r})"
+
+    def evaluate(self, index: 'AttributeIndex') -> np.ndarray:
+        """Packed bitset (uint8) of the rows matching this expression"""
+        if self.op == 'any':
+            field, values = self.args
+            bits = index.empty()
+            for value in values:
+                np.bitwise_or(bits, index.bits(field, value), out=bits)
+            return bits
+        if self.op == 'all':
+            return ~index.empty()
+        if self.op == 'not':
+            return np.invert(self.args[0].evaluate(index))
+        left, right = (arg.evaluate(index) for arg in self.args)
+        return np.bitwise_and(left, right) if self.op == 'and' else np.bitwise_or(left, right)
+
+
+def term(field: str, value: str) -> Filter:
+    """Rows whose field carries value"""
+    return Filter('any', (field, (value.lower(),)))
+
+
+def any_of(field: str, values: Iterable[str]) -> Filter:
+    """Rows whose field carries at least one of values"""
+    return Filter('any', (field, tuple(value.lower() for value in values)))
+
+
+def all_rows() -> Filter:
+    return Filter('all', ())
+
+
+def criteria_filter(search_criteria: Dict) -> Optional[Filter]:
+    """
+    Hard constraints from RAGQueryProcessor criteria: a movie tagged with an excluded
+    genre, by the LLM features or the MovieLens flags, is never a candidate.
+    None when the criteria exclude nothing.
+    """
+    excluded = search_criteria.get('excluded_genres') or []
+    if not excluded:
+        return None
+    return ~(any_of('genre', excluded) | any_of('ml_genre', excluded))
+
+
+class AttributeIndex:
+    def __init__(self, num_rows: int, postings: Dict[Tuple[str, str], np.ndarray]):
+        """
+        Inverted index over categorical catalog attributes: one packed bitset (one bit
+        per catalog row) per (field, value). Filters AND/OR/NOT whole bitsets, so a
+        candidate mask costs a few vector ops over num_rows / 8 bytes.
+        """
+        self.num_rows = num_rows
+        self.postings = postings
+        self._empty = np.zeros((num_rows + 7) // 8, dtype=np.uint8)
+
+    @classmethod
+    def from_catalog(cls, movies_df, fields: Dict[str, str] = FIELDS) -> 'AttributeIndex':
+        """Index the given fields (filter name -> column) present in movies_df"""
+        num_rows = len(movies_df)
+        postings = {}
+        for field, column in fields.items():
+            if column not in movies_df:
+                continue
+            rows_by_value = {}
+            for row, value in enumerate(movies_df[column]):
+                for label in _labels(value):
+                    rows_by_value.setdefault(label, []).append(row)
+            for label, rows in rows_by_value.items():
+                mask = np.zeros(num_rows, dtype=bool)
+                mask[rows] = True
+                postings[(field, label)] = np.packbits(mask)
+        return cls(num_rows, postings)
+
+    def __len__(self):
+        return self.num_rows
+
+    def empty(self) -> np.ndarray:
+        return self._empty.copy()
+
+    def bits(self, field: str, value: str) -> np.ndarray:
+        """Packed bitset of rows whose field carries value (read-only; all zero if none do)"""
+        return self.postings.get((field, value.lower()), self._empty)
+
+    def contains(self, field: str, value: str, rows) -> np.ndarray:
+        """Bool per row in rows: does that row's field carry value (read straight from the bitset)"""
+        rows = np.asarray(rows, dtype=np.intp)
+        return ((self.bits(field, value)[rows >> 3] >> (7 - (rows & 7))) & 1).astype(bool)
+
+    def values(self, field: str) -> List[str]:
+        return sorted(value for name, value in self.postings if name == field)
+
+    def mask(self, expression: Filter) -> np.ndarray:
+        """Bool mask over catalog rows matching expression"""
+        return np.unpackbits(expression.evaluate(self), count=self.num_rows).view(bool)
+
+    def rows(self, expression: Filter) -> np.ndarray:
+        """Catalog row indices matching expression, ascending"""
+        return np.flatnonzero(self.mask(expression))
+
+    def count(self, field: str, value: str) -> int:
+        return int(np.unpackbits(self.bits(field, value), count=self.num_rows).sum())
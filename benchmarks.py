@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from data_processing import enhance_movie_data_batch, load_and_process_data
+from evaluation_metrics import RecSysEvaluator
+from llm_feature_extractor import LLMFeatureExtractor
+from model_registry import _peak_rss_bytes
+from movielens import DEFAULT_DATA_DIR
+from query_cache import QueryEmbeddingCache
+from rag_query_processor import QUERY_GENRE_KEYWORDS, QUERY_THEME_KEYWORDS, TONE_PREFERENCE_KEYWORDS, RAGQueryProcessor
+from rag_two_tower import RAGTwoTowerRecommender
+
+CASES = ('extract_movie_features', 'generate_embedding', 'process_user_query', 'recommend', 'evaluate')
+# Cases that never touch the catalog, run once rather than per catalog size
+UNSIZED_CASES = ('extract_movie_features', 'generate_embedding', 'process_user_query')
+DEFAULT_SIZES = (1682, 10000, 50000)
+DEFAULT_THRESHOLD = 0.10
+# Latency percentiles compared against the baseline
+COMPARED_METRICS = ('p50_ms', 'p95_ms')
+
+
+def measure(call: Callable[[int], object], repeats: int, warmup: int = 3,
+            setup: Optional[Callable[[], object]] = None, memory_calls: int = 5) -> Dict:
+    """
+    Time repeats calls of call(i), running setup() untimed before each; latency
+    percentiles, throughput, the peak traced allocation of one call and the
+    process's peak RSS so far
+    """
+    setup = setup or (lambda: None)
+    for i in range(warmup):
+        setup()
+        call(i)
+    durations = np.empty(repeats)
+    for i in range(repeats):
+        setup()
+        start = time.perf_counter()
+        call(i)
+        durations[i] = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(durations, [50, 95, 99]) * 1000
+
+    # Memory is traced in a separate pass: tracemalloc slows every allocation
+    peak_traced = 0
+    tracemalloc.start()
+    try:
+        for i in range(min(memory_calls, repeats)):
+            setup()
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            call(i)
+            peak_traced = max(peak_traced, tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'calls': repeats,
+        'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+        'mean_ms': float(durations.mean() * 1000),
+        'throughput_per_s': float(repeats / durations.sum()),
+        # Bytes allocated by one call above what was live before it (Python and NumPy)
+        'peak_traced_mb': peak_traced / 2 ** 20,
+        # ru_maxrss is a process-wide high-water mark: the peak of every case run so far,
+        # not of this case alone
+        'process_peak_rss_mb': _peak_rss_bytes() / 2 ** 20,
+    }
+
+
+def synthetic_catalog(enhanced_movies_df: pd.DataFrame, size: int, seed: int = 0) -> pd.DataFrame:
+    """
+    An enriched catalog of `size` rows scaled up from the MovieLens one: rows are tiled,
+    copies get new ids and titles, and their embeddings are jittered so they are distinct.
+    """
+    base = len(enhanced_movies_df)
+    rows = np.arange(size) % base
+    copies = np.arange(size) // base
+    catalog = enhanced_movies_df.iloc[rows].reset_index(drop=True)
+
+    rng = np.random.default_rng(seed)
+    jitter = np.where(copies[:, None] > 0, 0.05, 0.0).astype(np.float32)
+    embeddings = {}
+    for column in ('llm_embedding', 'traditional_embedding'):
+        matrix = np.stack(catalog[column].to_numpy()).astype(np.float32)
+        matrix += jitter * rng.standard_normal(matrix.shape, dtype=np.float32)
+        embeddings[column] = list(matrix)
+
+    return catalog.assign(
+        movieId=catalog['movieId'].to_numpy() + copies * (int(enhanced_movies_df['movieId'].max()) + 1),
+        title=[title if copy == 0 else f"{title} [{copy}]" for title, copy in zip(catalog['title'], copies)],
+        **embeddings)
+
+
+def synthetic_queries(count: int, seed: int = 0) -> List[str]:
+    """Free-text queries mixing the query processor's genre, theme and tone vocabulary"""
+    rng = np.random.default_rng(seed)
+    genres = [keywords[0] for keywords in QUERY_GENRE_KEYWORDS.values()]
+    themes = [keywords[0] for keywords in QUERY_THEME_KEYWORDS.values()]
+    tones = [keywords[0] for keywords in TONE_PREFERENCE_KEYWORDS.values()]
+    return [f"I want {rng.choice(tones)} {rng.choice(genres)} movies about {rng.choice(themes)}"
+            + (", no horror" if rng.random() < 0.2 else "")
+            for _ in range(count)]
+
+
+def run_benchmarks(enhanced_movies_df: pd.DataFrame, movies_df: pd.DataFrame,
+                   sizes: Sequence[int] = DEFAULT_SIZES, cases: Sequence[str] = CASES,
+                   repeats: int = 200, cold_cache: bool = False, seed: int = 0) -> Dict[str, Dict]:
+    """
+    Results keyed '<case>@<catalog size>', or '<case>' for UNSIZED_CASES. Query paths
+    clear the query cache before every call so they time the encoder, not a cache hit;
+    with cold_cache the extractor's feature-embedding memo is cleared too.
+    generate_embedding always clears the memo: it times encoding a feature
+    combination, not a dict lookup.
+    """
+    extractor = LLMFeatureExtractor()
+    queries = synthetic_queries(max(repeats // 4, 1), seed)
+    rng = np.random.default_rng(seed)
+    cache = QueryEmbeddingCache()
+    results = {}
+
+    def clear_caches():
+        cache.clear()
+        if cold_cache:
+            extractor.feature_embeddings.clear()
+
+    overviews = movies_df['overview'].to_numpy()
+    titles = movies_df['title'].to_numpy()
+    picks = rng.integers(0, len(movies_df), repeats + 3)
+
+    if 'extract_movie_features' in cases:
+        results['extract_movie_features'] = measure(
+            lambda i: extractor.extract_movie_features(overviews[picks[i]], titles[picks[i]]), repeats)
+
+    if 'generate_embedding' in cases:
+        features = [extractor.extract_movie_features(overviews[p], titles[p]) for p in picks]
+        results['generate_embedding'] = measure(
+            lambda i: extractor.generate_embedding(features[i]), repeats,
+            setup=extractor.feature_embeddings.clear)
+
+    if 'process_user_query' in cases:
+        processor = RAGQueryProcessor(extractor, cache)
+        results['process_user_query'] = measure(
+            lambda i: processor.process_user_query(queries[i % len(queries)]), repeats, setup=clear_caches)
+
+    for size in sizes:
+        catalog = synthetic_catalog(enhanced_movies_df, size, seed)
+
+        if 'recommend' in cases:
+            recommender = RAGTwoTowerRecommender(catalog, feature_extractor=extractor, query_cache=cache)
+            results[f'recommend@{size}'] = measure(
+                lambda i: recommender.recommend(queries[i % len(queries)], top_k=10), repeats,
+                setup=clear_caches)
+            del recommender
+
+        if 'evaluate' in cases:
+            num_users, depth = 943, 20
+            recommendations = rng.integers(0, size, (num_users, depth))
+            ground_truth = [rng.choice(size, rng.integers(1, 30), replace=False) for _ in range(num_users)]
+            evaluator = RecSysEvaluator(dict(enumerate(ground_truth)))
+            results[f'evaluate@{size}'] = measure(
+                lambda i: evaluator.evaluate_batch(recommendations, ground_truth, ks=(5, 10, 20)),
+                max(repeats // 10, 5))
+
+    return results
+
+
+def compare_to_baseline(results: Dict[str, Dict], baseline: Dict[str, Dict],
+                        threshold: float = DEFAULT_THRESHOLD) -> List[Dict]:
+    """Cases whose compared latencies grew by more than threshold (a fraction) over the baseline"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if previous[metric] > 0 and current[metric] > previous[metric] * (1 + threshold):
+                regressions.append({'case': name, 'metric': metric, 'baseline': previous[metric],
+                                    'current': current[metric], 'change': current[metric] / previous[metric] - 1})
+    return regressions
+
+
+def environment() -> Dict:
+    return {'python': sys.version.split()[0], 'numpy': np.__version__, 'platform': platform.platform(),
+            'cpu_count': os.cpu_count()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency/throughput benchmarks for the recommendation hot paths")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=list(CASES))
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--cold-cache', action='store_true', help="also clear the feature-embedding memo before every call")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--baseline', help="compare against a JSON file written by --output")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed fractional latency increase over the baseline")
+    args = parser.parse_args()
+
+    movies_df, _ = load_and_process_data(args.data_dir)
+    enhanced_movies_df = enhance_movie_data_batch(movies_df)
+    results = run_benchmarks(enhanced_movies_df, movies_df, args.sizes, args.cases,
+                             args.repeats, args.cold_cache, args.seed)
+
+    print(f"{'case':<36}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>12}{'call MB':>10}{'peak RSS MB':>13}")
+    for name, result in results.items():
+        print(f"{name:<36}{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}{result['p99_ms']:>10.3f}"
+              f"{result['throughput_per_s']:>12.1f}{result['peak_traced_mb']:>10.2f}{result['process_peak_rss_mb']:>13.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'settings': vars(args), 'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['case']} {regression['metric']}: "
+                  f"{regression['baseline']:.3f} -> {regression['current']:.3f} ms ({regression['change']:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+from typing import Dict, Sequence
+
+import numpy as np
+
+from attribute_index import AttributeIndex
+
+# Same weights as calculateMatchScore in the browser client
+GENRE_WEIGHT = 0.4
+THEME_WEIGHT = 0.3
+TONE_WEIGHT = 0.2
+EXCLUSION_PENALTY = 0.1
+
+
+class CriteriaScorer:
+    def __init__(self, attributes: AttributeIndex):
+        """
+        calculateMatchScore for the whole catalog at once. Each row's LLM genres, themes
+        and tone are one multi-hot row of `matrix` (taken from the attribute bitsets);
+        a query becomes a weight vector over the same columns, so
+            matrix @ weights = 0.4 * genre matches + 0.3 * theme matches + 0.2 * tone match
+        for every row in one product. Rows with an excluded genre are scaled by 0.1 and
+        the result is capped at 1.
+        """
+        self.columns = {}
+        bitsets = []
+        for field in ('genre', 'theme', 'tone'):
+            for value in attributes.values(field):
+                self.columns[(field, value)] = len(bitsets)
+                bitsets.append(attributes.bits(field, value))
+        self.num_rows = len(attributes)
+        if bitsets:
+            self.matrix = np.unpackbits(np.stack(bitsets), axis=1, count=self.num_rows).T.astype(np.float32)
+        else:
+            self.matrix = np.zeros((self.num_rows, 0), dtype=np.float32)
+
+    def __len__(self):
+        return self.num_rows
+
+    def query_weights(self, criteria_list: Sequence[Dict]):
+        """(match weights, excluded-genre indicators), each (len(criteria_list), num_columns)"""
+        weights = np.zeros((len(criteria_list), len(self.columns)), dtype=np.float32)
+        excluded = np.zeros_like(weights)
+        for i, criteria in enumerate(criteria_list):
+            for field, values, weight in (('genre', criteria['preferred_genres'], GENRE_WEIGHT),
+                                          ('theme', criteria['preferred_themes'], THEME_WEIGHT),
+                                          ('tone', [criteria['preferred_tone']], TONE_WEIGHT)):
+                for value in set(values):
+                    column = self.columns.get((field, value.lower()))
+                    if column is not None:
+                        weights[i, column] = weight
+            for value in criteria.get('excluded_genres') or []:
+                column = self.columns.get(('genre', value.lower()))
+                if column is not None:
+                    excluded[i, column] = 1.0
+        return weights, excluded
+
+    def score(self, criteria_list: Sequence[Dict]) -> np.ndarray:
+        """(len(criteria_list), num_rows) structured match scores in [0, 1]"""
+        weights, excluded = self.query_weights(criteria_list)
+        scores = weights @ self.matrix.T
+        if excluded.any():
+            penalized = (excluded @ self.matrix.T) > 0
+            scores[penalized] *= np.float32(EXCLUSION_PENALTY)
+        return np.minimum(scores, np.float32(1.0), out=scores)
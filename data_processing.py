@@ -1,20 +1,62 @@
+import numpy as np
+import pandas as pd
+from feature_cache import FEATURE_KEYS
+from llm_feature_extractor import LLMFeatureExtractor
+from query_cache import feature_key
+from movielens import DEFAULT_DATA_DIR, load_movielens
+
+def load_and_process_data(data_dir=DEFAULT_DATA_DIR):
+    """
+    Load MovieLens 100K into (movies_df, ratings_df).
+    MovieLens ships no plot summaries, so each movie's overview is built from its title
+    and genre names; that gives the keyword extractor genre words to work with.
+    """
+    data = load_movielens(data_dir)
+    
+    genres = [data.genre_names(i) for i in range(data.num_items)]
+    movies_df = pd.DataFrame({
+        'movieId': data.movie_ids,
+        'title': data.titles,
+        'year': data.years,
+        'genres': genres,
+        'overview': [f"{title}. {', '.join(names).lower()}." for title, names in zip(data.titles, genres)]
+    })
+    ratings_df = pd.DataFrame({
+        'userId': data.user_ids,
+        'movieId': data.item_ids,
+        'rating': data.ratings,
+        'timestamp': data.timestamps
+    })
+    return movies_df, ratings_df
+
+
 # Enhanced data processing with LLM features
-def enhance_movie_data_with_llm(movies_df):
+def enhance_movie_data_with_llm(movies_df, cache=None):
     extractor = LLMFeatureExtractor()
     
+    # Movies already in the persistent FeatureCache skip extraction and encoding
+    keys = cache.keys_for(extractor, movies_df['title'], movies_df['overview'].fillna('')) if cache is not None else None
+    cached = cache.get_many(keys) if cache is not None else {}
+    fresh = []
+    
     enhanced_movies = []
-    for _, movie in movies_df.iterrows():
-        # Get LLM structured features
-        features = extractor.extract_movie_features(movie['overview'])
-        
-        # Generate embedding from structured features
-        embedding = extractor.generate_embedding(features)
+    for i, (_, movie) in enumerate(movies_df.iterrows()):
+        if keys is not None and keys[i] in cached:
+            features, embedding = cached[keys[i]]
+        else:
+            # Get LLM structured features
+            features = extractor.extract_movie_features(movie['overview'])
+            
+            # Generate embedding from structured features
+            embedding = extractor.generate_embedding(features)
+            if keys is not None and not features.get('fallback'):
+                fresh.append((keys[i], features, embedding))
         
         enhanced_movie = {
             'movieId': movie['movieId'],
             'title': movie['title'],
             'genres': movie['genres'],
-            'llm_genre': features['genre'],
+            'llm_genres': features['genres'],
             'llm_themes': features['themes'],
             'llm_tone': features['tone'],
             'llm_embedding': embedding.tolist(),
@@ -22,4 +64,65 @@ def enhance_movie_data_with_llm(movies_df):
         }
         enhanced_movies.append(enhanced_movie)
     
+    if fresh:
+        cache.put_many(fresh)
     return pd.DataFrame(enhanced_movies)
+
+def _features_with_cache(extractor, movies_df, cache):
+    """
+    Features for every movie as (features, keys, fresh, known), extracting only the
+    movies missing from cache. fresh[i] marks rows extracted now; known maps a
+    feature_key to a cached embedding so those combinations need no encoding.
+    """
+    titles = movies_df['title'].fillna('').astype(str).reset_index(drop=True)
+    overviews = movies_df['overview'].reset_index(drop=True)
+    if cache is None:
+        return extractor.extract_features_batch(overviews, titles), None, np.ones(len(titles), dtype=bool), {}
+    
+    keys = cache.keys_for(extractor, titles, overviews.fillna(''))
+    cached = cache.get_many(keys)
+    fresh = np.array([key not in cached for key in keys], dtype=bool)
+    records = [cached[key][0] if key in cached else None for key in keys]
+    if fresh.any():
+        extracted = extractor.extract_features_batch(overviews[fresh], titles[fresh])
+        for i, features in zip(np.flatnonzero(fresh), extracted.to_dict('records')):
+            records[i] = features
+    known = {feature_key(features): embedding for features, embedding in cached.values()}
+    return pd.DataFrame(records, columns=list(FEATURE_KEYS) + ['fallback']), keys, fresh, known
+
+# Batch enrichment for whole catalogs
+def enhance_movie_data_batch(movies_df, batch_size=256, extractor=None, cache=None):
+    """
+    Same output columns as enhance_movie_data_with_llm, built column-wise.
+    Features are extracted for the whole overview column at once. Each distinct
+    feature combination is encoded once (in batches of batch_size), and the
+    llm_embedding column holds row views into that small shared matrix rather than
+    a vector per movie.
+    Catalogs without an 'embedding' column reuse the LLM vectors as the traditional tower.
+    With a FeatureCache, only movies whose title, overview, extractor version or model
+    changed since they were cached are extracted and encoded, and those are added to it.
+    """
+    extractor = extractor or LLMFeatureExtractor()
+
+    features, keys, fresh, known = _features_with_cache(extractor, movies_df, cache)
+    codes, unique = extractor.encode_feature_combinations(features, batch_size=batch_size, known=known)
+    unique_rows = list(unique)
+    embeddings = [unique_rows[code] for code in codes]
+    if cache is not None and fresh.any():
+        # Movies the remote LLM failed on fell back to defaults; retry them next run
+        fallback = features['fallback'].eq(True).to_numpy()
+        cache.put_many((keys[i], features.iloc[i].to_dict(), unique_rows[codes[i]])
+                       for i in np.flatnonzero(fresh & ~fallback))
+
+    return pd.DataFrame({
+        'movieId': movies_df['movieId'].to_numpy(),
+        'title': movies_df['title'].to_numpy(),
+        'year': movies_df['year'].to_numpy() if 'year' in movies_df else None,
+        'genres': movies_df['genres'].to_numpy(),
+        'llm_genres': features['genres'].to_numpy(),
+        'llm_themes': features['themes'].to_numpy(),
+        'llm_tone': features['tone'].to_numpy(),
+        'llm_embedding': embeddings,
+        'traditional_embedding': (movies_df['embedding'].to_numpy()  # Keep original
+                                  if 'embedding' in movies_df else embeddings)
+    })
@@ -0,0 +1,242 @@
+import contextlib
+import json
+import os
+import struct
+import tempfile
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds are not serialized across processes
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+# File layout (little-endian):
+#   magic (8 bytes) | version (uint32) | header length (uint32) | JSON header
+#   padding to ALIGNMENT | ids (int64 x rows) | padding | float32 matrix (rows x dim)
+# Version 2 files may instead store only the distinct vectors plus a code per row:
+#   ... | ids | padding | int32 codes (rows) | padding | float32 matrix (unique_rows x dim)
+MAGIC = b"EMBSTORE"
+STORE_VERSION = 2
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct("<8sII")
+
+CATALOG_FILE = "catalog.json"
+LOCK_FILE = ".lock"
+LLM_FILE = "llm_embedding.emb"
+TRADITIONAL_FILE = "traditional_embedding.emb"
+EMBEDDING_COLUMNS = ['llm_embedding', 'traditional_embedding']
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+@contextlib.contextmanager
+def _atomic_file(path: str, mode: str = "wb") -> Iterator:
+    """
+    A uniquely named temporary file next to path, renamed over path on success.
+    Concurrent writers never share a temp file, and readers never see a partial one.
+    """
+    directory = os.path.dirname(path) or "."
+    f = tempfile.NamedTemporaryFile(mode, dir=directory, prefix=f".{os.path.basename(path)}.",
+                                    suffix=".tmp", delete=False)
+    try:
+        with f:
+            yield f
+        # mkstemp files are private; store files are read by every server process
+        os.chmod(f.name, 0o644)
+        os.replace(f.name, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(f.name)
+        raise
+
+
+@contextlib.contextmanager
+def store_lock(store_dir: str) -> Iterator[None]:
+    """
+    Exclusive lock on store_dir across processes, e.g. server workers that all find
+    no store on first boot: one builds it while the others wait, then open it.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, LOCK_FILE), "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class EmbeddingFile:
+    def __init__(self, path: str, ids: np.ndarray, vectors: np.ndarray, metadata: Dict, version: int,
+                 codes: Optional[np.ndarray] = None):
+        """
+        An opened embedding file. vectors is a read-only np.memmap when opened with
+        mmap=True, so every process mapping the same file shares one page-cache copy.
+        Deduplicated files hold one vector per distinct embedding plus codes (row i's
+        embedding is vectors[codes[i]]); score through the codes to keep it mapped,
+        since matrix expands them into a private (rows, dim) array.
+        """
+        self.path = path
+        self.ids = ids
+        self.vectors = vectors
+        self.metadata = metadata
+        self.version = version
+        self.codes = codes
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """One row per id: the mapped vectors themselves, or an in-memory copy expanded from codes"""
+        return self.vectors if self.codes is None else np.asarray(self.vectors)[self.codes]
+
+
+def write_embedding_file(path: str, ids, matrix, metadata: Optional[Dict] = None,
+                         codes: Optional[np.ndarray] = None) -> None:
+    """
+    Write ids and a float32 matrix to path with a versioned metadata header.
+    With codes, matrix holds the distinct vectors and row i is stored as matrix[codes[i]].
+    """
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    if codes is not None:
+        codes = np.ascontiguousarray(codes, dtype=np.int32)
+        if len(codes) != len(ids) or (len(codes) and not 0 <= codes.min() <= codes.max() < len(matrix)):
+            raise ValueError(f"Expected {len(ids)} codes into {len(matrix)} vectors")
+    if matrix.ndim != 2 or len(ids) != (matrix.shape[0] if codes is None else len(codes)):
+        raise ValueError(f"Expected {len(ids)} rows of embeddings, got shape {matrix.shape}")
+
+    header = dict(metadata or {})
+    header.update({
+        "rows": int(len(ids)),
+        "dim": int(matrix.shape[1]),
+        "dtype": "float32",
+        "id_dtype": "int64",
+        "created": header.get("created", time.time()),
+    })
+    if codes is not None:
+        header["unique_rows"] = int(matrix.shape[0])
+        header["codes_offset"] = 0
+    header["ids_offset"] = header["matrix_offset"] = 0
+    # Offsets are part of the header, so recompute until the layout is stable
+    while True:
+        header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+        ids_offset = _align(_PREAMBLE.size + len(header_bytes))
+        matrix_offset = _align(ids_offset + ids.nbytes)
+        layout = {"ids_offset": ids_offset}
+        if codes is not None:
+            layout["codes_offset"] = matrix_offset
+            matrix_offset = _align(matrix_offset + codes.nbytes)
+        layout["matrix_offset"] = matrix_offset
+        if all(header[key] == offset for key, offset in layout.items()):
+            break
+        header.update(layout)
+
+    # Write to a temporary file and rename so readers never see a partial store
+    with _atomic_file(path) as f:
+        # Dense files keep the version 1 layout so older readers can still open them
+        f.write(_PREAMBLE.pack(MAGIC, STORE_VERSION if codes is not None else 1, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (ids_offset - f.tell()))
+        f.write(ids.tobytes())
+        if codes is not None:
+            f.write(b"\0" * (header["codes_offset"] - f.tell()))
+            f.write(codes.tobytes())
+        f.write(b"\0" * (matrix_offset - f.tell()))
+        f.write(matrix.tobytes())
+
+
+def open_embedding_file(path: str, mmap: bool = True) -> EmbeddingFile:
+    """Open an embedding file; the matrix is memory-mapped unless mmap=False"""
+    with open(path, "rb") as f:
+        magic, version, header_len = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an embedding store file")
+        if version > STORE_VERSION:
+            raise ValueError(f"{path} has store version {version}, newest supported is {STORE_VERSION}")
+        header = json.loads(f.read(header_len).decode("utf-8"))
+
+    rows, dim = header["rows"], header["dim"]
+    stored = header.get("unique_rows", rows)
+    ids = np.fromfile(path, dtype=np.int64, count=rows, offset=header["ids_offset"])
+    if mmap:
+        matrix = np.memmap(path, dtype=np.float32, mode="r", offset=header["matrix_offset"], shape=(stored, dim))
+    else:
+        matrix = np.fromfile(path, dtype=np.float32, count=stored * dim,
+                             offset=header["matrix_offset"]).reshape(stored, dim)
+    codes = None
+    if "codes_offset" in header:
+        codes = np.fromfile(path, dtype=np.int32, count=rows, offset=header["codes_offset"])
+    return EmbeddingFile(path, ids, matrix, header, version, codes=codes)
+
+
+def _deduplicate(matrix: np.ndarray) -> Tuple[Optional[np.ndarray], np.ndarray]:
+    """
+    (codes, vectors) when at most half of matrix's rows are distinct, else (None, matrix).
+    Enriched catalogs embed feature combinations rather than movies, so most rows repeat.
+    """
+    if len(matrix) == 0:
+        return None, matrix
+    vectors, first, codes = np.unique(matrix, axis=0, return_index=True, return_inverse=True)
+    if 2 * len(vectors) > len(matrix):
+        return None, matrix
+    # Keep the distinct vectors in order of first appearance
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[codes.reshape(-1)].astype(np.int32), vectors[order]
+
+
+def _stack_column(column: pd.Series) -> np.ndarray:
+    """Stack a column of per-row vectors into one float32 matrix"""
+    if len(column) == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.stack([np.asarray(v, dtype=np.float32) for v in column])
+
+
+def save_catalog_store(store_dir: str, enhanced_movies_df: pd.DataFrame, metadata: Optional[Dict] = None) -> None:
+    """
+    Persist an enriched catalog: both embedding towers as raw float32 files plus
+    the remaining columns as catalog.json, all keyed by movieId. A tower whose rows
+    mostly repeat is stored as its distinct vectors plus an int32 code per movie.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    ids = enhanced_movies_df['movieId'].to_numpy(dtype=np.int64)
+
+    for column, name in zip(EMBEDDING_COLUMNS, (LLM_FILE, TRADITIONAL_FILE)):
+        codes, vectors = _deduplicate(_stack_column(enhanced_movies_df[column]))
+        write_embedding_file(os.path.join(store_dir, name), ids, vectors, metadata, codes=codes)
+
+    # The catalog goes last: catalog_store_exists only sees a store once it is complete
+    catalog = enhanced_movies_df.drop(columns=EMBEDDING_COLUMNS)
+    with _atomic_file(os.path.join(store_dir, CATALOG_FILE), "w") as f:
+        catalog.to_json(f, orient="records")
+
+
+def load_catalog_store(store_dir: str, mmap: bool = True) -> Tuple[pd.DataFrame, EmbeddingFile, EmbeddingFile]:
+    """Load catalog metadata and open both embedding files from store_dir"""
+    llm = open_embedding_file(os.path.join(store_dir, LLM_FILE), mmap=mmap)
+    traditional = open_embedding_file(os.path.join(store_dir, TRADITIONAL_FILE), mmap=mmap)
+    catalog = pd.read_json(os.path.join(store_dir, CATALOG_FILE), orient="records")
+
+    if not (np.array_equal(llm.ids, traditional.ids) and
+            np.array_equal(llm.ids, catalog['movieId'].to_numpy(dtype=np.int64))):
+        raise ValueError(f"Embedding files in {store_dir} do not match the catalog ids")
+    return catalog, llm, traditional
+
+
+def catalog_store_exists(store_dir: str) -> bool:
+    return all(os.path.exists(os.path.join(store_dir, name))
+               for name in (CATALOG_FILE, LLM_FILE, TRADITIONAL_FILE))
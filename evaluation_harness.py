@@ -0,0 +1,253 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from evaluation_metrics import RecSysEvaluator
+from hybrid_scorer import top_k_indices
+from interactions import InteractionMatrix
+from movielens import DEFAULT_DATA_DIR, MovieLensData, load_movielens
+from two_tower_trainer import LOSSES, TwoTowerTrainer
+
+SPLITS = ('last_n', 'timestamp')
+MODELS = ('popularity', 'two_tower', 'content')
+DEFAULT_REPORT = os.path.join('data', 'evaluation_report.json')
+DEFAULT_STORE_DIR = os.getenv('EMBEDDING_STORE_DIR', os.path.join('data', 'embedding_store'))
+
+
+class EvaluationSplit:
+    def __init__(self, data: MovieLensData, is_test: np.ndarray, min_rating: int, description: Dict):
+        """
+        Train/test partition of the MovieLens ratings.
+        train: InteractionMatrix of the training ratings (also used to mask seen items).
+        test_users: user indices with at least one training and one relevant test rating.
+        ground_truth: (indptr, indices) of relevant test items, one row per test user.
+        """
+        self.data = data
+        self.description = description
+        train = ~is_test
+        self.train_user_index = data.user_index[train]
+        self.train_item_index = data.item_index[train]
+        self.train = InteractionMatrix(self.train_user_index, self.train_item_index, data.ratings[train],
+                                       data.timestamps[train], data.num_users, data.num_items)
+
+        relevant = is_test & (data.ratings >= min_rating)
+        has_train = self.train.user_counts() > 0
+        relevant &= has_train[data.user_index]
+        order = np.lexsort((data.item_index[relevant], data.user_index[relevant]))
+        test_user_index = data.user_index[relevant][order]
+        self.test_users, counts = np.unique(test_user_index, return_counts=True)
+        self.ground_truth = (np.concatenate([[0], np.cumsum(counts)]), data.item_index[relevant][order])
+
+    @property
+    def num_test_users(self) -> int:
+        return len(self.test_users)
+
+    def test_data(self) -> Dict[int, list]:
+        """Ground truth as {user_id: [movie_id, ...]}, the form RecSysEvaluator takes"""
+        indptr, indices = self.ground_truth
+        movie_ids = self.data.movie_ids[indices]
+        return {int(self.data.index_user_ids[user]): movie_ids[indptr[i]:indptr[i + 1]].tolist()
+                for i, user in enumerate(self.test_users)}
+
+
+def leave_last_n_split(data: MovieLensData, n: int = 1, min_rating: int = 0) -> EvaluationSplit:
+    """Hold out each user's n most recent ratings (users with more than n ratings)"""
+    order = np.lexsort((np.arange(data.num_ratings), data.timestamps, data.user_index))
+    counts = np.bincount(data.user_index, minlength=data.num_users)
+    row_counts = np.repeat(counts, counts)
+    from_end = row_counts - (np.arange(data.num_ratings) - np.repeat(np.cumsum(counts) - counts, counts))
+    is_test = np.zeros(data.num_ratings, dtype=bool)
+    is_test[order] = (from_end <= n) & (row_counts > n)
+    return EvaluationSplit(data, is_test, min_rating, {'split': 'last_n', 'n': n, 'min_rating': min_rating})
+
+
+def timestamp_split(data: MovieLensData, cutoff: Optional[int] = None, min_rating: int = 0,
+                    quantile: float = 0.8) -> EvaluationSplit:
+    """Ratings at or after cutoff are test; cutoff defaults to the given timestamp quantile"""
+    if cutoff is None:
+        cutoff = int(np.quantile(data.timestamps, quantile))
+    return EvaluationSplit(data, data.timestamps >= cutoff, min_rating,
+                           {'split': 'timestamp', 'cutoff': cutoff, 'min_rating': min_rating})
+
+
+class PopularityScorer:
+    def __init__(self, split: EvaluationSplit):
+        """Most-rated training items first, the same list for every user"""
+        self.counts = split.train.item_counts().astype(np.float32)
+
+    def score_users(self, users: np.ndarray) -> np.ndarray:
+        return np.tile(self.counts, (len(users), 1))
+
+
+class TwoTowerScorer:
+    def __init__(self, trainer: TwoTowerTrainer):
+        """Dot-product scores from a two-tower model trained on the training ratings"""
+        self.trainer = trainer
+
+    def score_users(self, users: np.ndarray) -> np.ndarray:
+        return self.trainer.score_users(users)
+
+
+class ContentScorer:
+    def __init__(self, store_dir: str, split: EvaluationSplit, profile_size: int = 10, alpha: float = 0.7):
+        """
+        Hybrid content scores from the RAGTwoTowerRecommender catalog in store_dir: each
+        user's profile is the mean fused vector of their top-rated training movies, as in
+        app_integrated. Pickles without the recommender (it holds locks and memory maps);
+        a pool worker reopens it from store_dir when it receives the scorer.
+        """
+        self.store_dir = store_dir
+        self.recommender = self._open_recommender(store_dir)
+        self.train = split.train
+        self.profile_size = profile_size
+        self.alpha = alpha
+        data = split.data
+        self.catalog_rows = np.full(data.num_items, -1, dtype=np.int64)
+        catalog_items = data.item_to_index(self.recommender.movies_df['movieId'].to_numpy())
+        self.catalog_rows[catalog_items[catalog_items >= 0]] = np.flatnonzero(catalog_items >= 0)
+
+    @staticmethod
+    def _open_recommender(store_dir: str):
+        from rag_two_tower import RAGTwoTowerRecommender
+        return RAGTwoTowerRecommender.from_store(store_dir)
+
+    def __getstate__(self) -> Dict:
+        state = self.__dict__.copy()
+        del state['recommender']
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self.recommender = self._open_recommender(self.store_dir)
+
+    def score_users(self, users: np.ndarray) -> np.ndarray:
+        scorer = self.recommender.scorer
+        profiles = np.zeros((len(users), scorer.llm.dim), dtype=np.float32)
+        for i, user in enumerate(users.tolist()):
+            rows = self.catalog_rows[self.train.top_rated(user, self.profile_size)]
+            rows = rows[rows >= 0]
+            if len(rows):
+                profiles[i] = scorer.fused_rows(rows, self.alpha).mean(axis=0)
+        scores = self.recommender.scorer.score(profiles, self.alpha)
+        item_scores = np.full((len(users), len(self.catalog_rows)), -np.inf, dtype=np.float32)
+        in_catalog = self.catalog_rows >= 0
+        item_scores[:, in_catalog] = scores[:, self.catalog_rows[in_catalog]]
+        return item_scores
+
+
+# Per-process state set up by _init_worker
+_worker = {}
+
+
+def _init_worker(scorer, train: InteractionMatrix, depth: int, chunk_size: int):
+    _worker.update(scorer=scorer, train=train, depth=depth, chunk_size=chunk_size)
+
+
+def _recommend_shard(users: np.ndarray) -> np.ndarray:
+    """Top-depth unseen item indices for a shard of users (-1 where fewer are scorable)"""
+    scorer, train, depth = _worker['scorer'], _worker['train'], _worker['depth']
+    recommendations = np.full((len(users), depth), -1, dtype=np.int64)
+    for start in range(0, len(users), _worker['chunk_size']):
+        chunk = users[start:start + _worker['chunk_size']]
+        scores = train.mask_seen(scorer.score_users(chunk), chunk)
+        top = top_k_indices(scores, depth)
+        top = np.where(np.isfinite(np.take_along_axis(scores, top, axis=1)), top, -1)
+        recommendations[start:start + len(chunk), :top.shape[1]] = top
+    return recommendations
+
+
+def evaluate(split: EvaluationSplit, scorer, ks: Sequence[int] = (5, 10, 20), num_workers: int = 1,
+             chunk_size: int = 256) -> Dict:
+    """
+    Recommend for every test user, sharded over a process pool, and score the merged
+    recommendation matrix with RecSysEvaluator.evaluate_batch.
+    """
+    depth = max(ks)
+    shards = [shard for shard in np.array_split(split.test_users, max(1, num_workers)) if len(shard)]
+
+    start = time.perf_counter()
+    if num_workers > 1:
+        with mp.Pool(num_workers, initializer=_init_worker,
+                     initargs=(scorer, split.train, depth, chunk_size)) as pool:
+            parts = pool.map(_recommend_shard, shards)
+    else:
+        _init_worker(scorer, split.train, depth, chunk_size)
+        parts = [_recommend_shard(shard) for shard in shards]
+    recommendations = np.concatenate(parts) if parts else np.empty((0, depth), dtype=np.int64)
+    recommend_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    evaluator = RecSysEvaluator(split.test_data())
+    metrics = evaluator.evaluate_batch(recommendations, split.ground_truth, ks)
+    return {
+        'metrics': metrics,
+        'num_users': split.num_test_users,
+        'num_workers': num_workers,
+        'timings': {'recommend_seconds': recommend_seconds,
+                    'evaluate_seconds': time.perf_counter() - start},
+    }
+
+
+def build_scorer(model: str, split: EvaluationSplit, epochs: int = 10, loss: str = 'softmax',
+                 store_dir: str = DEFAULT_STORE_DIR, alpha: float = 0.7):
+    if model == 'popularity':
+        return PopularityScorer(split)
+    if model == 'two_tower':
+        trainer = TwoTowerTrainer(split.data.num_users, split.data.num_items, loss=loss)
+        trainer.fit(split.train_user_index, split.train_item_index, epochs=epochs)
+        return TwoTowerScorer(trainer)
+    if model == 'content':
+        return ContentScorer(store_dir, split, alpha=alpha)
+    raise ValueError(f"Unknown model '{model}', expected one of {MODELS}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline evaluation on temporal MovieLens splits")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--model', choices=MODELS, default='two_tower')
+    parser.add_argument('--split', choices=SPLITS, default='last_n')
+    parser.add_argument('--n', type=int, default=5, help="ratings held out per user (last_n)")
+    parser.add_argument('--cutoff', type=int, default=None, help="test timestamp cutoff (timestamp)")
+    parser.add_argument('--min-rating', type=int, default=4, help="minimum test rating counted as relevant")
+    parser.add_argument('--k', type=int, nargs='+', default=[5, 10, 20])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--loss', choices=LOSSES, default='softmax')
+    parser.add_argument('--store-dir', default=DEFAULT_STORE_DIR)
+    parser.add_argument('--output', default=DEFAULT_REPORT)
+    args = parser.parse_args()
+
+    total_start = time.perf_counter()
+    data = load_movielens(args.data_dir)
+    start = time.perf_counter()
+    if args.split == 'last_n':
+        split = leave_last_n_split(data, args.n, args.min_rating)
+    else:
+        split = timestamp_split(data, args.cutoff, args.min_rating)
+    split_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scorer = build_scorer(args.model, split, epochs=args.epochs, loss=args.loss, store_dir=args.store_dir)
+    fit_seconds = time.perf_counter() - start
+
+    report = evaluate(split, scorer, args.k, args.workers)
+    report.update(model=args.model, **split.description)
+    report['timings'].update(split_seconds=split_seconds, fit_seconds=fit_seconds,
+                             total_seconds=time.perf_counter() - total_start)
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, value in report['metrics'].items():
+        print(f"{name}: {value:.4f}")
+    print(f"Evaluated {report['num_users']} users in {report['timings']['total_seconds']:.1f}s; "
+          f"report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
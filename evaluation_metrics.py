@@ -1,7 +1,25 @@
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Sequence, Tuple, Union
 from sklearn.metrics import ndcg_score
 
+# 1 / log2(position + 2) for positions 0..n-1, grown on demand and shared by every evaluator
+_DISCOUNTS = np.zeros(0)
+
+def _discounts(k: int) -> np.ndarray:
+    global _DISCOUNTS
+    if len(_DISCOUNTS) < k:
+        _DISCOUNTS = 1.0 / np.log2(np.arange(max(k, 2 * len(_DISCOUNTS))) + 2)
+    return _DISCOUNTS[:k]
+
+def ground_truth_csr(ground_truth_lists: Sequence[Sequence[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Ragged lists of relevant item ids as (indptr, indices), one row per user"""
+    lengths = np.fromiter((len(items) for items in ground_truth_lists), dtype=np.int64,
+                          count=len(ground_truth_lists))
+    indptr = np.concatenate([[0], np.cumsum(lengths)])
+    indices = np.fromiter((item for items in ground_truth_lists for item in items), dtype=np.int64,
+                          count=int(indptr[-1]))
+    return indptr, indices
+
 class RecSysEvaluator:
     def __init__(self, test_data: Dict[str, List[str]]):
         """
@@ -32,20 +50,13 @@ class RecSysEvaluator:
             return 0.0
         
         # Create relevance scores (1 for relevant, 0 for not)
-        relevance_scores = [1 if rec in ground_truth else 0 for rec in recommendations[:k]]
+        relevant = set(ground_truth)
+        relevance_scores = [1 if rec in relevant else 0 for rec in recommendations[:k]]
+        discounts = _discounts(k)
         
-        # Calculate DCG
-        dcg = 0
-        for i, rel in enumerate(relevance_scores):
-            dcg += rel / np.log2(i + 2)  # i+2 because index starts at 0
-        
-        # Calculate IDCG (ideal ordering)
-        ideal_relevance = [1] * min(len(ground_truth), k)
-        ideal_relevance += [0] * (k - len(ideal_relevance))
-        
-        idcg = 0
-        for i, rel in enumerate(ideal_relevance):
-            idcg += rel / np.log2(i + 2)
+        # DCG over the recommended positions, IDCG from the ideal ordering
+        dcg = float(np.dot(relevance_scores, discounts[:len(relevance_scores)]))
+        idcg = float(discounts[:min(len(ground_truth), k)].sum())
         
         return dcg / idcg if idcg > 0 else 0
     
@@ -57,6 +68,59 @@ class RecSysEvaluator:
             f'ndcg@{k}': self.ndcg_at_k(recommendations, ground_truth, k)
         }
     
+    def evaluate_batch(self, recommendations: np.ndarray,
+                       ground_truth: Union[Tuple[np.ndarray, np.ndarray], Sequence[Sequence[int]]],
+                       ks: Sequence[int] = (5, 10), per_user: bool = False) -> Dict[str, Any]:
+        """
+        Evaluate every user at once.
+        recommendations: (num_users x k) matrix of non-negative item ids, best first;
+            -1 pads rows with fewer recommendations.
+        ground_truth: relevant item ids per row, as (indptr, indices) or a list of lists.
+        Returns the mean of precision, recall, ndcg, hit_rate, mrr and map at each k
+        (per-user arrays instead when per_user=True). Rows are assumed free of duplicates.
+        """
+        recommendations = np.asarray(recommendations, dtype=np.int64)
+        if isinstance(ground_truth, tuple):
+            indptr, indices = (np.asarray(part, dtype=np.int64) for part in ground_truth)
+        else:
+            indptr, indices = ground_truth_csr(ground_truth)
+        num_users, depth = recommendations.shape
+        num_relevant = np.diff(indptr)
+        
+        # Encode (row, item) pairs as one integer so membership is a single sorted lookup
+        stride = int(max(recommendations.max(initial=0), indices.max(initial=0))) + 1
+        rows = np.repeat(np.arange(num_users, dtype=np.int64), num_relevant)
+        relevant_keys = np.unique(rows * stride + indices)
+        rec_keys = np.arange(num_users, dtype=np.int64)[:, None] * stride + recommendations
+        positions = np.minimum(np.searchsorted(relevant_keys, rec_keys), max(len(relevant_keys) - 1, 0))
+        hits = (recommendations >= 0) & (len(relevant_keys) > 0) & (relevant_keys[positions] == rec_keys)
+        
+        discounts = _discounts(max([depth, *ks]))
+        ideal = np.concatenate([[0.0], np.cumsum(discounts)])
+        cumulative_hits = np.cumsum(hits, axis=1)
+        first_hit = np.where(hits.any(axis=1), hits.argmax(axis=1), depth)
+        precision_at_position = cumulative_hits / np.arange(1, depth + 1)
+        
+        results = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for k in ks:
+                k_eff = min(k, depth)
+                hit_count = cumulative_hits[:, k_eff - 1] if k_eff else np.zeros(num_users)
+                capped = np.minimum(num_relevant, k)
+                metrics = {
+                    'precision': hit_count / k if k else np.zeros(num_users),
+                    'recall': np.where(num_relevant > 0, hit_count / num_relevant, 0.0),
+                    'ndcg': np.where(capped > 0,
+                                     hits[:, :k_eff] @ discounts[:k_eff] / ideal[capped], 0.0),
+                    'hit_rate': (hit_count > 0).astype(float),
+                    'mrr': np.where(first_hit < k_eff, 1.0 / (first_hit + 1), 0.0),
+                    'map': np.where(capped > 0,
+                                    (precision_at_position[:, :k_eff] * hits[:, :k_eff]).sum(axis=1) / capped, 0.0),
+                }
+                for name, values in metrics.items():
+                    results[f'{name}@{k}'] = values if per_user else float(values.mean()) if num_users else 0.0
+        return results
+    
     def compare_systems(self, baseline_recs: Dict, enhanced_recs: Dict, k: int = 5) -> Dict[str, Any]:
         """
         Compare baseline vs enhanced system performance
@@ -79,14 +143,14 @@ class RecSysEvaluator:
         
         # Calculate average improvements
         avg_improvement = {}
-        for metric in ['precision@5', 'recall@5', 'ndcg@5']:
+        for metric in [f'precision@{k}', f'recall@{k}', f'ndcg@{k}']:
             improvements = [result['improvement'][metric] for result in comparison_results.values()]
             avg_improvement[metric] = np.mean(improvements) if improvements else 0
         
         return {
             'user_comparisons': comparison_results,
             'average_improvement': avg_improvement,
-            'summary': f"LLM+RAG improved recommendations by {avg_improvement.get('precision@5', 0):.2%} on average"
+            'summary': f"LLM+RAG improved recommendations by {avg_improvement.get(f'precision@{k}', 0):.2%} on average"
         }
 
 # Example test data generator
@@ -0,0 +1,143 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from movielens import DEFAULT_DATA_DIR
+
+DEFAULT_CACHE_PATH = os.getenv('FEATURE_CACHE_PATH', os.path.join('data', '.cache', 'features.sqlite'))
+FEATURE_KEYS = ('genres', 'themes', 'tone', 'target_audience', 'processed_overview')
+# SQLite caps bound parameters per statement; lookups are chunked below it
+_CHUNK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS features (
+    key TEXT PRIMARY KEY,
+    features TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    embedding BLOB NOT NULL,
+    created REAL NOT NULL
+)
+"""
+
+
+def content_key(title: str, overview: str, extractor_version: str, model_name: str) -> str:
+    """Hex SHA-256 over everything the features and embedding of one movie depend on"""
+    payload = json.dumps([str(title), str(overview), extractor_version, model_name], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class FeatureCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        """
+        Durable, content-addressed store of extracted movie features and their embeddings.
+        Entries are keyed by content_key, so an unchanged movie is never extracted or
+        encoded twice, and editing a title or overview, bumping the extractor version
+        or switching models simply misses. Safe to share between threads.
+        """
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM features").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def keys_for(self, extractor, titles: Sequence[str], overviews: Sequence[str]) -> List[str]:
+        """content_key for each (title, overview) under this extractor's version and model"""
+        version, model_name = extractor.extractor_version, extractor.model_name
+        return [content_key('' if title is None else title, '' if overview is None else overview,
+                            version, model_name)
+                for title, overview in zip(titles, overviews)]
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Tuple[Dict, np.ndarray]]:
+        """{key: (features, float32 embedding)} for the keys present; absent keys are left out"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _CHUNK):
+                chunk = keys[start:start + _CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT key, features, dim, embedding FROM features WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk)
+                for key, features, dim, embedding in rows:
+                    found[key] = (json.loads(features), np.frombuffer(embedding, dtype=np.float32).reshape(dim))
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, entries: Iterable[Tuple[str, Dict, np.ndarray]]) -> int:
+        """Insert or replace (key, features, embedding) entries in one transaction"""
+        now = time.time()
+        rows = []
+        for key, features, embedding in entries:
+            embedding = np.ascontiguousarray(embedding, dtype=np.float32).ravel()
+            stored = {name: features[name] for name in FEATURE_KEYS if name in features}
+            rows.append((key, json.dumps(stored, ensure_ascii=False), len(embedding), embedding.tobytes(), now))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO features (key, features, dim, embedding, created) VALUES (?, ?, ?, ?, ?)",
+                rows)
+        return len(rows)
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM features")
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'bytes': sum(os.path.getsize(path) for path in (self.path, f"{self.path}-wal") if os.path.exists(path)),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or warm the persistent movie feature cache")
+    parser.add_argument('--path', default=DEFAULT_CACHE_PATH)
+    parser.add_argument('--clear', action='store_true', help="delete every cached entry")
+    parser.add_argument('--warm', action='store_true', help="enrich the MovieLens catalog through the cache")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    args = parser.parse_args()
+
+    with FeatureCache(args.path) as cache:
+        if args.clear:
+            cache.clear()
+        if args.warm:
+            from data_processing import enhance_movie_data_batch, load_and_process_data
+            movies_df, _ = load_and_process_data(args.data_dir)
+            start = time.perf_counter()
+            enhance_movie_data_batch(movies_df, cache=cache)
+            print(f"Enriched {len(movies_df)} movies in {time.perf_counter() - start:.2f}s")
+        print(json.dumps(cache.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
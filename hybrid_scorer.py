@@ -0,0 +1,219 @@
+import numpy as np
+from typing import Optional, Tuple
+
+# Scoring a gathered copy of the candidate rows beats masking a full pass below this fraction
+GATHER_FRACTION = 0.2
+
+
+def normalize_rows(matrix) -> np.ndarray:
+    """
+    L2-normalize rows as float32. All-zero rows stay zero, matching
+    sklearn's cosine_similarity. Matrices that are already unit-norm float32
+    (e.g. memory-mapped stores) are returned as-is so no private copy is made.
+    """
+    matrix = np.asarray(matrix)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    if matrix.dtype == np.float32 and np.allclose(norms[norms > 0], 1.0, atol=1e-4):
+        return matrix
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without a full sort"""
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+    if k < scores.shape[-1]:
+        candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        candidates = np.broadcast_to(np.arange(k), scores.shape[:-1] + (k,))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=-1), axis=-1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+def _inverse_norms(matrix, chunk_size: int = 65536) -> np.ndarray:
+    """1 / L2 norm of each row (0 for all-zero rows), read in chunks so no copy of matrix is made"""
+    inverse = np.zeros(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), chunk_size):
+        block = np.asarray(matrix[start:start + chunk_size], dtype=np.float32)
+        norms = np.sqrt(np.einsum('ij,ij->i', block, block))
+        np.divide(1.0, norms, out=inverse[start:start + len(block)], where=norms > 0)
+    return inverse
+
+
+class Tower:
+    def __init__(self, vectors, codes: Optional[np.ndarray] = None):
+        """
+        One embedding tower as cosine scores: the vectors are kept exactly as given
+        (typically a read-only memmap shared by every worker) plus 1 / norm per row.
+        With codes (a deduplicated store), catalog row i is vectors[codes[i]]: queries
+        score each distinct vector once and gather the scores by code, so the catalog
+        is never expanded in memory.
+        """
+        self.vectors = vectors
+        self.codes = None if codes is None else np.asarray(codes, dtype=np.intp)
+        self.inverse_norms = _inverse_norms(vectors)
+
+    def __len__(self):
+        return self.vectors.shape[0] if self.codes is None else len(self.codes)
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def _stored(self, rows: np.ndarray) -> np.ndarray:
+        return rows if self.codes is None else self.codes[rows]
+
+    def cosine(self, unit_queries: np.ndarray) -> np.ndarray:
+        """Cosine similarity of unit-norm queries with every row"""
+        scores = unit_queries @ self.vectors.T
+        scores *= self.inverse_norms
+        return scores if self.codes is None else scores[..., self.codes]
+
+    def cosine_rows(self, unit_queries: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """cosine restricted to rows; only those rows are read"""
+        stored = self._stored(rows)
+        scores = unit_queries @ np.asarray(self.vectors[stored], dtype=np.float32).T
+        scores *= self.inverse_norms[stored]
+        return scores
+
+    def unit_rows(self, rows: np.ndarray) -> np.ndarray:
+        """Normalized copies of the given rows"""
+        stored = self._stored(rows)
+        return np.asarray(self.vectors[stored], dtype=np.float32) * self.inverse_norms[stored, None]
+
+    def dense(self) -> np.ndarray:
+        """The (num_rows, dim) tower, expanded from its codes if it has any"""
+        return self.vectors if self.codes is None else np.asarray(self.vectors)[self.codes]
+
+
+class HybridScorer:
+    def __init__(self, llm_embeddings, traditional_embeddings):
+        """
+        Hybrid cosine scoring over both towers:
+            score = alpha * cos(q, llm) + (1 - alpha) * cos(q, traditional)
+        Each tower stays as given and only its row norms are precomputed, so no
+        per-alpha catalog copy is ever built; a memory-mapped store is shared by every
+        worker process. A query costs one matmul per tower (one when alpha is 0 or 1).
+        """
+        self.llm = llm_embeddings if isinstance(llm_embeddings, Tower) else Tower(llm_embeddings)
+        self.traditional = (traditional_embeddings if isinstance(traditional_embeddings, Tower)
+                            else Tower(traditional_embeddings))
+        if (len(self.llm), self.llm.dim) != (len(self.traditional), self.traditional.dim):
+            raise ValueError(f"Tower shapes differ: {(len(self.llm), self.llm.dim)} vs "
+                             f"{(len(self.traditional), self.traditional.dim)}")
+
+    def __len__(self):
+        return len(self.llm)
+
+    def _blend(self, alpha: float, llm_scores, traditional_scores) -> np.ndarray:
+        alpha = float(alpha)
+        if alpha == 1.0:
+            return llm_scores()
+        if alpha == 0.0:
+            return traditional_scores()
+        scores = llm_scores()
+        scores *= np.float32(alpha)
+        scores += np.float32(1 - alpha) * traditional_scores()
+        return scores
+
+    def fused_rows(self, rows, alpha: float = 0.7) -> np.ndarray:
+        """alpha * unit llm + (1 - alpha) * unit traditional vectors for the given rows"""
+        rows = np.asarray(rows)
+        return self._blend(alpha, lambda: self.llm.unit_rows(rows), lambda: self.traditional.unit_rows(rows))
+
+    def fused_matrix(self, alpha: float, chunk_size: int = 65536) -> np.ndarray:
+        """
+        The whole alpha-weighted catalog as one private (num_items, dim) array. Not used
+        for scoring; it is what an ANN index over the fused space is built from.
+        """
+        fused = np.empty((len(self), self.llm.dim), dtype=np.float32)
+        for start in range(0, len(self), chunk_size):
+            fused[start:start + chunk_size] = self.fused_rows(np.arange(start, min(start + chunk_size, len(self))), alpha)
+        return fused
+
+    def score(self, query_embeddings, alpha: float = 0.7) -> np.ndarray:
+        """
+        Hybrid scores for every catalog row. A single (dim,) query gives (num_items,);
+        a (num_queries, dim) batch gives (num_queries, num_items).
+        """
+        queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32))
+        return self._blend(alpha, lambda: self.llm.cosine(queries), lambda: self.traditional.cosine(queries))
+
+    def score_rows(self, query_embeddings, rows, alpha: float = 0.7) -> np.ndarray:
+        """score restricted to catalog rows, reading only those rows of each tower"""
+        queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32))
+        rows = np.asarray(rows)
+        return self._blend(alpha, lambda: self.llm.cosine_rows(queries, rows),
+                           lambda: self.traditional.cosine_rows(queries, rows))
+
+    def top_k(self, query_embeddings, top_k: int = 10, alpha: float = 0.7,
+              candidates=None, bias=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Row indices and scores of the top_k catalog rows, best first, per query.
+        candidates is an optional bool mask over catalog rows, (num_items,) for every
+        query or (num_queries, num_items); only those rows are eligible, and slots left
+        without a candidate hold index -1 and score -inf. bias, shaped like candidates,
+        is added to the cosine scores before ranking (e.g. weighted criteria matches).
+        """
+        if candidates is None and bias is None:
+            scores = self.score(query_embeddings, alpha)
+            indices = top_k_indices(scores, top_k)
+            return indices, np.take_along_axis(scores, indices, axis=-1)
+
+        rows = None
+        if candidates is not None:
+            candidates = np.asarray(candidates, dtype=bool)
+            selected = np.flatnonzero(candidates if candidates.ndim == 1 else candidates.any(axis=0))
+            # Selective filters score only the candidate rows; broad ones skip the gather copy
+            if len(selected) < GATHER_FRACTION * len(self):
+                rows = selected
+
+        if rows is not None:
+            scores = self.score_rows(query_embeddings, rows, alpha)
+            if bias is not None:
+                scores += np.asarray(bias, dtype=np.float32)[..., rows]
+            scores = np.where(candidates[..., rows], scores, np.float32(-np.inf))
+        else:
+            scores = self.score(query_embeddings, alpha)
+            if bias is not None:
+                scores += np.asarray(bias, dtype=np.float32)
+            if candidates is not None:
+                scores = np.where(candidates, scores, np.float32(-np.inf))
+
+        k = min(top_k, len(self))
+        indices = top_k_indices(scores, k)
+        top = np.take_along_axis(scores, indices, axis=-1)
+        if rows is not None:
+            indices = rows[indices]
+        indices = np.where(np.isfinite(top), indices, -1)
+        if indices.shape[-1] < k:
+            pad = [(0, 0)] * (indices.ndim - 1) + [(0, k - indices.shape[-1])]
+            indices = np.pad(indices, pad, constant_values=-1)
+            top = np.pad(top, pad, constant_values=-np.inf)
+        return indices, top
+
+    def top_k_batch(self, query_embeddings, top_k: int = 10, alpha: float = 0.7,
+                    chunk_size: int = 1024, candidates=None, bias=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        top_k for a (num_queries, dim) batch, scored chunk_size queries at a time so the
+        (chunk x num_items) score block stays bounded on large catalogs.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if candidates is not None:
+            candidates = np.asarray(candidates, dtype=bool)
+        if bias is not None:
+            bias = np.asarray(bias, dtype=np.float32)
+        k = min(top_k, len(self))
+        indices = np.empty((len(queries), k), dtype=np.intp)
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        for start in range(0, len(queries), chunk_size):
+            stop = start + chunk_size
+            chunk_candidates, chunk_bias = (
+                value[start:stop] if value is not None and value.ndim == 2 else value
+                for value in (candidates, bias)
+            )
+            indices[start:stop], scores[start:stop] = self.top_k(queries[start:stop], top_k, alpha,
+                                                                 candidates=chunk_candidates, bias=chunk_bias)
+        return indices, scores
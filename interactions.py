@@ -0,0 +1,195 @@
+from typing import Dict, Tuple
+
+import numpy as np
+
+from movielens import MovieLensData
+
+
+def _indptr(index: np.ndarray, size: int) -> np.ndarray:
+    return np.concatenate([[0], np.cumsum(np.bincount(index, minlength=size))]).astype(np.int64)
+
+
+def _sorted_row(items: np.ndarray, ratings: np.ndarray, timestamps: np.ndarray):
+    """A user row in CSR order (rating then recency, descending)"""
+    order = np.lexsort((-timestamps.astype(np.int64), -ratings.astype(np.int16)))
+    return items[order], ratings[order], timestamps[order]
+
+
+def _row_positions(indptr: np.ndarray, rows: np.ndarray):
+    """For a set of CSR rows: (position of each row in `rows`, flat positions of their entries)"""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    owner = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return owner, np.repeat(starts, lengths) + offsets
+
+
+class InteractionMatrix:
+    def __init__(self, user_index, item_index, ratings, timestamps, num_users: int, num_items: int):
+        """
+        User-item ratings in CSR (by user) and CSC (by item) form, built once.
+        Within each user row, items are ordered by rating then recency (both descending),
+        so a user's top-rated list is simply the head of their row.
+
+        Ratings added later with add_interactions() go into a per-user overlay that
+        every lookup, user- or item-side, reads on top of the arrays; compact() folds
+        the overlay back into the CSR/CSC arrays, e.g. once overlay_size grows.
+        """
+        user_index = np.asarray(user_index, dtype=np.int32)
+        item_index = np.asarray(item_index, dtype=np.int32)
+        ratings = np.asarray(ratings)
+        timestamps = np.asarray(timestamps)
+        self.num_users = num_users
+        self.num_items = num_items
+
+        order = np.lexsort((-timestamps.astype(np.int64), -ratings.astype(np.int16), user_index))
+        self.indptr = _indptr(user_index, num_users)
+        self.indices = item_index[order]
+        self.data = ratings[order]
+        self.timestamps = timestamps[order]
+
+        item_order = np.argsort(item_index, kind='stable')
+        self.item_indptr = _indptr(item_index, num_items)
+        self.item_users = user_index[item_order]
+        self.item_data = ratings[item_order]
+        # user -> full (items, ratings, timestamps) row, replacing the CSR row
+        self._overrides: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        # Row lengths and per-item rater counts with the overlay applied, kept incrementally
+        self._user_counts = np.diff(self.indptr)
+        self._item_counts = np.diff(self.item_indptr)
+
+    @classmethod
+    def from_movielens(cls, data: MovieLensData) -> 'InteractionMatrix':
+        return cls(data.user_index, data.item_index, data.ratings, data.timestamps,
+                   data.num_users, data.num_items)
+
+    @property
+    def overlay_size(self) -> int:
+        """Number of users whose rows currently live in the overlay"""
+        return len(self._overrides)
+
+    @property
+    def nnz(self) -> int:
+        return int(self.user_counts().sum())
+
+    def _row(self, user: int):
+        if user in self._overrides:
+            return self._overrides[user]
+        start, end = self.indptr[user], self.indptr[user + 1]
+        return self.indices[start:end], self.data[start:end], self.timestamps[start:end]
+
+    def user_items(self, user: int) -> np.ndarray:
+        """Items rated by a user (0-based), best rated and most recent first"""
+        return self._row(user)[0]
+
+    def user_ratings(self, user: int) -> np.ndarray:
+        """Ratings aligned with user_items(user)"""
+        return self._row(user)[1]
+
+    def user_timestamps(self, user: int) -> np.ndarray:
+        return self._row(user)[2]
+
+    def top_rated(self, user: int, n: int = 10) -> np.ndarray:
+        """A user's n highest-rated items, ties broken by most recent"""
+        return self.user_items(user)[:n]
+
+    def add_users(self, count: int) -> None:
+        """Grow the matrix by count users with empty rows (indices num_users onwards)"""
+        self.indptr = np.concatenate([self.indptr, np.full(count, self.indptr[-1], dtype=self.indptr.dtype)])
+        self._user_counts = np.concatenate([self._user_counts, np.zeros(count, dtype=self._user_counts.dtype)])
+        self.num_users += count
+
+    def add_interactions(self, user_index, item_index, ratings, timestamps) -> np.ndarray:
+        """
+        Merge new ratings into the affected user rows. A re-rated item keeps only its
+        newest rating. Returns the users whose rows changed.
+        """
+        user_index = np.asarray(user_index, dtype=np.int32)
+        item_index = np.asarray(item_index, dtype=np.int32)
+        ratings = np.asarray(ratings, dtype=self.data.dtype)
+        timestamps = np.asarray(timestamps, dtype=self.timestamps.dtype)
+
+        users = np.unique(user_index)
+        for user in users.tolist():
+            new = user_index == user
+            items, row_ratings, row_timestamps = (
+                np.concatenate([old, fresh]) for old, fresh in zip(
+                    self._row(user), (item_index[new], ratings[new], timestamps[new])))
+            # Newest rating per item wins
+            order = np.lexsort((row_timestamps, items))[::-1]
+            _, keep = np.unique(items[order], return_index=True)
+            keep = order[keep]
+            np.subtract.at(self._item_counts, self._row(user)[0], 1)
+            row = _sorted_row(items[keep], row_ratings[keep], row_timestamps[keep])
+            np.add.at(self._item_counts, row[0], 1)
+            self._overrides[user] = row
+            self._user_counts[user] = len(row[0])
+        return users
+
+    def compact(self) -> None:
+        """Rebuild the CSR/CSC arrays with every pending override folded in"""
+        if not self._overrides:
+            return
+        overridden = np.fromiter(self._overrides, dtype=np.int64, count=len(self._overrides))
+        kept = np.ones(len(self.indices), dtype=bool)
+        kept[_row_positions(self.indptr, overridden)[1]] = False
+        base_users = np.repeat(np.arange(self.num_users, dtype=np.int32), np.diff(self.indptr))
+        rows = [self._overrides[user] for user in overridden.tolist()]
+        user_index = np.concatenate([base_users[kept]] + [np.full(len(row[0]), user, dtype=np.int32)
+                                                         for user, row in zip(overridden.tolist(), rows)])
+        items, ratings, timestamps = (np.concatenate([array[kept]] + [row[field] for row in rows])
+                                      for field, array in enumerate((self.indices, self.data, self.timestamps)))
+        self.__init__(user_index, items, ratings, timestamps, self.num_users, self.num_items)
+
+    def item_raters(self, item: int) -> np.ndarray:
+        """Users who rated an item"""
+        raters = self.item_users[self.item_indptr[item]:self.item_indptr[item + 1]]
+        if not self._overrides:
+            return raters
+        raters = raters[~np.isin(raters, list(self._overrides))]
+        added = [user for user, row in self._overrides.items() if item in row[0]]
+        return np.concatenate([raters, np.asarray(added, dtype=raters.dtype)])
+
+    def user_counts(self) -> np.ndarray:
+        return self._user_counts.copy()
+
+    def item_counts(self) -> np.ndarray:
+        return self._item_counts.copy()
+
+    def users_with_min_ratings(self, min_ratings: int) -> np.ndarray:
+        return np.flatnonzero(self.user_counts() >= min_ratings)
+
+    def seen_mask(self, users) -> np.ndarray:
+        """Bool (len(users) x num_items) matrix of items each user has rated"""
+        users = np.atleast_1d(np.asarray(users, dtype=np.int64))
+        mask = np.zeros((len(users), self.num_items), dtype=bool)
+        owner, positions = _row_positions(self.indptr, users)
+        mask[owner, self.indices[positions]] = True
+        for position, items in self._overridden(users):
+            mask[position, items] = True
+        return mask
+
+    def mask_seen(self, scores: np.ndarray, users, fill: float = -np.inf) -> np.ndarray:
+        """
+        Overwrite, in place, the scores of items each user has already rated.
+        scores: (len(users), num_items), or (num_items,) for a single user.
+        """
+        users = np.atleast_1d(np.asarray(users, dtype=np.int64))
+        owner, positions = _row_positions(self.indptr, users)
+        if scores.ndim == 1:
+            scores[self.indices[positions]] = fill
+        else:
+            scores[owner, self.indices[positions]] = fill
+        for position, items in self._overridden(users):
+            if scores.ndim == 1:
+                scores[items] = fill
+            else:
+                scores[position, items] = fill
+        return scores
+
+    def _overridden(self, users: np.ndarray):
+        """(position in users, items) for users with an override; their CSR rows are a subset"""
+        if not self._overrides:
+            return []
+        return [(position, self._overrides[user][0])
+                for position, user in enumerate(users.tolist()) if user in self._overrides]
@@ -0,0 +1,97 @@
+import re
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+_DOCUMENT_SEPARATOR = "\x00"
+
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    """
+    Regex alternation factored into a prefix trie, e.g. ['fight', 'fear', 'fun'] becomes
+    'f(?:ear|ight|un)'. Each branch prefers the longest continuation, so the pattern
+    matches the longest keyword starting at a position without trying every keyword.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def render(node) -> str:
+        terminal = '' in node
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if terminal:
+            # Optional continuation is greedy, so longer keywords win over this prefix
+            body = '(?:' + body + ')?'
+        return body
+
+    return render(trie)
+
+
+class KeywordMatcher:
+    def __init__(self, vocabularies: Dict[str, Dict[str, List[str]]]):
+        """
+        Compile several keyword vocabularies into one pattern that scans a text once.
+        vocabularies: {category: {label: [keywords]}}, e.g. {'genres': GENRE_KEYWORDS}.
+
+        A label hits when any of its keywords is a substring of the text, exactly like
+        `any(keyword in text for keyword in keywords)`. The pattern is a zero-width
+        lookahead over a trie of all keywords, so it reports the longest keyword
+        starting at every position; shorter keywords that are prefixes of it are folded
+        into the same match, so overlapping keywords are never missed.
+        """
+        self.categories = list(vocabularies)
+        self.labels = {category: list(vocabulary) for category, vocabulary in vocabularies.items()}
+
+        owners = {}  # keyword -> [(category index, label index)]
+        for c, (category, vocabulary) in enumerate(vocabularies.items()):
+            for j, keywords in enumerate(vocabulary.values()):
+                for keyword in keywords:
+                    owners.setdefault(keyword, []).append((c, j))
+
+        self._emits = {
+            keyword: sorted({hit for other in owners if keyword.startswith(other) for hit in owners[other]})
+            for keyword in owners
+        }
+        self._pattern = re.compile("(?=(" + _trie_pattern(owners) + "))")
+
+    def scan(self, text: str) -> Dict[str, List[str]]:
+        """Labels hit in text per category, in vocabulary order"""
+        hits = set()
+        for match in self._pattern.finditer(text):
+            hits.update(self._emits[match.group(1)])
+        return {
+            category: [label for j, label in enumerate(self.labels[category]) if (c, j) in hits]
+            for c, category in enumerate(self.categories)
+        }
+
+    def scan_batch(self, texts: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Scan many texts in one pass over their concatenation.
+        Returns {category: bool matrix (num_texts x num_labels)}.
+        """
+        texts = [str(text).replace(_DOCUMENT_SEPARATOR, " ") for text in texts]
+        hits = {category: np.zeros((len(texts), len(labels)), dtype=bool)
+                for category, labels in self.labels.items()}
+        if not texts:
+            return hits
+
+        # Keywords never contain the separator, so no match spans two documents
+        ends = np.cumsum([len(text) + 1 for text in texts])
+        joined = _DOCUMENT_SEPARATOR.join(texts)
+        matrices = [hits[category] for category in self.categories]
+
+        starts, keywords = [], []
+        for match in self._pattern.finditer(joined):
+            starts.append(match.start())
+            keywords.append(match.group(1))
+        documents = np.searchsorted(ends, starts, side='right')
+        for document, keyword in zip(documents, keywords):
+            for c, j in self._emits[keyword]:
+                matrices[c][document, j] = True
+        return hits
@@ -2,17 +2,71 @@ import requests
 import json
 import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import os
-from typing import Dict, List, Optional
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from model_registry import DEFAULT_MODEL_NAME, get_embedding_model
+from keyword_matcher import KeywordMatcher
+from query_cache import QueryEmbeddingCache, feature_key
+
+GENRE_KEYWORDS = {
+    'action': ['action', 'fight', 'battle', 'adventure', 'mission'],
+    'comedy': ['comedy', 'funny', 'humor', 'laugh', 'joke'],
+    'drama': ['drama', 'emotional', 'relationship', 'family', 'life'],
+    'thriller': ['thriller', 'suspense', 'mystery', 'tension', 'crime'],
+    'sci-fi': ['sci-fi', 'science fiction', 'space', 'future', 'alien'],
+    'romance': ['romance', 'love', 'relationship', 'couple'],
+    'horror': ['horror', 'scary', 'terror', 'fear', 'ghost'],
+    'documentary': ['documentary', 'real', 'true story', 'biography']
+}
+
+THEME_KEYWORDS = {
+    'friendship': ['friend', 'buddy', 'companion'],
+    'love': ['love', 'romance', 'relationship'],
+    'betrayal': ['betray', 'treason', 'deception'],
+    'revenge': ['revenge', 'vengeance', 'retaliation'],
+    'justice': ['justice', 'law', 'court'],
+    'survival': ['survive', 'survival', 'alive'],
+    'identity': ['identity', 'who am i', 'self-discovery'],
+    'technology': ['technology', 'computer', 'AI', 'robot']
+}
+
+TONE_INDICATORS = {
+    'dark': ['dark', 'grim', 'bleak', 'tragic', 'death'],
+    'lighthearted': ['funny', 'happy', 'joy', 'light', 'comedy'],
+    'serious': ['serious', 'dramatic', 'intense', 'emotional'],
+    'suspenseful': ['suspense', 'mystery', 'thriller', 'tension'],
+    'inspirational': ['inspire', 'hope', 'triumph', 'success']
+}
+
+# All vocabularies compiled once; each overview is scanned a single time
+FEATURE_MATCHER = KeywordMatcher({
+    'genres': GENRE_KEYWORDS,
+    'themes': THEME_KEYWORDS,
+    'tone': TONE_INDICATORS
+})
 
 class LLMFeatureExtractor:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    # Bump when extraction or the embedding text changes, so persisted features are recomputed
+    extractor_version = 'keywords-1'
+    
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME):
         """
-        Initialize LLM feature extractor with SentenceTransformer for embeddings
+        Initialize LLM feature extractor with SentenceTransformer for embeddings.
+        The model itself comes from the process-wide registry on first use.
         """
-        self.embedding_model = SentenceTransformer(model_name)
+        self.model_name = model_name
         self.hf_token = os.getenv('HF_API_TOKEN', 'your_huggingface_token_here')
+        # Embeddings depend only on the feature labels, so each combination is encoded once
+        self.feature_embeddings = QueryEmbeddingCache(max_entries=4096)
+    
+    @property
+    def embedding_model(self):
+        """Shared SentenceTransformer instance for this extractor's model name"""
+        return get_embedding_model(self.model_name)
     
     def extract_movie_features(self, overview: str, title: str = "") -> Dict:
         """
@@ -32,14 +86,11 @@ class LLMFeatureExtractor:
         """
         overview_lower = overview.lower()
         
-        # Genre detection
-        genres = self._detect_genres(overview_lower)
-        
-        # Theme extraction
-        themes = self._extract_themes(overview_lower)
-        
-        # Tone analysis
-        tone = self._analyze_tone(overview_lower)
+        # Genre, theme and tone keywords in a single scan
+        hits = FEATURE_MATCHER.scan(overview_lower)
+        genres = hits['genres'] or ['drama']  # Default fallback
+        themes = hits['themes'] or ['human experience']
+        tone = hits['tone'][0] if hits['tone'] else 'neutral'
         
         # Target audience
         audience = self._determine_audience(overview_lower, genres)
@@ -54,59 +105,18 @@ class LLMFeatureExtractor:
     
     def _detect_genres(self, text: str) -> List[str]:
         """Detect genres from text content"""
-        genres = []
-        genre_keywords = {
-            'action': ['action', 'fight', 'battle', 'adventure', 'mission'],
-            'comedy': ['comedy', 'funny', 'humor', 'laugh', 'joke'],
-            'drama': ['drama', 'emotional', 'relationship', 'family', 'life'],
-            'thriller': ['thriller', 'suspense', 'mystery', 'tension', 'crime'],
-            'sci-fi': ['sci-fi', 'science fiction', 'space', 'future', 'alien'],
-            'romance': ['romance', 'love', 'relationship', 'couple'],
-            'horror': ['horror', 'scary', 'terror', 'fear', 'ghost'],
-            'documentary': ['documentary', 'real', 'true story', 'biography']
-        }
-        
-        for genre, keywords in genre_keywords.items():
-            if any(keyword in text for keyword in keywords):
-                genres.append(genre)
-        
+        genres = FEATURE_MATCHER.scan(text)['genres']
         return genres if genres else ['drama']  # Default fallback
     
     def _extract_themes(self, text: str) -> List[str]:
         """Extract themes from text content"""
-        themes = []
-        theme_keywords = {
-            'friendship': ['friend', 'buddy', 'companion'],
-            'love': ['love', 'romance', 'relationship'],
-            'betrayal': ['betray', 'treason', 'deception'],
-            'revenge': ['revenge', 'vengeance', 'retaliation'],
-            'justice': ['justice', 'law', 'court'],
-            'survival': ['survive', 'survival', 'alive'],
-            'identity': ['identity', 'who am i', 'self-discovery'],
-            'technology': ['technology', 'computer', 'AI', 'robot']
-        }
-        
-        for theme, keywords in theme_keywords.items():
-            if any(keyword in text for keyword in keywords):
-                themes.append(theme)
-        
+        themes = FEATURE_MATCHER.scan(text)['themes']
         return themes if themes else ['human experience']
     
     def _analyze_tone(self, text: str) -> str:
         """Analyze the tone of the text"""
-        tone_indicators = {
-            'dark': ['dark', 'grim', 'bleak', 'tragic', 'death'],
-            'lighthearted': ['funny', 'happy', 'joy', 'light', 'comedy'],
-            'serious': ['serious', 'dramatic', 'intense', 'emotional'],
-            'suspenseful': ['suspense', 'mystery', 'thriller', 'tension'],
-            'inspirational': ['inspire', 'hope', 'triumph', 'success']
-        }
-        
-        for tone, indicators in tone_indicators.items():
-            if any(indicator in text for indicator in indicators):
-                return tone
-        
-        return 'neutral'
+        tones = FEATURE_MATCHER.scan(text)['tone']
+        return tones[0] if tones else 'neutral'
     
     def _determine_audience(self, text: str, genres: List[str]) -> str:
         """Determine target audience"""
@@ -130,10 +140,109 @@ class LLMFeatureExtractor:
         }
     
     def generate_embedding(self, features: Dict) -> np.ndarray:
-        """Generate embedding from structured features"""
-        feature_text = self._features_to_text(features)
-        embedding = self.embedding_model.encode(feature_text)
-        return embedding
+        """Generate embedding from structured features, memoized per feature combination"""
+        return self.feature_embeddings.get_or_compute(
+            feature_key(features), lambda: self.embedding_model.encode(self._features_to_text(features)))
+    
+    def extract_features_batch(self, overviews: pd.Series, titles: Optional[pd.Series] = None) -> pd.DataFrame:
+        """
+        Column-wise version of extract_movie_features for a whole catalog.
+        All overviews go through the keyword matcher in one batch scan instead of
+        looping over movies; results match the per-movie path.
+        """
+        overviews = pd.Series(overviews).reset_index(drop=True)
+        if titles is None:
+            titles = pd.Series([""] * len(overviews))
+        titles = pd.Series(titles).reset_index(drop=True).fillna("").astype(str)
+        
+        missing = (overviews.isna() | (overviews == "")).to_numpy()
+        text = overviews.fillna("").astype(str)
+        lower = text.str.lower()
+        
+        hits = FEATURE_MATCHER.scan_batch(lower)
+        genre_names = list(GENRE_KEYWORDS)
+        genre_hits = hits['genres']
+        theme_names = list(THEME_KEYWORDS)
+        theme_hits = hits['themes']
+        tone_names = np.array(list(TONE_INDICATORS) + ['neutral'], dtype=object)
+        tone_hits = hits['tone']
+        
+        # First matching tone wins, as in _analyze_tone
+        tone_index = np.where(tone_hits.any(axis=1), tone_hits.argmax(axis=1), len(tone_names) - 1)
+        tones = tone_names[tone_index]
+        
+        # Audience follows the same precedence as _determine_audience
+        column = {name: j for j, name in enumerate(genre_names)}
+        audience = np.select(
+            [genre_hits[:, column['horror']] | genre_hits[:, column['thriller']],
+             genre_hits[:, column['comedy']],
+             genre_hits[:, column['romance']]],
+            ['adult', 'family', 'teen-adult'],
+            default='general'
+        ).astype(object)
+        
+        genres = [[genre_names[j] for j in np.flatnonzero(row)] or ['drama'] for row in genre_hits]
+        themes = [[theme_names[j] for j in np.flatnonzero(row)] or ['human experience'] for row in theme_hits]
+        processed = text.where(text.str.len() <= 200, text.str[:200] + "...")
+        
+        result = pd.DataFrame({
+            'genres': genres,
+            'themes': themes,
+            'tone': tones,
+            'target_audience': audience,
+            'processed_overview': processed
+        })
+        
+        if missing.any():
+            defaults = [self._get_default_features(title) for title in titles[missing]]
+            result.loc[missing, :] = pd.DataFrame(defaults, index=result.index[missing])
+        return result
+    
+    def generate_embeddings_batch(self, features: pd.DataFrame, batch_size: int = 256) -> np.ndarray:
+        """
+        Encode feature texts for many movies into one float32 matrix.
+        features: DataFrame (or list of dicts) with genres/themes/tone/target_audience
+        """
+        codes, unique = self.encode_feature_combinations(features, batch_size)
+        return unique[codes]
+    
+    def encode_feature_combinations(self, features: pd.DataFrame, batch_size: int = 256,
+                                    known: Optional[Dict] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Encode each distinct feature combination once.
+        Returns (codes, unique): an int32 code per movie and a float32 matrix with one
+        row per distinct combination, so movie i's embedding is unique[codes[i]].
+        known maps feature_key -> embedding for combinations that need no encoding.
+        """
+        known = known or {}
+        if isinstance(features, pd.DataFrame):
+            features = features.to_dict('records')
+        positions = {}
+        distinct = []
+        codes = np.empty(len(features), dtype=np.int32)
+        for i, f in enumerate(features):
+            key = feature_key(f)
+            code = positions.get(key)
+            if code is None:
+                code = positions[key] = len(distinct)
+                distinct.append(f)
+            codes[i] = code
+        
+        if not distinct:
+            dim = self.embedding_model.get_sentence_embedding_dimension()
+            return codes, np.empty((0, dim), dtype=np.float32)
+        
+        pending = [code for code, key in enumerate(positions) if key not in known]
+        encoded = {}
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            batch = self.embedding_model.encode(
+                [self._features_to_text(distinct[code]) for code in chunk], batch_size=batch_size, convert_to_numpy=True
+            )
+            encoded.update(zip(chunk, batch))
+        unique = np.stack([encoded[code] if code in encoded else known[key]
+                           for code, key in enumerate(positions)]).astype(np.float32, copy=False)
+        return codes, unique
     
     def _features_to_text(self, features: Dict) -> str:
         """Convert features to text for embedding generation"""
@@ -141,50 +250,169 @@ class LLMFeatureExtractor:
         themes = ", ".join(features['themes'])
         return f"Genres: {genres}. Themes: {themes}. Tone: {features['tone']}. Audience: {features['target_audience']}"
 
-# Production version with actual LLM API (uncomment when you have API access)
+# Production version with a remote LLM API
+DEFAULT_LLM_API_URL = os.getenv(
+    'LLM_API_URL', "https://api-inference.huggingface.co/models/microsoft/Phi-3.5-mini-instruct"
+)
+# Status codes worth retrying: rate limited, or a transient server/gateway failure
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+PROMPT_TEMPLATE = """
+You are a movie expert. Extract: genre, themes, tone, target_audience from this movie overview.
+Output format: JSON with keys [genres, themes, tone, target_audience]
+
+Movie: {title}
+Overview: {overview}
+
+Output:
 """
+
+class RateLimiter:
+    def __init__(self, rate: float, burst: int = 1):
+        """Token bucket shared by all threads: at most `rate` acquisitions per second"""
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
 class ProductionLLMExtractor(LLMFeatureExtractor):
-    def extract_movie_features(self, overview: str, title: str = "") -> Dict:
-        API_URL = "https://api-inference.huggingface.co/models/microsoft/Phi-3.5-mini-instruct"
-        headers = {"Authorization": f"Bearer {self.hf_token}"}
-        
-        prompt = f"""
-        You are a movie expert. Extract: genre, themes, tone, target_audience from this movie overview.
-        Output format: JSON with keys [genres, themes, tone, target_audience]
-        
-        Movie: {title}
-        Overview: {overview}
-        
-        Output:
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME, api_url: str = DEFAULT_LLM_API_URL,
+                 max_concurrency: int = 8, requests_per_second: Optional[float] = None,
+                 timeout: float = 30.0, connect_timeout: float = 5.0, max_retries: int = 4,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0):
         """
+        Feature extraction through a remote LLM endpoint (Hugging Face inference API format).
+        Each worker thread keeps a pooled requests.Session, so connections are reused.
+        extract_features_batch keeps up to max_concurrency requests in flight, and an
+        optional token bucket caps the rate across threads. Failed requests (connection
+        errors, timeouts, 429 and 5xx) are retried up to max_retries times with exponential
+        backoff and jitter, honouring Retry-After. A movie whose request still fails
+        falls back to the default features.
+        """
+        super().__init__(model_name)
+        self.api_url = api_url
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = RateLimiter(requests_per_second, burst=max_concurrency) if requests_per_second else None
+        self.timeout = (connect_timeout, timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._local = threading.local()
+        self.retries = 0
+        self.failures = 0
+    
+    @property
+    def extractor_version(self) -> str:
+        """Features come from whichever model serves api_url, so the endpoint is part of the version"""
+        return f"llm-api-1:{self.api_url}"
+    
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['Authorization'] = f"Bearer {self.hf_token}"
+            self._local.session = session
+        return session
+    
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+    
+    def _post(self, payload: Dict):
+        """POST with rate limiting and retries; returns the decoded JSON body"""
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            retry_after = None
+            try:
+                response = self._session().post(self.api_url, json=payload, timeout=self.timeout)
+                if response.status_code not in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                    return response.json()
+                retry_after = response.headers.get('Retry-After')
+                error = requests.HTTPError(f"{response.status_code} from {self.api_url}", response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt == self.max_retries:
+                raise error
+            self.retries += 1
+            time.sleep(self._backoff(attempt, retry_after))
+    
+    def extract_movie_features(self, overview: str, title: str = "") -> Dict:
+        if pd.isna(overview) or overview == "":
+            return self._get_default_features(title)
         
         payload = {
-            "inputs": prompt,
+            "inputs": PROMPT_TEMPLATE.format(title=title, overview=overview),
             "parameters": {"max_new_tokens": 200, "temperature": 0.1}
         }
         
         try:
-            response = requests.post(API_URL, headers=headers, json=payload)
-            result = response.json()
+            result = self._post(payload)
             if isinstance(result, list) and len(result) > 0:
                 llm_output = result[0].get('generated_text', '{}')
-                return self._parse_llm_response(llm_output)
+                return self._parse_llm_response(llm_output, overview, title)
         except Exception as e:
+            self.failures += 1
             print(f"LLM API error: {e}")
         
-        return self._get_default_features(title)
+        # Marked so persistent caches do not keep a transient failure
+        return dict(self._get_default_features(title), fallback=True)
+    
+    def extract_features_batch(self, overviews: pd.Series, titles: Optional[pd.Series] = None) -> pd.DataFrame:
+        """Same columns as LLMFeatureExtractor.extract_features_batch, max_concurrency requests at a time"""
+        overviews = pd.Series(overviews).reset_index(drop=True)
+        if titles is None:
+            titles = pd.Series([""] * len(overviews))
+        titles = pd.Series(titles).reset_index(drop=True).fillna("").astype(str)
+        
+        with ThreadPoolExecutor(self.max_concurrency, thread_name_prefix='llm') as pool:
+            features = list(pool.map(self.extract_movie_features, overviews, titles))
+        result = pd.DataFrame(features, columns=['genres', 'themes', 'tone', 'target_audience', 'processed_overview'])
+        result['fallback'] = [f.get('fallback', False) for f in features]
+        return result
     
-    def _parse_llm_response(self, llm_output: str) -> Dict:
-        # Extract JSON from LLM response
+    def _parse_llm_response(self, llm_output: str, overview: str = "", title: str = "") -> Dict:
+        """Features from the JSON object in the generated text, filled in with defaults"""
+        features = self._get_default_features(title)
+        # Find JSON in the response
+        start = llm_output.find('{')
+        end = llm_output.rfind('}') + 1
         try:
-            # Find JSON in the response
-            start = llm_output.find('{')
-            end = llm_output.rfind('}') + 1
-            if start != -1 and end != 0:
-                json_str = llm_output[start:end]
-                return json.loads(json_str)
-        except:
-            pass
-        
-        return self._get_default_features("")
-"""
+            parsed = json.loads(llm_output[start:end]) if start != -1 and end != 0 else {}
+        except ValueError:
+            return features
+        if not isinstance(parsed, dict):
+            return features
+        
+        for key in ('genres', 'themes'):
+            value = parsed.get(key)
+            if isinstance(value, str):
+                value = [value]
+            if value:
+                features[key] = [str(item).lower() for item in value]
+        for key in ('tone', 'target_audience'):
+            if parsed.get(key):
+                features[key] = str(parsed[key]).lower()
+        features['processed_overview'] = overview[:200] + "..." if len(overview) > 200 else overview
+        return features
@@ -0,0 +1,124 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Sequence
+
+from llm_feature_extractor import LLMFeatureExtractor, ProductionLLMExtractor
+
+_OVERVIEW = re.compile(r"Overview: (.*)\n", re.DOTALL)
+# Canned answers come from the keyword extractor, so they look like a real model's
+_extractor = LLMFeatureExtractor()
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for a Hugging Face text-generation endpoint. Every POST gets
+    [{"generated_text": prompt + JSON features}] after the server's latency, or a 503
+    with Retry-After for the configured fraction of requests.
+    """
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this Nagle adds ~40ms per reply
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+            fail = server.rng.random() < server.error_rate
+        if fail:
+            return self._send(503, {'error': 'Model is currently loading'}, {'Retry-After': '0'})
+
+        prompt = json.loads(body or b'{}').get('inputs', '')
+        match = _OVERVIEW.search(prompt)
+        features = _extractor._simulate_llm_processing(match.group(1).split('\n')[0] if match else prompt, '')
+        answer = {key: features[key] for key in ('genres', 'themes', 'tone', 'target_audience')}
+        self._send(200, [{'generated_text': prompt + json.dumps(answer)}])
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port: int = 0, latency_ms: float = 50.0, error_rate: float = 0.0,
+                      seed: int = 0) -> ThreadingHTTPServer:
+    """Serve the stub on a background thread; port 0 picks a free port (see server.server_port)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubLLMHandler)
+    server.daemon_threads = True
+    server.latency = latency_ms / 1000
+    server.error_rate = error_rate
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def benchmark(overviews: Sequence[str], titles: Sequence[str], concurrency_values: Sequence[int],
+              latency_ms: float = 50.0, error_rate: float = 0.0,
+              requests_per_second: Optional[float] = None):
+    """Catalog extraction throughput of ProductionLLMExtractor against the stub at each concurrency"""
+    server = start_stub_server(latency_ms=latency_ms, error_rate=error_rate)
+    url = f"http://127.0.0.1:{server.server_port}/generate"
+    report = []
+    try:
+        for concurrency in concurrency_values:
+            extractor = ProductionLLMExtractor(api_url=url, max_concurrency=concurrency,
+                                               requests_per_second=requests_per_second, backoff_base=0.01)
+            start = time.perf_counter()
+            extractor.extract_features_batch(list(overviews), list(titles))
+            seconds = time.perf_counter() - start
+            report.append({'concurrency': concurrency, 'seconds': seconds,
+                           'movies_per_second': len(overviews) / seconds,
+                           'retries': extractor.retries, 'failures': extractor.failures})
+    finally:
+        server.shutdown()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the remote LLM feature-extraction API")
+    parser.add_argument('--port', type=int, default=8008)
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument('--benchmark', type=int, metavar='N',
+                        help="instead of serving, time extraction of N u.item movies at several concurrencies")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 32])
+    parser.add_argument('--requests-per-second', type=float, default=None)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        from data_processing import load_and_process_data
+        movies_df, _ = load_and_process_data()
+        movies_df = movies_df.head(args.benchmark)
+        report = benchmark(movies_df['overview'], movies_df['title'], args.concurrency,
+                           args.latency_ms, args.error_rate, args.requests_per_second)
+        print(json.dumps(report, indent=2))
+        return
+
+    server = start_stub_server(args.port, args.latency_ms, args.error_rate)
+    print(f"Stub LLM API on http://127.0.0.1:{server.server_port}/ "
+          f"(set LLM_API_URL to use it); Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
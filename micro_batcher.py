@@ -0,0 +1,157 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_STOP = object()
+
+
+class MicroBatchScheduler:
+    def __init__(self, batch_fn: Callable[[List], Sequence], max_batch: int = 32, max_wait_ms: float = 5.0,
+                 name: str = 'micro-batcher'):
+        """
+        Collect concurrent requests into batches for one call of batch_fn.
+        A background thread takes the first waiting request, then keeps collecting for
+        up to max_wait_ms or until max_batch requests are in hand. batch_fn(items) must
+        return one result per item, in order; each result is delivered to the Future
+        returned by submit(). When a batch raises, its items are retried one at a time,
+        so an exception only fails the Future of the item that caused it.
+        """
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.max_queue_depth = 0
+        self.batch_sizes = {}  # batch size -> count
+        self.batch_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((item, future))
+        depth = self._queue.qsize()
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+        return future
+
+    def __call__(self, item, timeout: Optional[float] = None):
+        """Submit one item and wait for its result"""
+        return self.submit(item).result(timeout)
+
+    def close(self) -> None:
+        """Finish the queued requests and stop the batching thread"""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'batches': self.batches,
+                'items': self.items,
+                'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+                'batch_sizes': dict(sorted(self.batch_sizes.items())),
+                'mean_batch_ms': 1000 * self.batch_seconds / self.batches if self.batches else 0.0,
+                'max_batch': self.max_batch,
+                'max_wait_ms': self.max_wait_ms,
+            }
+
+    def _collect(self, first) -> Tuple[List, bool]:
+        """The first request plus whatever arrives before the deadline; flags a stop request"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            entry = self._queue.get()
+            if entry is _STOP:
+                break
+            batch, stopping = self._collect(entry)
+            # Requests whose caller already gave up (e.g. timed out) are dropped here
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+
+            start = time.perf_counter()
+            try:
+                results = self.batch_fn(items)
+            except Exception as error:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(error)
+                else:
+                    self._run_singly(batch)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+                self.batch_seconds += elapsed
+
+
+    def _run_singly(self, batch: List) -> None:
+        """Run each (item, future) of a failed batch on its own"""
+        for item, future in batch:
+            try:
+                result, = self.batch_fn([item])
+            except Exception as error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+def recommendation_batch_fn(recommender) -> Callable[[List], List]:
+    """
+    batch_fn for (query, top_k, alpha) requests against a RAGTwoTowerRecommender:
+    one encoder call for every query in the batch, then one batched scoring pass per
+    distinct alpha. Genres a query excludes are filtered out exactly before scoring, and
+    criteria matches are blended into the same pass. Each result is (row indices,
+    similarity scores, match scores): the hybrid cosine, and the cosine plus the
+    weighted criteria match that the rows are ranked by.
+    """
+    def run(requests: List) -> List:
+        queries = [query for query, _, _ in requests]
+        embeddings = recommender.process_user_queries(queries)
+        criteria = [recommender.query_processor.extract_criteria(query) for query in queries]
+        candidates, bias = recommender.query_constraints(criteria)
+        groups = {}
+        for position, (_, _, alpha) in enumerate(requests):
+            groups.setdefault(float(alpha), []).append(position)
+
+        results = [None] * len(requests)
+        for alpha, positions in groups.items():
+            top_k = max(requests[position][1] for position in positions)
+            indices, scores = recommender.retrieve(embeddings[positions], top_k, alpha,
+                                                   None if candidates is None else candidates[positions],
+                                                   None if bias is None else bias[positions])
+            similarity = recommender.similarity_scores(indices, scores, None if bias is None else bias[positions])
+            for row, position in enumerate(positions):
+                k = requests[position][1]
+                results[position] = (np.asarray(indices[row, :k]), np.asarray(similarity[row, :k]),
+                                     np.asarray(scores[row, :k]))
+        return results
+
+    return run
@@ -0,0 +1,86 @@
+import resource
+import sys
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+def _default_loader(model_name: str):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def _peak_rss_bytes() -> int:
+    """Peak resident set size of this process (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _parameter_bytes(model) -> Optional[int]:
+    """Size of the model weights, when the model exposes torch parameters"""
+    parameters = getattr(model, "parameters", None)
+    if parameters is None:
+        return None
+    try:
+        return int(sum(p.numel() * p.element_size() for p in parameters()))
+    except Exception:
+        return None
+
+
+class EmbeddingModelRegistry:
+    def __init__(self, loader: Callable = _default_loader):
+        """
+        Process-wide cache of embedding models keyed by model name.
+        Each model is loaded once, on first use, and shared by every caller.
+        """
+        self._loader = loader
+        self._models = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str = DEFAULT_MODEL_NAME):
+        """Return the shared model instance, loading it on first use"""
+        model = self._models.get(model_name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            model = self._models.get(model_name)
+            if model is None:
+                rss_before = _peak_rss_bytes()
+                start = time.perf_counter()
+                model = self._loader(model_name)
+                load_seconds = time.perf_counter() - start
+
+                self._stats[model_name] = {
+                    "load_seconds": load_seconds,
+                    "parameter_bytes": _parameter_bytes(model),
+                    "peak_rss_delta_bytes": max(_peak_rss_bytes() - rss_before, 0),
+                }
+                self._models[model_name] = model
+        return model
+
+    def is_loaded(self, model_name: str = DEFAULT_MODEL_NAME) -> bool:
+        return model_name in self._models
+
+    def stats(self) -> Dict[str, Dict]:
+        """Load time and memory figures for every model loaded so far"""
+        return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def unload(self, model_name: str) -> None:
+        """Drop a model so the next get() reloads it"""
+        with self._lock:
+            self._models.pop(model_name, None)
+            self._stats.pop(model_name, None)
+
+
+# Shared by LLMFeatureExtractor, RAGQueryProcessor and RAGTwoTowerRecommender
+registry = EmbeddingModelRegistry()
+
+
+def get_embedding_model(model_name: str = DEFAULT_MODEL_NAME):
+    """Return the process-wide instance of the named embedding model"""
+    return registry.get(model_name)
@@ -0,0 +1,182 @@
+import os
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Column order of the 19 genre flags at the end of each u.item line
+GENRE_NAMES = [
+    'unknown', 'Action', 'Adventure', 'Animation', "Children's", 'Comedy', 'Crime',
+    'Documentary', 'Drama', 'Fantasy', 'Film-Noir', 'Horror', 'Musical', 'Mystery',
+    'Romance', 'Sci-Fi', 'Thriller', 'War', 'Western'
+]
+GENRE_BITS = {name: 1 << bit for bit, name in enumerate(GENRE_NAMES)}
+
+DEFAULT_DATA_DIR = 'data'
+CACHE_VERSION = 1
+
+
+class MovieLensData:
+    def __init__(self, arrays):
+        """
+        Columnar MovieLens ratings and items as typed NumPy arrays.
+
+        Ratings (one entry per line of u.data):
+            user_ids, item_ids (int32), ratings (int8), timestamps (int32),
+            user_index, item_index (int32, 0-based)
+        Items (one entry per line of u.item, sorted by movie id):
+            movie_ids (int32), titles (str), years (int16, 0 when unknown),
+            genre_bits (int32, bit i set for GENRE_NAMES[i])
+        Indexers:
+            index_user_ids[user_index] -> user_id, item_index aligns with the item rows.
+        """
+        self.user_ids = arrays['user_ids']
+        self.item_ids = arrays['item_ids']
+        self.ratings = arrays['ratings']
+        self.timestamps = arrays['timestamps']
+        self.user_index = arrays['user_index']
+        self.item_index = arrays['item_index']
+        self.index_user_ids = arrays['index_user_ids']
+        self.movie_ids = arrays['movie_ids']
+        self.titles = arrays['titles']
+        self.years = arrays['years']
+        self.genre_bits = arrays['genre_bits']
+        # (ids, sorter) for user_to_index, swapped as one value when users are added
+        self._user_lookup = (self.index_user_ids, None)
+
+    @property
+    def num_ratings(self) -> int:
+        return len(self.ratings)
+
+    @property
+    def num_users(self) -> int:
+        return len(self.index_user_ids)
+
+    @property
+    def num_items(self) -> int:
+        return len(self.movie_ids)
+
+    def user_to_index(self, user_ids) -> np.ndarray:
+        """0-based user indices for raw user ids (-1 when unknown)"""
+        index_user_ids, sorter = self._user_lookup
+        return _lookup(index_user_ids, user_ids, sorter)
+
+    def add_users(self, user_ids) -> np.ndarray:
+        """
+        Indices for raw user ids, giving ids not seen before the next free indices
+        (existing indices never move). Ratings arrays are left as loaded.
+        """
+        user_ids = np.asarray(user_ids, dtype=self.index_user_ids.dtype)
+        new = np.unique(user_ids[self.user_to_index(user_ids) < 0])
+        if len(new):
+            index_user_ids = np.concatenate([self.index_user_ids, new])
+            self.index_user_ids = index_user_ids
+            self._user_lookup = (index_user_ids, np.argsort(index_user_ids, kind='stable'))
+        return self.user_to_index(user_ids)
+
+    def item_to_index(self, movie_ids) -> np.ndarray:
+        """0-based item indices for raw movie ids (-1 when unknown)"""
+        return _lookup(self.movie_ids, movie_ids)
+
+    def genre_names(self, item_index: int) -> List[str]:
+        bits = int(self.genre_bits[item_index])
+        return [name for name, bit in GENRE_BITS.items() if bits & bit]
+
+    def genre_mask(self, *genres: str) -> np.ndarray:
+        """Bool mask of items carrying any of the given MovieLens genres"""
+        bits = 0
+        for genre in genres:
+            bits |= GENRE_BITS[genre]
+        return (self.genre_bits & bits) != 0
+
+    def _arrays(self):
+        return {name: getattr(self, name) for name in (
+            'user_ids', 'item_ids', 'ratings', 'timestamps', 'user_index', 'item_index',
+            'index_user_ids', 'movie_ids', 'titles', 'years', 'genre_bits')}
+
+
+def _lookup(sorted_ids: np.ndarray, ids, sorter: Optional[np.ndarray] = None) -> np.ndarray:
+    """Position of each id in an id array (ascending, or ordered by sorter), -1 where absent"""
+    ids = np.asarray(ids)
+    positions = np.searchsorted(sorted_ids, ids, sorter=sorter)
+    positions = np.minimum(positions, max(len(sorted_ids) - 1, 0))
+    if sorter is not None and len(sorter):
+        positions = sorter[positions]
+    found = len(sorted_ids) > 0 and sorted_ids[positions] == ids
+    return np.where(found, positions, -1).astype(np.int32)
+
+
+def _parse_ratings(path: str):
+    frame = pd.read_csv(path, sep='\t', header=None, engine='c',
+                        names=['user_id', 'item_id', 'rating', 'timestamp'],
+                        dtype={'user_id': np.int32, 'item_id': np.int32,
+                               'rating': np.int8, 'timestamp': np.int32})
+    return (frame['user_id'].to_numpy(), frame['item_id'].to_numpy(),
+            frame['rating'].to_numpy(), frame['timestamp'].to_numpy())
+
+
+def _parse_items(path: str):
+    flag_columns = [f'g{i}' for i in range(len(GENRE_NAMES))]
+    frame = pd.read_csv(path, sep='|', header=None, engine='c', encoding='latin-1',
+                        names=['movie_id', 'title', 'release_date', 'video_release_date', 'url'] + flag_columns,
+                        dtype={'movie_id': np.int32, **{column: np.int8 for column in flag_columns}},
+                        keep_default_na=False)
+    flags = frame[flag_columns].to_numpy(dtype=np.int32)
+    genre_bits = flags @ (1 << np.arange(len(GENRE_NAMES), dtype=np.int32))
+    years = frame['title'].str.extract(r'\((\d{4})\)\s*$', expand=False)
+    years = pd.to_numeric(years, errors='coerce').fillna(0).to_numpy(dtype=np.int16)
+    titles = frame['title'].to_numpy(dtype=str)
+    return frame['movie_id'].to_numpy(), titles, years, genre_bits.astype(np.int32)
+
+
+def _build(ratings_path: str, items_path: str) -> MovieLensData:
+    user_ids, item_ids, ratings, timestamps = _parse_ratings(ratings_path)
+    movie_ids, titles, years, genre_bits = _parse_items(items_path)
+
+    # Keep item rows sorted by id so lookups are a binary search
+    order = np.argsort(movie_ids, kind='stable')
+    movie_ids, titles, years, genre_bits = movie_ids[order], titles[order], years[order], genre_bits[order]
+
+    index_user_ids, user_index = np.unique(user_ids, return_inverse=True)
+    item_index = _lookup(movie_ids, item_ids)
+    if (item_index < 0).any():
+        raise ValueError(f"{ratings_path} rates items missing from {items_path}")
+
+    return MovieLensData({
+        'user_ids': user_ids, 'item_ids': item_ids, 'ratings': ratings, 'timestamps': timestamps,
+        'user_index': user_index.astype(np.int32), 'item_index': item_index,
+        'index_user_ids': index_user_ids.astype(np.int32),
+        'movie_ids': movie_ids, 'titles': titles, 'years': years, 'genre_bits': genre_bits,
+    })
+
+
+def _fingerprint(*paths: str) -> np.ndarray:
+    stats = [os.stat(path) for path in paths]
+    return np.array([CACHE_VERSION] + [value for st in stats for value in (st.st_size, st.st_mtime_ns)],
+                    dtype=np.int64)
+
+
+def load_movielens(data_dir: str = DEFAULT_DATA_DIR, cache_path: Optional[str] = None,
+                   use_cache: bool = True) -> MovieLensData:
+    """
+    Load MovieLens 100K (u.data + u.item) from data_dir.
+    The parsed arrays are cached as a binary .npz next to the data; later loads read
+    the cache directly and only re-parse when either source file changes.
+    """
+    ratings_path = os.path.join(data_dir, 'u.data')
+    items_path = os.path.join(data_dir, 'u.item')
+    cache_path = cache_path or os.path.join(data_dir, '.cache', 'movielens.npz')
+    fingerprint = _fingerprint(ratings_path, items_path)
+
+    if use_cache and os.path.exists(cache_path):
+        with np.load(cache_path, allow_pickle=False) as cached:
+            if np.array_equal(cached['fingerprint'], fingerprint):
+                return MovieLensData({name: cached[name] for name in cached.files if name != 'fingerprint'})
+
+    data = _build(ratings_path, items_path)
+    if use_cache:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.tmp.npz"
+        np.savez(tmp_path, fingerprint=fingerprint, **data._arrays())
+        os.replace(tmp_path, cache_path)
+    return data
@@ -0,0 +1,120 @@
+import threading
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from interactions import InteractionMatrix
+from movielens import MovieLensData
+from two_tower_trainer import TwoTowerTrainer
+
+
+def parse_events(lines: Iterable[str]):
+    """Rating events in u.data format ('user_id item_id rating timestamp', tab or space separated)"""
+    rows = [line.split() for line in lines if line.strip()]
+    events = np.array(rows, dtype=np.int64).reshape(-1, 4)
+    return events[:, 0], events[:, 1], events[:, 2], events[:, 3]
+
+
+class OnlineUserUpdater:
+    def __init__(self, movielens: MovieLensData, interactions: InteractionMatrix,
+                 trainer: Optional[TwoTowerTrainer] = None, steps: int = 20,
+                 learning_rate: float = 0.5, l2: float = 0.1, max_overlay: int = 1024):
+        """
+        Fold new ratings into a served model without retraining it.
+
+        Each event batch is merged into the InteractionMatrix overlay, so history and
+        seen-item filtering change immediately. With a trained two-tower model, the
+        vectors of the affected users are then refit in place: a few gradient steps on
+        the full-catalog softmax over each user's positively rated items (ratings of at
+        least the trainer's min_rating, as in training), against the frozen item tower,
+        with an L2 pull (l2) towards the user's current vector. A user the model has
+        never seen gets a new row, started from the mean of their positive items'
+        vectors and then refit the same way; until they rate something positively it
+        holds the mean user vector. Once more than max_overlay users have pending rows,
+        the overlay is compacted into the interaction arrays.
+        """
+        self.movielens = movielens
+        self.interactions = interactions
+        self.trainer = trainer
+        self.steps = steps
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.max_overlay = max_overlay
+        # User rows added online that have not been fit yet
+        self._new_users = set()
+        self._lock = threading.Lock()
+
+    def apply_events(self, user_ids, item_ids, ratings, timestamps) -> Dict:
+        """
+        Apply a batch of (user_id, item_id, rating, timestamp) events.
+        New users are added; events for movies the model has never seen are skipped.
+        """
+        user_ids = np.asarray(user_ids)
+        items = self.movielens.item_to_index(item_ids)
+        known = items >= 0
+
+        with self._lock:
+            new_users = self._add_users(user_ids[known])
+            users = self.movielens.user_to_index(user_ids)
+            updated = self.interactions.add_interactions(
+                users[known], items[known], np.asarray(ratings)[known], np.asarray(timestamps)[known])
+            if self.trainer is not None and len(updated):
+                self.refit_users(updated)
+            if self.interactions.overlay_size > self.max_overlay:
+                self.interactions.compact()
+
+        return {
+            'applied': int(known.sum()),
+            'skipped': int((~known).sum()),
+            'new_users': new_users.tolist(),
+            'updated_users': self.movielens.index_user_ids[updated].tolist(),
+        }
+
+    def _add_users(self, user_ids: np.ndarray) -> np.ndarray:
+        """
+        Give unseen user ids a row everywhere: interactions and user tower first, the id
+        lookup last, so readers never see an index the other tables lack yet.
+        Returns the new ids.
+        """
+        new = np.unique(user_ids[self.movielens.user_to_index(user_ids) < 0])
+        if not len(new):
+            return new
+        self.interactions.add_users(len(new))
+        if self.trainer is not None:
+            # Mean user until refit_users can start them from their positive items
+            mean_user = self.trainer.user_embeddings.mean(axis=0)
+            self.trainer.add_users(np.tile(mean_user, (len(new), 1)))
+            self._new_users.update(range(self.trainer.num_users - len(new), self.trainer.num_users))
+        self.movielens.add_users(new)
+        return new
+
+    def refit_users(self, users: np.ndarray) -> None:
+        """Re-solve the given users' vectors against their current positive items, in place"""
+        users = np.asarray(users, dtype=np.int64)
+        item_table = self.trainer.item_embeddings
+
+        # Mean item vector of each user's positively rated items
+        rows = [self.interactions.user_items(user)[self.trainer.positives(self.interactions.user_ratings(user))]
+                for user in users.tolist()]
+        counts = np.array([len(row) for row in rows])
+        owner = np.repeat(np.arange(len(users)), counts)
+        positive_mean = np.zeros((len(users), item_table.shape[1]), dtype=np.float32)
+        np.add.at(positive_mean, owner, item_table[np.concatenate(rows).astype(np.int64)])
+        positive_mean /= np.maximum(counts, 1)[:, None]
+
+        # Users without positives yet keep their vectors; new users start at their positive mean
+        users, positive_mean = users[counts > 0], positive_mean[counts > 0]
+        fresh = np.isin(users, list(self._new_users))
+        anchor = self.trainer.user_embeddings[users]
+        anchor[fresh] = positive_mean[fresh]
+        self._new_users.difference_update(users[fresh].tolist())
+
+        vectors = anchor.copy()
+        for _ in range(self.steps):
+            logits = vectors @ item_table.T
+            logits -= logits.max(axis=1, keepdims=True)
+            probs = np.exp(logits)
+            probs /= probs.sum(axis=1, keepdims=True)
+            grads = probs @ item_table - positive_mean + self.l2 * (vectors - anchor)
+            vectors -= self.learning_rate * grads
+        self.trainer.user_embeddings[users] = vectors
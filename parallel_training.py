@@ -0,0 +1,219 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from movielens import DEFAULT_DATA_DIR, load_movielens
+from two_tower_trainer import AdamState, TwoTowerTrainer, _sum_rows
+
+MODES = ('hogwild', 'sync')
+
+# Trainer tables that live in shared memory while a parallel fit runs
+_SHARED_TABLES = {
+    'user_embeddings': lambda t: t.user_embeddings,
+    'item_embeddings': lambda t: t.item_embeddings,
+    'user_m': lambda t: t.user_adam.m,
+    'user_v': lambda t: t.user_adam.v,
+    'item_m': lambda t: t.item_adam.m,
+    'item_v': lambda t: t.item_adam.v,
+}
+
+# Per-process state set up by _init_worker
+_worker = {}
+
+
+def _bind_tables(trainer: TwoTowerTrainer, arrays: Dict[str, np.ndarray]) -> None:
+    """Point a trainer's embedding tables and Adam moments at the given arrays"""
+    trainer.user_embeddings = arrays['user_embeddings']
+    trainer.item_embeddings = arrays['item_embeddings']
+    trainer.user_adam.m, trainer.user_adam.v = arrays['user_m'], arrays['user_v']
+    trainer.item_adam.m, trainer.item_adam.v = arrays['item_m'], arrays['item_v']
+
+
+def _attach(specs: Dict[str, tuple]):
+    """Map shared memory blocks created by the parent as float32 arrays"""
+    blocks = {name: SharedMemory(name=shm_name) for name, (shm_name, _) in specs.items()}
+    arrays = {name: np.ndarray(shape, dtype=np.float32, buffer=blocks[name].buf)
+              for name, (_, shape) in specs.items()}
+    return blocks, arrays
+
+
+def _init_worker(specs, config, step, user_index, item_index, seed):
+    blocks, arrays = _attach(specs)
+
+    trainer = TwoTowerTrainer.__new__(TwoTowerTrainer)
+    trainer.__dict__.update(config)
+    trainer.rng = np.random.default_rng([seed, os.getpid()])
+    trainer.user_adam = AdamState((0, 0))
+    trainer.item_adam = AdamState((0, 0))
+    _bind_tables(trainer, arrays)
+
+    _worker.update(blocks=blocks, step=step, trainer=trainer, user_index=user_index, item_index=item_index)
+
+
+def _hogwild_shard(example_ids: np.ndarray) -> List[float]:
+    """
+    Train on a shard of examples, writing sparse Adam updates straight into the shared
+    tables without locks (Hogwild). Rows touched by two workers at once may lose an update;
+    the shared Adam step counter is taken under its lock so every minibatch gets its own.
+    """
+    trainer, step = _worker['trainer'], _worker['step']
+    users, items = _worker['user_index'], _worker['item_index']
+    losses = []
+    for batch in np.array_split(example_ids, max(1, len(example_ids) // trainer.batch_size)):
+        loss, user_update, item_update = trainer.compute_gradients(users[batch], items[batch])
+        with step.get_lock():
+            step.value += 1
+            batch_step = step.value
+        trainer.user_adam.apply(trainer.user_embeddings, *user_update, trainer.learning_rate, batch_step)
+        trainer.item_adam.apply(trainer.item_embeddings, *item_update, trainer.learning_rate, batch_step)
+        losses.append(float(loss))
+    return losses
+
+
+def _sync_gradients(example_ids: np.ndarray):
+    """Gradients for one minibatch against the current shared tables (no update)"""
+    trainer = _worker['trainer']
+    return trainer.compute_gradients(_worker['user_index'][example_ids], _worker['item_index'][example_ids])
+
+
+class ParallelTrainer:
+    def __init__(self, trainer: TwoTowerTrainer, num_workers: Optional[int] = None, mode: str = 'hogwild'):
+        """
+        Data-parallel training of a TwoTowerTrainer over a process pool.
+        The embedding tables and Adam moments are placed in shared memory for the
+        duration of fit(), so workers read and write them without copies.
+
+        mode='hogwild': each worker trains on its own shard of every epoch and applies
+            lock-free sparse updates to the shared tables.
+        mode='sync': each round, every worker computes gradients for one minibatch; the
+            parent averages them and applies a single Adam step.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}', expected one of {MODES}")
+        self.trainer = trainer
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.mode = mode
+
+    def fit(self, user_index, item_index, epochs: int = 1,
+            callback: Optional[Callable[[int, float], None]] = None) -> List[float]:
+        """Train for a number of epochs; returns mean loss per epoch"""
+        trainer = self.trainer
+        user_index = np.asarray(user_index)
+        item_index = np.asarray(item_index)
+
+        blocks, specs = {}, {}
+        step = mp.Value('q', trainer.step)
+        try:
+            for name, get in _SHARED_TABLES.items():
+                source = get(trainer)
+                blocks[name] = SharedMemory(create=True, size=max(source.nbytes, 1))
+                specs[name] = (blocks[name].name, source.shape)
+            shared = {name: np.ndarray(shape, dtype=np.float32, buffer=blocks[name].buf)
+                      for name, (_, shape) in specs.items()}
+            for name, get in _SHARED_TABLES.items():
+                shared[name][...] = get(trainer)
+            _bind_tables(trainer, shared)
+
+            config = {key: value for key, value in trainer.__dict__.items()
+                      if key not in ('rng', 'user_adam', 'item_adam') and key not in _SHARED_TABLES}
+            with mp.Pool(self.num_workers, initializer=_init_worker,
+                         initargs=(specs, config, step, user_index, item_index, trainer.seed)) as pool:
+                history = []
+                for epoch in range(epochs):
+                    order = trainer.rng.permutation(len(user_index))
+                    if self.mode == 'hogwild':
+                        losses = self._hogwild_epoch(pool, order)
+                    else:
+                        losses = self._sync_epoch(pool, order, step)
+                    history.append(float(np.mean(losses)))
+                    if callback is not None:
+                        callback(epoch, history[-1])
+            trainer.step = step.value
+        finally:
+            # Copy results back into private arrays before the shared blocks go away
+            if len(blocks) == len(_SHARED_TABLES):
+                _bind_tables(trainer, {name: np.array(get(trainer)) for name, get in _SHARED_TABLES.items()})
+            for block in blocks.values():
+                block.close()
+                block.unlink()
+        return history
+
+    def _hogwild_epoch(self, pool, order: np.ndarray) -> List[float]:
+        shards = np.array_split(order, self.num_workers)
+        return [loss for losses in pool.map(_hogwild_shard, shards) for loss in losses]
+
+    def _sync_epoch(self, pool, order: np.ndarray, step) -> List[float]:
+        trainer = self.trainer
+        round_size = trainer.batch_size * self.num_workers
+        losses = []
+        for start in range(0, len(order), round_size):
+            batches = [batch for batch in np.array_split(order[start:start + round_size], self.num_workers)
+                       if len(batch)]
+            results = pool.map(_sync_gradients, batches)
+
+            # Average each table's gradients across workers, then take one step
+            user_rows = np.concatenate([r[1][0] for r in results])
+            user_grads = np.concatenate([r[1][1] for r in results]) / len(results)
+            item_rows = np.concatenate([r[2][0] for r in results])
+            item_grads = np.concatenate([r[2][1] for r in results]) / len(results)
+            trainer.step = step.value
+            trainer.apply_gradients(_sum_rows(user_rows, user_grads), _sum_rows(item_rows, item_grads))
+            step.value = trainer.step
+            losses.append(float(np.mean([r[0] for r in results])))
+        return losses
+
+
+def scaling_report(user_index, item_index, num_users: int, num_items: int,
+                   worker_counts: Sequence[int] = (1, 2, 4), mode: str = 'hogwild',
+                   epochs: int = 1, **trainer_params) -> List[Dict]:
+    """
+    Training throughput for each worker count, from the same initial model. Speedups
+    flatten once workers exceed the CPUs the process can use.
+    """
+    report = []
+    baseline = None
+    for num_workers in worker_counts:
+        trainer = TwoTowerTrainer(num_users, num_items, **trainer_params)
+        start = time.perf_counter()
+        history = ParallelTrainer(trainer, num_workers, mode).fit(user_index, item_index, epochs)
+        seconds = time.perf_counter() - start
+
+        throughput = len(user_index) * epochs / seconds
+        baseline = baseline or throughput
+        report.append({'workers': num_workers, 'mode': mode, 'seconds': seconds,
+                       'examples_per_second': throughput, 'speedup': throughput / baseline,
+                       'final_loss': history[-1]})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling report for data-parallel two-tower training")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--mode', choices=MODES, default='hogwild')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--epochs', type=int, default=1)
+    parser.add_argument('--embedding-dim', type=int, default=32)
+    parser.add_argument('--min-rating', type=int, default=4, help="ratings at or above this are positives")
+    args = parser.parse_args()
+
+    data = load_movielens(args.data_dir)
+    # Same positives as two_tower_trainer's CLI, so throughput is measured on the same examples
+    positive = data.ratings >= args.min_rating
+    worker_counts = sorted({1} | {2 ** i for i in range(args.max_workers.bit_length()) if 2 ** i <= args.max_workers}
+                           | {args.max_workers})
+    report = scaling_report(data.user_index[positive], data.item_index[positive], data.num_users, data.num_items,
+                            worker_counts, mode=args.mode, epochs=args.epochs,
+                            embedding_dim=args.embedding_dim, min_rating=args.min_rating)
+    print(json.dumps({'cpu_count': os.cpu_count(), 'usable_cpus': len(os.sched_getaffinity(0))
+                      if hasattr(os, 'sched_getaffinity') else os.cpu_count(),
+                      'num_examples': int(positive.sum()), 'scaling': report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Canonical cache key for free-text queries: lowercased, whitespace collapsed"""
+    return _WHITESPACE.sub(" ", str(query)).strip().lower()
+
+
+def criteria_key(genres, themes, tone) -> tuple:
+    """Canonical cache key for structured search criteria"""
+    return ('criteria', tuple(genres), tuple(themes), tone)
+
+
+def feature_key(features: Dict) -> tuple:
+    """
+    Canonical key for a movie's extracted features: everything its embedding text is
+    built from, with lists turned into tuples. Label order is kept since it is part of the text.
+    """
+    return ('features', tuple(features['genres']), tuple(features['themes']),
+            features['tone'], features['target_audience'])
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_entries: int = 10000, ttl_seconds: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        """
+        Thread-safe LRU cache of query embeddings.
+        Entries are evicted least-recently-used first once max_entries or max_bytes
+        (total array bytes) is exceeded, and expire after ttl_seconds when set.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (embedding, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding)
+        # Cached arrays are shared between callers, so keep them immutable
+        embedding.setflags(write=False)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (embedding, time.monotonic())
+            self._bytes += embedding.nbytes
+            self._evict()
+        return embedding
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        embedding = self.get(key)
+        if embedding is None:
+            embedding = self.put(key, compute())
+        return embedding
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def _expired(self, entry) -> bool:
+        return self.ttl_seconds is not None and time.monotonic() - entry[1] > self.ttl_seconds
+
+    def _remove(self, key: Hashable) -> None:
+        embedding, _ = self._entries.pop(key)
+        self._bytes -= embedding.nbytes
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or
+                                 (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            key, (embedding, _) = self._entries.popitem(last=False)
+            self._bytes -= embedding.nbytes
+            self.evictions += 1
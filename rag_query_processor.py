@@ -1,35 +1,103 @@
+import zlib
 import numpy as np
-from typing import Dict, List
+from typing import Dict, List, Optional
 from llm_feature_extractor import LLMFeatureExtractor
+from query_cache import QueryEmbeddingCache, criteria_key
+from keyword_matcher import KeywordMatcher
+
+# Checked in order; the first intent with a hit wins
+INTENT_KEYWORDS = {
+    'horror': ['scary', 'horror', 'frightening', 'creepy'],
+    'comedy': ['funny', 'comedy', 'laugh', 'humor'],
+    'romance': ['romantic', 'love', 'relationship'],
+    'action': ['action', 'adventure', 'exciting'],
+    'drama': ['thoughtful', 'drama', 'emotional']
+}
+
+QUERY_GENRE_KEYWORDS = {
+    'action': ['action', 'adventure', 'exciting'],
+    'comedy': ['comedy', 'funny', 'humor'],
+    'drama': ['drama', 'emotional', 'serious'],
+    'thriller': ['thriller', 'suspense', 'mystery'],
+    'sci-fi': ['sci-fi', 'science fiction', 'space'],
+    'romance': ['romance', 'love', 'relationship'],
+    'horror': ['horror', 'scary', 'frightening']
+}
+
+EXCLUSION_PHRASES = {
+    'action': ['no superhero', 'not superhero'],
+    'horror': ['no horror', 'not scary'],
+    'romance': ['no romance']
+}
+
+QUERY_THEME_KEYWORDS = {
+    'friendship': ['friend', 'buddy'],
+    'family': ['family', 'parent'],
+    'adventure': ['adventure', 'journey'],
+    'mystery': ['mystery', 'secret'],
+    'coming of age': ['growing up', 'young adult'],
+    'crime': ['crime', 'detective']
+}
+
+# Checked in order; the first tone with a hit wins
+TONE_PREFERENCE_KEYWORDS = {
+    'dark': ['dark', 'gritty', 'serious'],
+    'lighthearted': ['light', 'fun', 'happy'],
+    'suspenseful': ['suspenseful', 'tense']
+}
+
+EXPLANATION_TEMPLATES = (
+    "**{title}** matches your preference for {reasons}.",
+    "Recommended **{title}** because it aligns with your interest in {reasons}.",
+    "Based on your search, **{title}** fits well with {reasons}."
+)
+# Bound once; a movie always gets the same template (crc32 of its title)
+_EXPLANATION_FORMATS = tuple(template.format for template in EXPLANATION_TEMPLATES)
+
+QUERY_MATCHER = KeywordMatcher({
+    'intent': INTENT_KEYWORDS,
+    'genres': QUERY_GENRE_KEYWORDS,
+    'exclusions': EXCLUSION_PHRASES,
+    'themes': QUERY_THEME_KEYWORDS,
+    'tone': TONE_PREFERENCE_KEYWORDS
+})
 
 class RAGQueryProcessor:
-    def __init__(self):
-        self.feature_extractor = LLMFeatureExtractor()
+    def __init__(self, feature_extractor: Optional[LLMFeatureExtractor] = None,
+                 cache: Optional[QueryEmbeddingCache] = None):
+        # Extractors are cheap; the embedding model behind them is shared process-wide
+        self.feature_extractor = feature_extractor or LLMFeatureExtractor()
+        # Search vectors depend only on the structured criteria, so repeats skip the encoder
+        self.cache = cache if cache is not None else QueryEmbeddingCache()
     
     def process_user_query(self, query: str) -> Dict:
         """
         Process natural language user query into structured search criteria
         """
         # Simulate LLM query understanding - replace with actual API call
-        search_criteria = self._simulate_query_understanding(query)
+        search_criteria = self.extract_criteria(query)
+        search_criteria["search_vector"] = self._generate_search_vector(
+            search_criteria["preferred_genres"], search_criteria["preferred_themes"], search_criteria["preferred_tone"]
+        )
         return search_criteria
     
+    def extract_criteria(self, query: str) -> Dict:
+        """process_user_query's criteria without the search vector, so no encoder call"""
+        return self._simulate_query_understanding(query)
+    
     def _simulate_query_understanding(self, query: str) -> Dict:
         """
         Simulate LLM query processing - in production, call actual LLM API
         """
         query_lower = query.lower()
         
-        # Extract intent
-        intent = self._extract_intent(query_lower)
-        
-        # Extract genres
-        preferred_genres = self._extract_genres(query_lower)
-        excluded_genres = self._extract_exclusions(query_lower)
-        
-        # Extract themes and tone
-        preferred_themes = self._extract_themes(query_lower)
-        preferred_tone = self._extract_tone_preference(query_lower)
+        # Intent, genres, exclusions, themes and tone in a single scan
+        hits = QUERY_MATCHER.scan(query_lower)
+        intent = hits['intent'][0] if hits['intent'] else 'general'
+        preferred_genres = hits['genres']
+        excluded_genres = hits['exclusions']
+        preferred_themes = hits['themes']
+        preferred_tone = hits['tone'][0] if hits['tone'] else 'neutral'
         
         return {
             "original_query": query,
@@ -37,100 +105,43 @@ class RAGQueryProcessor:
             "preferred_genres": preferred_genres,
             "excluded_genres": excluded_genres,
             "preferred_themes": preferred_themes,
-            "preferred_tone": preferred_tone,
-            "search_vector": self._generate_search_vector(preferred_genres, preferred_themes, preferred_tone)
+            "preferred_tone": preferred_tone
         }
     
     def _extract_intent(self, query: str) -> str:
         """Extract user's search intent"""
-        if any(word in query for word in ['scary', 'horror', 'frightening', 'creepy']):
-            return 'horror'
-        elif any(word in query for word in ['funny', 'comedy', 'laugh', 'humor']):
-            return 'comedy'
-        elif any(word in query for word in ['romantic', 'love', 'relationship']):
-            return 'romance'
-        elif any(word in query for word in ['action', 'adventure', 'exciting']):
-            return 'action'
-        elif any(word in query for word in ['thoughtful', 'drama', 'emotional']):
-            return 'drama'
-        else:
-            return 'general'
+        intents = QUERY_MATCHER.scan(query)['intent']
+        return intents[0] if intents else 'general'
     
     def _extract_genres(self, query: str) -> List[str]:
         """Extract preferred genres from query"""
-        genres = []
-        genre_map = {
-            'action': ['action', 'adventure', 'exciting'],
-            'comedy': ['comedy', 'funny', 'humor'],
-            'drama': ['drama', 'emotional', 'serious'],
-            'thriller': ['thriller', 'suspense', 'mystery'],
-            'sci-fi': ['sci-fi', 'science fiction', 'space'],
-            'romance': ['romance', 'love', 'relationship'],
-            'horror': ['horror', 'scary', 'frightening']
-        }
-        
-        for genre, keywords in genre_map.items():
-            if any(keyword in query for keyword in keywords):
-                genres.append(genre)
-        
-        return genres
+        return QUERY_MATCHER.scan(query)['genres']
     
     def _extract_exclusions(self, query: str) -> List[str]:
         """Extract genres to exclude"""
-        exclusions = []
-        if 'no superhero' in query or 'not superhero' in query:
-            exclusions.append('action')
-        if 'no horror' in query or 'not scary' in query:
-            exclusions.append('horror')
-        if 'no romance' in query:
-            exclusions.append('romance')
-        
-        return exclusions
+        return QUERY_MATCHER.scan(query)['exclusions']
     
     def _extract_themes(self, query: str) -> List[str]:
         """Extract preferred themes"""
-        themes = []
-        theme_keywords = {
-            'friendship': ['friend', 'buddy'],
-            'family': ['family', 'parent'],
-            'adventure': ['adventure', 'journey'],
-            'mystery': ['mystery', 'secret'],
-            'coming of age': ['growing up', 'young adult'],
-            'crime': ['crime', 'detective']
-        }
-        
-        for theme, keywords in theme_keywords.items():
-            if any(keyword in query for keyword in keywords):
-                themes.append(theme)
-        
-        return themes
+        return QUERY_MATCHER.scan(query)['themes']
     
     def _extract_tone_preference(self, query: str) -> str:
         """Extract tone preference"""
-        if any(word in query for word in ['dark', 'gritty', 'serious']):
-            return 'dark'
-        elif any(word in query for word in ['light', 'fun', 'happy']):
-            return 'lighthearted'
-        elif any(word in query for word in ['suspenseful', 'tense']):
-            return 'suspenseful'
-        else:
-            return 'neutral'
+        tones = QUERY_MATCHER.scan(query)['tone']
+        return tones[0] if tones else 'neutral'
     
     def _generate_search_vector(self, genres: List[str], themes: List[str], tone: str) -> np.ndarray:
         """Generate search vector from structured criteria"""
         search_text = f"Genres: {', '.join(genres)}. Themes: {', '.join(themes)}. Tone: {tone}"
-        return self.feature_extractor.embedding_model.encode(search_text)
+        return self.cache.get_or_compute(
+            criteria_key(genres, themes, tone),
+            lambda: self.feature_extractor.embedding_model.encode(search_text)
+        )
     
     def generate_explanation(self, movie_title: str, user_criteria: Dict, match_reasons: List[str]) -> str:
         """
-        Generate natural language explanation for recommendation
+        Generate natural language explanation for recommendation.
+        The template is picked from the title, so the same movie always reads the same way.
         """
-        reasons_text = ", ".join(match_reasons)
-        
-        explanations = [
-            f"**{movie_title}** matches your preference for {reasons_text}.",
-            f"Recommended **{movie_title}** because it aligns with your interest in {reasons_text}.",
-            f"Based on your search, **{movie_title}** fits well with {reasons_text}."
-        ]
-        
-        return np.random.choice(explanations)
+        template = _EXPLANATION_FORMATS[zlib.crc32(movie_title.encode('utf-8')) % len(_EXPLANATION_FORMATS)]
+        return template(title=movie_title, reasons=", ".join(match_reasons))
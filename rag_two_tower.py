@@ -1,33 +1,353 @@
 # rag_two_tower.py
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from llm_feature_extractor import LLMFeatureExtractor
+from rag_query_processor import RAGQueryProcessor
+from embedding_store import load_catalog_store, save_catalog_store
+from hybrid_scorer import HybridScorer, Tower, normalize_rows
+from ann_index import RetrievalIndex, build_index
+from query_cache import QueryEmbeddingCache, normalize_query
+from attribute_index import AttributeIndex, criteria_filter
+from criteria_scorer import CriteriaScorer
+
+# Weight of the structured criteria match (in [0, 1]) added to the hybrid cosine score
+CRITERIA_WEIGHT = 0.3
+# Biased queries take this many times top_k from the index before re-ranking
+BIAS_OVERFETCH = 4
 
 class RAGTwoTowerRecommender:
-    def __init__(self, enhanced_movies_df):
+    def __init__(self, enhanced_movies_df, feature_extractor=None,
+                 llm_embeddings=None, traditional_embeddings=None, query_cache=None,
+                 criteria_weight=CRITERIA_WEIGHT):
+        """
+        enhanced_movies_df: catalog with llm_embedding/traditional_embedding columns,
+        or catalog metadata only when both embedding matrices are passed directly
+        (e.g. memory-mapped matrices from an embedding store, or Towers scoring a
+        deduplicated store through its codes).
+        criteria_weight: how much genre/theme/tone matches with the query's criteria add
+        to the cosine score when ranking queries; 0 ranks by similarity alone.
+        """
         self.movies_df = enhanced_movies_df
-        self.llm_embeddings = np.array(self.movies_df['llm_embedding'].tolist())
-        self.traditional_embeddings = np.array(self.movies_df['traditional_embedding'].tolist())
+        # Reused across queries so the encoder is never reloaded per request
+        self.feature_extractor = feature_extractor or LLMFeatureExtractor()
+        # Query embeddings keyed on normalized query text
+        self.query_cache = query_cache if query_cache is not None else QueryEmbeddingCache()
+        self.query_processor = RAGQueryProcessor(self.feature_extractor, self.query_cache)
+        if llm_embeddings is None:
+            llm_embeddings = np.array(self.movies_df['llm_embedding'].tolist())
+        if traditional_embeddings is None:
+            traditional_embeddings = np.array(self.movies_df['traditional_embedding'].tolist())
+        self.llm_embeddings = llm_embeddings
+        self.traditional_embeddings = traditional_embeddings
+        # Row norms are computed once here rather than inside every query
+        self.scorer = HybridScorer(self.llm_embeddings, self.traditional_embeddings)
+        # Bitsets over genres, themes and tone for exact filtering before scoring
+        self.attributes = AttributeIndex.from_catalog(self.movies_df)
+        # Multi-hot genre/theme/tone matrix for criteria-aware ranking
+        self.criteria_scorer = CriteriaScorer(self.attributes)
+        self.criteria_weight = criteria_weight
+        # Plain strings, so explanations never touch pandas per request
+        self.titles = [str(title) for title in self.movies_df['title']]
+        # Optional retrieval index over the fused matrix for one alpha
+        self.index = None
+        self.index_alpha = None
+        self.index_overfetch = BIAS_OVERFETCH
+    
+    @classmethod
+    def from_store(cls, store_dir, feature_extractor=None, mmap=True, query_cache=None):
+        """
+        Open a recommender over a catalog saved with save_catalog_store. Raises
+        ValueError when the store was embedded with a different encoder than
+        feature_extractor's, since its vectors would not match query embeddings.
+        """
+        catalog, llm, traditional = load_catalog_store(store_dir, mmap=mmap)
+        feature_extractor = feature_extractor or LLMFeatureExtractor()
+        cls.check_store_encoder(llm.metadata, feature_extractor)
+        return cls(catalog, feature_extractor=feature_extractor,
+                   llm_embeddings=Tower(llm.vectors, llm.codes),
+                   traditional_embeddings=Tower(traditional.vectors, traditional.codes),
+                   query_cache=query_cache)
+    
+    @staticmethod
+    def check_store_encoder(metadata, feature_extractor):
+        """Raise ValueError unless a store header's model_name and dim fit feature_extractor"""
+        model_name = metadata.get('model_name')
+        if model_name is not None and model_name != feature_extractor.model_name:
+            raise ValueError(f"Store was embedded with {model_name}, "
+                             f"the feature extractor uses {feature_extractor.model_name}")
+        dim = feature_extractor.embedding_model.get_sentence_embedding_dimension()
+        if metadata.get('rows') and metadata.get('dim') != dim:
+            raise ValueError(f"Store embeddings have dimension {metadata.get('dim')}, "
+                             f"{feature_extractor.model_name} produces {dim}")
+    
+    def save_store(self, store_dir, metadata=None):
+        """Persist this catalog so later processes can open it with from_store"""
+        catalog = self.movies_df.drop(columns=['llm_embedding', 'traditional_embedding'], errors='ignore').copy()
+        catalog['llm_embedding'] = list(np.asarray(self.scorer.llm.dense(), dtype=np.float32))
+        catalog['traditional_embedding'] = list(np.asarray(self.scorer.traditional.dense(), dtype=np.float32))
+        metadata = dict(metadata or {})
+        metadata.setdefault('model_name', self.feature_extractor.model_name)
+        save_catalog_store(store_dir, catalog, metadata)
+    
+    def build_index(self, backend='ivf', alpha=0.7, overfetch=BIAS_OVERFETCH, **params):
+        """
+        Build a retrieval index over the catalog fused for alpha. Queries with that alpha
+        go through the index unless they carry a candidate mask; any other alpha falls
+        back to exact scoring. Biased queries re-rank overfetch * top_k index results.
+        """
+        self.index = build_index(self.scorer.fused_matrix(alpha), backend=backend, **params)
+        self.index_alpha = float(alpha)
+        self.index_overfetch = overfetch
+        return self.index
+    
+    def save_index(self, path):
+        """Persist the current retrieval index alongside its alpha"""
+        self.index.save(path)
+    
+    def load_index(self, path, alpha=0.7, overfetch=BIAS_OVERFETCH):
+        """Load an index saved with save_index for catalog fused at alpha"""
+        index = RetrievalIndex.load(path)
+        if len(index) != len(self.scorer):
+            raise ValueError(f"Index has {len(index)} rows, catalog has {len(self.scorer)}")
+        self.index = index
+        self.index_alpha = float(alpha)
+        self.index_overfetch = overfetch
+        return index
     
-    def recommend(self, user_query, top_k=10, alpha=0.7):
-        """Hybrid recommendation using both LLM and traditional embeddings"""
+    def candidate_mask(self, search_criteria, filters=None):
+        """
+        Bool mask of catalog rows allowed for these criteria (excluded genres are
+        removed exactly) and an optional attribute_index.Filter; None when every row is.
+        """
+        expression = criteria_filter(search_criteria)
+        if filters is not None:
+            expression = filters if expression is None else expression & filters
+        if expression is None:
+            return None
+        return self.attributes.mask(expression)
+    
+    def query_constraints(self, criteria_list, filters=None, criteria_weight=None):
+        """
+        (candidates, bias) for retrieve, each (len(criteria_list), num_rows): candidate
+        masks from the criteria and filters, None when nothing is filtered, and criteria
+        match scores times criteria_weight (default self.criteria_weight), None when 0.
+        """
+        masks = [self.candidate_mask(criteria, filters) for criteria in criteria_list]
+        candidates = None
+        if any(mask is not None for mask in masks):
+            every_row = np.ones(len(self.attributes), dtype=bool)
+            candidates = np.stack([every_row if mask is None else mask for mask in masks])
+        weight = self.criteria_weight if criteria_weight is None else criteria_weight
+        bias = None
+        if weight and criteria_list:
+            bias = self.criteria_scorer.score(criteria_list)
+            bias *= np.float32(weight)
+        return candidates, bias
+    
+    def retrieve(self, query_embeddings, top_k, alpha, candidates=None, bias=None):
+        """
+        Top-k catalog row indices and scores for one (dim,) or many (n, dim) query
+        embeddings, through the index when it matches alpha. Missing slots are -1.
+        candidates restricts scoring to a bool mask of rows and bias is added to the
+        scores before ranking; both are per query when 2-D. With an index, a biased query
+        over-fetches index_overfetch * top_k rows and re-ranks them with the bias, so a
+        row needs a competitive cosine score to surface; hard candidate masks always
+        fall back to exact scoring.
+        """
+        if self.index is not None and self.index_alpha == float(alpha) and candidates is None:
+            queries = normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+            if bias is None:
+                indices, scores = self.index.search(queries, top_k)
+            else:
+                indices, scores = self._rerank(*self.index.search(queries, top_k * self.index_overfetch),
+                                               np.atleast_2d(bias), top_k)
+            if np.ndim(query_embeddings) == 1:
+                return indices[0], scores[0]
+            return indices, scores
+        # Hard candidate masks, and alphas without an index, are scored exactly
+        if np.ndim(query_embeddings) == 1:
+            return self.scorer.top_k(query_embeddings, top_k=top_k, alpha=alpha,
+                                     candidates=candidates, bias=bias)
+        return self.scorer.top_k_batch(query_embeddings, top_k=top_k, alpha=alpha,
+                                       candidates=candidates, bias=bias)
+    
+    @staticmethod
+    def _rerank(indices, scores, bias, top_k):
+        """Add each row's bias to index results over-fetched for it and keep the best top_k"""
+        found = indices >= 0
+        scores = np.where(found, scores + np.take_along_axis(bias, np.where(found, indices, 0), axis=1),
+                          np.float32(-np.inf)).astype(np.float32)
+        order = np.argsort(-scores, axis=1, kind='stable')[:, :top_k]
+        indices = np.take_along_axis(indices, order, axis=1)
+        scores = np.take_along_axis(scores, order, axis=1)
+        if indices.shape[1] < top_k:
+            pad = top_k - indices.shape[1]
+            indices = np.pad(indices, ((0, 0), (0, pad)), constant_values=-1)
+            scores = np.pad(scores, ((0, 0), (0, pad)), constant_values=-np.inf)
+        return indices, scores
+    
+    def recommend(self, user_query, top_k=10, alpha=0.7, filters=None, criteria_weight=None):
+        """
+        Hybrid recommendation using both LLM and traditional embeddings, boosted by
+        matches with the query's genres, themes and tone. Genres the query excludes,
+        and rows failing filters, are never returned.
+        """
         # Process user query with LLM
         user_llm_embedding = self.process_user_query(user_query)
+        candidates, bias = self._single(self.query_constraints(
+            [self.query_processor.extract_criteria(user_query)], filters, criteria_weight))
+        
+        # Hybrid scoring (as shown in Slide 7): alpha * llm + (1 - alpha) * traditional
+        # cosine similarity, fused into one matmul with partial top-k selection
+        top_indices, _ = self.retrieve(user_llm_embedding, top_k, alpha, candidates, bias)
+        top_indices = top_indices[top_indices >= 0]
         
-        # Calculate similarities
-        llm_similarities = cosine_similarity([user_llm_embedding], self.llm_embeddings)[0]
-        traditional_similarities = cosine_similarity([user_llm_embedding], self.traditional_embeddings)[0]
+        return self.movies_df.iloc[top_indices][['title', 'genres', 'llm_themes', 'llm_tone']]
+    
+    def recommend_from_query(self, user_query, top_k=10, use_llm=True, alpha=0.7, filters=None,
+                             criteria_weight=None, explain=True):
+        """
+        Recommendations plus the structured search criteria for a natural language query.
+        use_llm=False scores with the traditional tower only (alpha = 0); explain=False
+        skips the per-result explanations.
+        Returns (recommendations_df with similarity_score, match_score and explanation,
+        search_criteria). similarity_score is the hybrid cosine similarity; match_score,
+        which ranks the results, adds the weighted criteria match to it.
+        """
+        user_llm_embedding = self.process_user_query(user_query)
+        search_criteria = self.query_processor.process_user_query(user_query)
+        candidates, bias = self._single(self.query_constraints([search_criteria], filters, criteria_weight))
+        top_indices, scores = self.retrieve(user_llm_embedding, top_k, alpha if use_llm else 0.0,
+                                            candidates, bias)
+        return self.results_from_rows(user_query, top_indices, self.similarity_scores(top_indices, scores, bias),
+                                      search_criteria, explain, match_scores=scores)
+    
+    @staticmethod
+    def similarity_scores(top_indices, scores, bias=None):
+        """The cosine part of retrieve's scores: the criteria bias taken back off each returned row"""
+        if bias is None:
+            return scores
+        rows = np.where(top_indices >= 0, top_indices, 0)
+        return np.where(top_indices >= 0, scores - np.take_along_axis(bias, rows, axis=-1), scores)
+    
+    def results_from_rows(self, user_query, top_indices, scores, search_criteria=None, explain=True,
+                          match_scores=None):
+        """
+        recommend_from_query's output for rows already retrieved for user_query,
+        e.g. by a micro-batch. scores become similarity_score and match_scores, when
+        given, match_score. Returns (recommendations_df, search_criteria).
+        explain=False leaves out the explanation column.
+        """
+        if search_criteria is None:
+            search_criteria = self.query_processor.process_user_query(user_query)
+        keep = top_indices >= 0
+        recommendations = self.movies_df.drop(
+            columns=['llm_embedding', 'traditional_embedding'], errors='ignore'
+        ).iloc[top_indices[keep]].copy()
+        recommendations['similarity_score'] = scores[keep]
+        if match_scores is not None:
+            recommendations['match_score'] = match_scores[keep]
+        if explain:
+            recommendations['explanation'] = self.explain(top_indices[keep], search_criteria)
+        return recommendations, search_criteria
+    
+    def explain(self, rows, search_criteria):
+        """
+        Explanations for the given catalog rows (the returned top-k only). Match reasons
+        are read from the attribute bitsets: the same text as match_reasons gives.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        if len(rows) == 0:
+            return []
+        matched = {}
+        for field, values in (('genre', search_criteria['preferred_genres']),
+                              ('theme', search_criteria['preferred_themes'])):
+            matched[field] = [(value, self.attributes.contains(field, value, rows)) for value in values]
+        tone = search_criteria['preferred_tone']
+        tone_hits = (self.attributes.contains('tone', tone, rows) if tone != 'neutral'
+                     else np.zeros(len(rows), dtype=bool))
         
-        # Hybrid scoring (as shown in Slide 7)
-        hybrid_scores = (alpha * llm_similarities + 
-                        (1 - alpha) * traditional_similarities)
+        explanations = []
+        for i, row in enumerate(rows.tolist()):
+            reasons = []
+            genres = [value for value, hits in matched['genre'] if hits[i]]
+            if genres:
+                reasons.append(f"{', '.join(genres)} elements")
+            themes = [value for value, hits in matched['theme'] if hits[i]]
+            if themes:
+                reasons.append(f"{', '.join(themes)} themes")
+            if tone_hits[i]:
+                reasons.append(f"a {tone} tone")
+            explanations.append(self.query_processor.generate_explanation(
+                self.titles[row], search_criteria, reasons or ["your overall search"]))
+        return explanations
+    
+    @staticmethod
+    def _single(constraints):
+        """query_constraints for one query, as the 1-D arrays retrieve expects"""
+        return tuple(None if value is None else value[0] for value in constraints)
+    
+    @staticmethod
+    def match_reasons(movie, search_criteria):
+        """Criteria from the query that this movie's LLM features satisfy"""
+        reasons = []
+        genres = [g for g in search_criteria['preferred_genres'] if g in movie.get('llm_genres', [])]
+        if genres:
+            reasons.append(f"{', '.join(genres)} elements")
+        themes = [t for t in search_criteria['preferred_themes'] if t in movie.get('llm_themes', [])]
+        if themes:
+            reasons.append(f"{', '.join(themes)} themes")
+        tone = search_criteria['preferred_tone']
+        if tone != 'neutral' and movie.get('llm_tone') == tone:
+            reasons.append(f"a {tone} tone")
+        return reasons or ["your overall search"]
+    
+    def score_profile(self, item_rows, alpha=0.7, weights=None):
+        """
+        Hybrid scores for every catalog row against a profile built from catalog rows
+        (e.g. a user's top-rated movies): the weighted mean of their fused vectors.
+        """
+        profile = np.average(self.scorer.fused_rows(item_rows, alpha), axis=0, weights=weights)
+        return self.scorer.score(profile, alpha)
+    
+    def recommend_batch(self, queries, top_k=10, alpha=0.7, filters=None, criteria_weight=None):
+        """
+        Recommend for many queries at once: one encoder call for all queries and one
+        matrix-matrix product for scoring.
+        Returns (movie_ids, scores), both shaped (len(queries), top_k), best first; scores
+        are the ranking (match) scores, cosine plus the weighted criteria match.
+        """
+        query_embeddings = self.process_user_queries(queries)
+        criteria = [self.query_processor.extract_criteria(query) for query in queries]
+        top_indices, scores = self.retrieve(query_embeddings, top_k, alpha,
+                                            *self.query_constraints(criteria, filters, criteria_weight))
+        movie_ids = np.where(top_indices >= 0, self.movies_df['movieId'].to_numpy()[top_indices], -1)
+        return movie_ids, scores
+    
+    def process_user_queries(self, queries):
+        """
+        Convert a list of natural language queries to a (num_queries, dim) matrix.
+        Cached queries are reused; the distinct misses are encoded in one call.
+        """
+        keys = [('query', normalize_query(query)) for query in queries]
+        cached = [self.query_cache.get(key) for key in keys]
         
-        # Get top recommendations
-        top_indices = np.argsort(hybrid_scores)[-top_k:][::-1]
+        missing = list(dict.fromkeys(key for key, hit in zip(keys, cached) if hit is None))
+        if missing:
+            features = self.feature_extractor.extract_features_batch([text for _, text in missing])
+            encoded = self.feature_extractor.generate_embeddings_batch(features, batch_size=len(missing))
+            fresh = {key: self.query_cache.put(key, vector) for key, vector in zip(missing, encoded)}
+            cached = [hit if hit is not None else fresh[key] for key, hit in zip(keys, cached)]
         
-        return self.movies_df.iloc[top_indices][['title', 'genres', 'llm_themes', 'llm_tone']]
+        if not cached:
+            return self.feature_extractor.generate_embeddings_batch([])
+        return np.stack(cached).astype(np.float32, copy=False)
     
     def process_user_query(self, query):
         """Convert user natural language query to embedding"""
-        extractor = LLMFeatureExtractor()
-        features = extractor.extract_movie_features(query)
-        return extractor.generate_embedding(features)
+        text = normalize_query(query)
+        
+        def encode():
+            features = self.feature_extractor.extract_movie_features(text)
+            return self.feature_extractor.generate_embedding(features)
+        
+        return self.query_cache.get_or_compute(('query', text), encode)
@@ -0,0 +1,246 @@
+import json
+import os
+from concurrent.futures import Future
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from data_processing import enhance_movie_data_batch, load_and_process_data
+from embedding_store import catalog_store_exists, store_lock
+from feature_cache import FeatureCache
+from hybrid_scorer import top_k_indices
+from interactions import InteractionMatrix
+from micro_batcher import MicroBatchScheduler, recommendation_batch_fn
+from movielens import DEFAULT_DATA_DIR, load_movielens
+from online_updates import OnlineUserUpdater, parse_events
+from rag_two_tower import RAGTwoTowerRecommender
+from response_builder import ResponseBuilder
+from two_tower_trainer import DEFAULT_CHECKPOINT, TwoTowerTrainer, with_traditional_embeddings
+
+# Enriched catalog is embedded once and then memory-mapped by every worker
+STORE_DIR = os.getenv('EMBEDDING_STORE_DIR', os.path.join('data', 'embedding_store'))
+CHECKPOINT_PATH = os.getenv('TWO_TOWER_CHECKPOINT', DEFAULT_CHECKPOINT)
+
+
+class RecommendationService:
+    def __init__(self, recommender: RAGTwoTowerRecommender, movielens, two_tower: Optional[TwoTowerTrainer] = None,
+                 max_batch: int = 32, max_wait_ms: float = 5.0):
+        """
+        Everything behind the /recommend and /events endpoints, independent of the web
+        framework: the hybrid recommender, the ratings, the optional learned towers,
+        the online updater and the query micro-batcher.
+        """
+        self.recommender = recommender
+        self.movielens = movielens
+        # Ratings indexed by user for history lookups and seen-item filtering
+        self.interactions = InteractionMatrix.from_movielens(movielens)
+        # catalog_rows[item_index] -> row of that item in recommender.movies_df
+        self.catalog_rows = np.full(movielens.num_items, -1, dtype=np.int64)
+        catalog_items = movielens.item_to_index(recommender.movies_df['movieId'].to_numpy())
+        self.catalog_rows[catalog_items[catalog_items >= 0]] = np.flatnonzero(catalog_items >= 0)
+        self.two_tower = two_tower
+        # Per-item JSON fragments, serialized once for every response
+        self.responses = ResponseBuilder(recommender.movies_df)
+        # New ratings are folded into the interactions and user vectors in place
+        self.updater = OnlineUserUpdater(movielens, self.interactions, two_tower)
+        # Concurrent query requests share one encoder call and one scoring pass
+        self.query_batcher = MicroBatchScheduler(recommendation_batch_fn(recommender),
+                                                 max_batch=max_batch, max_wait_ms=max_wait_ms)
+
+    @classmethod
+    def load(cls, store_dir: str = STORE_DIR, checkpoint_path: str = CHECKPOINT_PATH,
+             data_dir: str = DEFAULT_DATA_DIR, max_batch: Optional[int] = None,
+             max_wait_ms: Optional[float] = None, index_backend: Optional[str] = None,
+             n_probe: Optional[int] = None) -> 'RecommendationService':
+        """
+        Open the embedding store (building it on first run), ratings and checkpoint.
+        A store built while a matching checkpoint is present uses its trained item
+        vectors as the traditional tower.
+        index_backend (or RETRIEVAL_INDEX) puts an ann_index backend in front of query
+        scoring for alpha RETRIEVAL_INDEX_ALPHA; unset keeps exact scoring. See IVFIndex
+        for the recall/latency trade-off of 'ivf' and its n_probe (RETRIEVAL_N_PROBE).
+        """
+        print("Initializing Enhanced Two-Tower Recommender with LLM+RAG...")
+        movielens = load_movielens(data_dir)
+
+        # Learned user/item towers, when a checkpoint trained on these ratings is available
+        two_tower = None
+        if os.path.exists(checkpoint_path):
+            two_tower = TwoTowerTrainer.load_checkpoint(checkpoint_path)
+            if not (np.array_equal(two_tower.index_user_ids, movielens.index_user_ids) and
+                    np.array_equal(two_tower.movie_ids, movielens.movie_ids)):
+                print(f"Ignoring {checkpoint_path}: trained on different ratings")
+                two_tower = None
+
+        # One process builds a missing or stale store while other workers wait for it
+        with store_lock(store_dir):
+            recommender = None
+            if catalog_store_exists(store_dir):
+                try:
+                    recommender = RAGTwoTowerRecommender.from_store(store_dir)
+                except ValueError as e:
+                    print(f"Rebuilding embedding store at {store_dir}: {e}")
+            else:
+                print(f"No embedding store at {store_dir}, enriching catalog...")
+            if recommender is None:
+                cls._build_store(store_dir, data_dir, two_tower, checkpoint_path)
+                recommender = RAGTwoTowerRecommender.from_store(store_dir)
+
+        index_backend = index_backend or os.getenv('RETRIEVAL_INDEX')
+        if index_backend:
+            params = {}
+            if index_backend == 'ivf':
+                params['n_probe'] = n_probe or int(os.getenv('RETRIEVAL_N_PROBE', '16'))
+            index = recommender.build_index(index_backend, alpha=float(os.getenv('RETRIEVAL_INDEX_ALPHA', '0.7')),
+                                            **params)
+            print(f"Built {index_backend} retrieval index over {len(index)} items")
+
+        service = cls(recommender, movielens, two_tower,
+                      max_batch=max_batch or int(os.getenv('MICRO_BATCH_SIZE', '32')),
+                      max_wait_ms=max_wait_ms if max_wait_ms is not None
+                      else float(os.getenv('MICRO_BATCH_WAIT_MS', '5')))
+        print("Enhanced recommender ready!")
+        return service
+
+    @staticmethod
+    def _build_store(store_dir: str, data_dir: str, two_tower: Optional[TwoTowerTrainer],
+                     checkpoint_path: str) -> None:
+        """Enrich the catalog and save it to store_dir, with trained item vectors when they fit"""
+        movies_df, _ = load_and_process_data(data_dir)
+        with FeatureCache() as cache:
+            enhanced_movies_df = enhance_movie_data_batch(movies_df, cache=cache)
+        traditional = 'llm'
+        if two_tower is not None:
+            try:
+                enhanced_movies_df = with_traditional_embeddings(enhanced_movies_df, two_tower,
+                                                                 two_tower.movie_ids)
+                traditional = 'two_tower'
+            except ValueError as e:
+                print(f"Not using {checkpoint_path} item vectors: {e}")
+        RAGTwoTowerRecommender(enhanced_movies_df).save_store(store_dir, {'traditional_embedding': traditional})
+
+    def close(self) -> None:
+        self.query_batcher.close()
+
+    def recommend_for_query(self, user_query: str, top_k: int = 10, alpha: float = 0.7,
+                            compact: bool = False, explain: bool = True) -> str:
+        """
+        Enhanced LLM+RAG recommendations for a free-text query, as a JSON body.
+        Explanations are built for the returned rows only; explain=False skips them.
+        """
+        top_indices, scores, match_scores = self.submit_query(user_query, top_k, alpha).result()
+        return self.query_response(user_query, top_indices, scores, match_scores, compact=compact, explain=explain)
+
+    def submit_query(self, user_query: str, top_k: int = 10, alpha: float = 0.7) -> Future:
+        """
+        Queue a query on the micro-batcher; the Future resolves to (row indices,
+        similarity scores, match scores)
+        """
+        return self.query_batcher.submit((user_query, top_k, alpha))
+
+    def query_response(self, user_query: str, top_indices: np.ndarray, scores: np.ndarray,
+                       match_scores: Optional[np.ndarray] = None, compact: bool = False,
+                       explain: bool = True) -> str:
+        """recommend_for_query's JSON body for rows already retrieved by submit_query"""
+        keep = top_indices >= 0
+        rows, scores = top_indices[keep], scores[keep]
+        if match_scores is not None:
+            match_scores = match_scores[keep]
+        search_criteria = self.recommender.query_processor.extract_criteria(user_query)
+        if compact:
+            return self.responses.query_response(user_query, search_criteria, rows, scores,
+                                                 match_scores=match_scores, compact=True)
+
+        explanations = self.recommender.explain(rows, search_criteria) if explain else None
+        return self.responses.query_response(user_query, search_criteria, rows, scores, explanations,
+                                             match_scores=match_scores)
+
+    def recommend_for_user(self, user_id: int, top_k: int = 10, alpha: float = 0.7,
+                           compact: bool = False) -> Optional[str]:
+        """
+        Two-tower recommendations for a user, excluding seen items, as a JSON body. Without
+        a trained checkpoint, falls back to content similarity with the user's top-rated movies.
+        """
+        user = int(self.movielens.user_to_index([user_id])[0])
+        if user < 0:
+            return None
+
+        history = self.interactions.top_rated(user, 10)
+        history_rows = self.catalog_rows[history]
+
+        # Scores in item_index order so already-rated items can be masked in one pass
+        if self.two_tower is not None:
+            item_scores = self.two_tower.score_users([user])[0]
+            item_scores[self.catalog_rows < 0] = -np.inf
+        else:
+            scores = self.recommender.score_profile(history_rows[history_rows >= 0], alpha=alpha)
+            item_scores = np.where(self.catalog_rows >= 0, scores[self.catalog_rows], -np.inf)
+        self.interactions.mask_seen(item_scores, [user])
+        top_items = top_k_indices(item_scores, top_k)
+        top_items = top_items[np.isfinite(item_scores[top_items])]
+
+        ratings = self.interactions.user_ratings(user)[:len(history_rows)]
+        return self.responses.user_response(
+            user_id, history_rows[history_rows >= 0], ratings[history_rows >= 0],
+            self.catalog_rows[top_items], item_scores[top_items],
+            'two_tower' if self.two_tower is not None else 'user', compact=compact)
+
+    def handle_recommend(self, data: Optional[Dict]) -> str:
+        """
+        The /recommend contract: a query or a user_id in, a JSON body with recommendations
+        or an error out. 'compact': true in the request returns movie ids and scores only,
+        and 'explain': false leaves the explanations out of query results.
+        """
+        try:
+            request = self.parse_recommend(data)
+            if 'query' in request:
+                return self.recommend_for_query(request['query'], compact=request['compact'],
+                                                explain=request['explain'])
+            result = self.recommend_for_user(request['user_id'], compact=request['compact'])
+            if result is None:
+                return json.dumps({'error': f"Unknown user {request['user_id']}"})
+            return result
+        except Exception as e:
+            return json.dumps({'error': str(e)})
+
+    @staticmethod
+    def parse_recommend(data) -> Dict:
+        """
+        A validated /recommend request: {'query': str} or {'user_id': int}, plus
+        'compact' and 'explain', which must be JSON booleans ("false" is rejected, not
+        read as true). Raises ValueError with the error to return otherwise.
+        """
+        if not isinstance(data, dict):
+            raise ValueError('Request body must be a JSON object')
+        request = {}
+        for flag, default in (('compact', False), ('explain', True)):
+            value = data.get(flag, default)
+            if not isinstance(value, bool):
+                raise ValueError(f"'{flag}' must be true or false")
+            request[flag] = value
+        if 'query' in data:
+            if not isinstance(data['query'], str):
+                raise ValueError("'query' must be a string")
+            request['query'] = data['query']
+        elif 'user_id' in data:
+            request['user_id'] = int(data['user_id'])
+        else:
+            raise ValueError("Request needs a 'query' or a 'user_id'")
+        return request
+
+    def handle_events(self, data: Optional[Dict] = None, text: str = '') -> Dict:
+        """
+        Ingest new ratings, either as JSON {'events': [[user_id, item_id, rating, timestamp], ...]}
+        or as text in u.data format.
+        """
+        try:
+            if data is not None:
+                lines: Iterable[str] = [' '.join(str(value) for value in event) for event in data.get('events', [])]
+            else:
+                lines = text.splitlines()
+            return self.updater.apply_events(*parse_events(lines))
+        except Exception as e:
+            return {'error': str(e)}
+
+    def metrics(self) -> Dict:
+        return {'query_batcher': self.query_batcher.stats()}
@@ -0,0 +1,90 @@
+import json
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+_encode = json.JSONEncoder(ensure_ascii=False).encode
+
+
+def _as_list(value) -> List:
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [str(item) for item in value]
+    return []
+
+
+class ResponseBuilder:
+    def __init__(self, movies_df):
+        """
+        JSON responses stitched from row indices and scores.
+        Each catalog row's metadata (title, genres, themes, tone, year) is serialized
+        once here; a response only formats the scores, per-request fields and the joins,
+        with no per-row pandas objects.
+        """
+        self.movie_ids = movies_df['movieId'].to_numpy()
+        self.titles = [str(title) for title in movies_df['title']]
+        self.genres = [_as_list(value) for value in movies_df.get('llm_genres', [None] * len(movies_df))]
+        self.themes = [_as_list(value) for value in movies_df.get('llm_themes', [None] * len(movies_df))]
+        self.tones = [str(value) if isinstance(value, str) else '' for value in
+                      movies_df.get('llm_tone', [''] * len(movies_df))]
+        years = movies_df['year'] if 'year' in movies_df else [0] * len(movies_df)
+        self.years = [int(year) if year == year and year else '' for year in years]
+        # '"title": ..., "genres": [...], "themes": [...], "tone": ..., "year": ...' per row
+        self.fragments = [
+            _encode({'title': title, 'genres': genres, 'themes': themes, 'tone': tone, 'year': year})[1:-1]
+            for title, genres, themes, tone, year in zip(self.titles, self.genres, self.themes, self.tones, self.years)
+        ]
+
+    def __len__(self):
+        return len(self.fragments)
+
+    def items(self, rows: Sequence[int], extra: Optional[Dict[str, Sequence]] = None) -> str:
+        """JSON array of item objects for rows, each with the per-row extra fields"""
+        extra = extra or {}
+        names = [_encode(name) for name in extra]
+        columns = [[_encode(value.item() if isinstance(value, np.generic) else value) for value in values]
+                   for values in extra.values()]
+        objects = []
+        for i, row in enumerate(rows):
+            fields = ''.join(f', {name}: {column[i]}' for name, column in zip(names, columns))
+            objects.append('{' + self.fragments[row] + fields + '}')
+        return '[' + ', '.join(objects) + ']'
+
+    def ids_and_scores(self, rows: Sequence[int], scores: Sequence[float],
+                       match_scores: Optional[Sequence[float]] = None) -> str:
+        """Compact '"ids": [...], "scores": [...]' body fragment, plus "match_scores" when given"""
+        fragment = (f'"ids": {_encode(self.movie_ids[np.asarray(rows, dtype=np.int64)].tolist())}, '
+                    f'"scores": {_encode(np.asarray(scores, dtype=float).tolist())}')
+        if match_scores is not None:
+            fragment += f', "match_scores": {_encode(np.asarray(match_scores, dtype=float).tolist())}'
+        return fragment
+
+    def query_response(self, user_query: str, search_criteria: Dict, rows, scores,
+                       explanations: Optional[Sequence[str]] = None, compact: bool = False,
+                       match_scores=None) -> str:
+        """
+        The /recommend body for a query; compact=True returns movie ids and scores only.
+        score is the cosine similarity; match_score, when given, is the ranking score
+        with the criteria match blended in. Items carry an explanation field only when
+        explanations are given.
+        """
+        head = f'{{"query": {_encode(user_query)}, '
+        if compact:
+            return head + self.ids_and_scores(rows, scores, match_scores) + ', "type": "enhanced"}'
+        criteria = {k: v for k, v in search_criteria.items() if k != 'search_vector'}
+        extra = {'score': np.asarray(scores, dtype=float).tolist()}
+        if match_scores is not None:
+            extra['match_score'] = np.asarray(match_scores, dtype=float).tolist()
+        if explanations is not None:
+            extra['explanation'] = list(explanations)
+        items = self.items(rows, extra)
+        return head + f'"search_criteria": {_encode(criteria)}, "recommendations": {items}, "type": "enhanced"}}'
+
+    def user_response(self, user_id: int, history_rows, history_ratings, rows, scores, kind: str,
+                      compact: bool = False) -> str:
+        """The /recommend body for a user_id; compact=True returns movie ids and scores only"""
+        head = f'{{"user_id": {int(user_id)}, '
+        if compact:
+            return head + self.ids_and_scores(rows, scores) + f', "type": {_encode(kind)}}}'
+        history = self.items(history_rows, {'rating': [int(rating) for rating in history_ratings]})
+        items = self.items(rows, {'score': np.asarray(scores, dtype=float).tolist()})
+        return head + f'"history": {history}, "recommendations": {items}, "type": {_encode(kind)}}}'
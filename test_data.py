@@ -0,0 +1,217 @@
+import os
+
+import numpy as np
+import pytest
+
+from evaluation_metrics import RecSysEvaluator
+from interactions import InteractionMatrix
+from movielens import GENRE_NAMES, load_movielens
+from online_updates import OnlineUserUpdater
+from two_tower_trainer import TwoTowerTrainer
+
+NUM_USERS, NUM_ITEMS, NUM_RATINGS = 60, 40, 900
+
+
+def _ratings(seed=0):
+    """Distinct (user id, item id) pairs with unique timestamps; ids are 1-based as in u.data"""
+    rng = np.random.default_rng(seed)
+    pairs = rng.choice(NUM_USERS * NUM_ITEMS, NUM_RATINGS, replace=False)
+    users, items = np.divmod(pairs, NUM_ITEMS)
+    ratings = rng.integers(1, 6, NUM_RATINGS)
+    timestamps = 880000000 + rng.permutation(NUM_RATINGS)
+    return users + 1, items + 1, ratings, timestamps
+
+
+def _write_movielens(data_dir, ratings):
+    os.makedirs(data_dir, exist_ok=True)
+    with open(os.path.join(data_dir, 'u.data'), 'w') as f:
+        for row in zip(*ratings):
+            f.write('\t'.join(str(value) for value in row) + '\n')
+    with open(os.path.join(data_dir, 'u.item'), 'w', encoding='latin-1') as f:
+        for movie_id in range(NUM_ITEMS, 0, -1):
+            flags = ['1' if bit == movie_id % len(GENRE_NAMES) else '0' for bit in range(len(GENRE_NAMES))]
+            f.write(f"{movie_id}|Movie {movie_id} ({1980 + movie_id % 20})|01-Jan-1990||http://x|"
+                    + '|'.join(flags) + '\n')
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    path = str(tmp_path / 'ml')
+    _write_movielens(path, _ratings())
+    return path
+
+
+def _rebuilt(user_index, item_index, ratings, timestamps, num_users):
+    """InteractionMatrix built from scratch, keeping only the newest rating per (user, item)"""
+    order = np.lexsort((timestamps, item_index, user_index))[::-1]
+    _, keep = np.unique(np.stack([user_index[order], item_index[order]]), axis=1, return_index=True)
+    keep = order[keep]
+    return InteractionMatrix(user_index[keep], item_index[keep], ratings[keep], timestamps[keep],
+                             num_users, NUM_ITEMS)
+
+
+def _assert_same_interactions(actual, expected):
+    assert actual.num_users == expected.num_users
+    np.testing.assert_array_equal(actual.user_counts(), expected.user_counts())
+    np.testing.assert_array_equal(actual.item_counts(), expected.item_counts())
+    for user in range(expected.num_users):
+        np.testing.assert_array_equal(actual.user_items(user), expected.user_items(user))
+        np.testing.assert_array_equal(actual.user_ratings(user), expected.user_ratings(user))
+    for item in range(NUM_ITEMS):
+        np.testing.assert_array_equal(np.sort(actual.item_raters(item)), np.sort(expected.item_raters(item)))
+    users = np.arange(expected.num_users)
+    np.testing.assert_array_equal(actual.seen_mask(users), expected.seen_mask(users))
+
+
+def test_movielens_parses_and_caches(data_dir):
+    data = load_movielens(data_dir)
+    user_ids, item_ids, ratings, _ = _ratings()
+    assert data.num_ratings == NUM_RATINGS
+    assert data.num_users == len(np.unique(user_ids))
+    np.testing.assert_array_equal(data.movie_ids, np.arange(1, NUM_ITEMS + 1))
+    np.testing.assert_array_equal(data.index_user_ids[data.user_index], user_ids)
+    np.testing.assert_array_equal(data.movie_ids[data.item_index], item_ids)
+    np.testing.assert_array_equal(data.ratings, ratings)
+    assert data.years[0] == 1981
+    assert data.genre_names(0) == [GENRE_NAMES[1]]
+    np.testing.assert_array_equal(data.item_to_index([3, 999]), [2, -1])
+
+    cached = load_movielens(data_dir)
+    assert os.path.exists(os.path.join(data_dir, '.cache', 'movielens.npz'))
+    np.testing.assert_array_equal(cached.user_index, data.user_index)
+
+    # Changing the ratings invalidates the cache
+    user_ids, item_ids, ratings, timestamps = _ratings()
+    _write_movielens(data_dir, (user_ids[:-1], item_ids[:-1], ratings[:-1], timestamps[:-1]))
+    assert load_movielens(data_dir).num_ratings == NUM_RATINGS - 1
+
+
+def test_movielens_add_users_keeps_existing_indices(data_dir):
+    data = load_movielens(data_dir)
+    before = data.user_to_index(data.index_user_ids)
+    indices = data.add_users([5000, 1, 4000, 5000])
+    assert indices[1] == data.user_to_index([1])[0]
+    assert sorted(indices[[0, 2]]) == [NUM_USERS, NUM_USERS + 1]
+    assert indices[0] == indices[3]
+    np.testing.assert_array_equal(data.user_to_index(data.index_user_ids[:NUM_USERS]), before)
+    assert data.user_to_index([6000])[0] == -1
+
+
+def test_interaction_overlay_matches_rebuild_before_and_after_compact():
+    user_ids, item_ids, ratings, timestamps = _ratings()
+    base = InteractionMatrix(user_ids - 1, item_ids - 1, ratings, timestamps, NUM_USERS, NUM_ITEMS)
+
+    rng = np.random.default_rng(1)
+    count = 200
+    new_users = rng.integers(0, NUM_USERS + 3, count)   # includes three users added below
+    new_items = rng.integers(0, NUM_ITEMS, count)
+    new_ratings = rng.integers(1, 6, count)
+    new_timestamps = 990000000 + rng.permutation(count)  # newer than every base rating
+    base.add_users(3)
+    base.add_interactions(new_users, new_items, new_ratings, new_timestamps)
+    assert base.overlay_size == len(np.unique(new_users))
+
+    expected = _rebuilt(np.concatenate([user_ids - 1, new_users]), np.concatenate([item_ids - 1, new_items]),
+                        np.concatenate([ratings, new_ratings]), np.concatenate([timestamps, new_timestamps]),
+                        NUM_USERS + 3)
+    _assert_same_interactions(base, expected)
+    base.compact()
+    assert base.overlay_size == 0
+    _assert_same_interactions(base, expected)
+
+
+def test_two_tower_learns_planted_groups(tmp_path):
+    # Even users only rate even items and odd users odd items
+    rng = np.random.default_rng(0)
+    users = rng.integers(0, NUM_USERS, 4000)
+    items = 2 * rng.integers(0, NUM_ITEMS // 2, 4000) + users % 2
+    trainer = TwoTowerTrainer(NUM_USERS, NUM_ITEMS, embedding_dim=8, learning_rate=0.05, batch_size=64,
+                              min_rating=4)
+    history = trainer.fit(users, items, epochs=5)
+    assert history[-1] < history[0]
+
+    scores = trainer.score_users(np.arange(NUM_USERS))
+    same_parity = (np.arange(NUM_USERS)[:, None] % 2) == (np.arange(NUM_ITEMS)[None, :] % 2)
+    best_same = np.where(same_parity, scores, -np.inf).max(axis=1)
+    best_other = np.where(same_parity, -np.inf, scores).max(axis=1)
+    assert (best_same > best_other).all()
+
+    path = str(tmp_path / 'two_tower.npz')
+    trainer.save_checkpoint(path, index_user_ids=np.arange(NUM_USERS) + 1, movie_ids=np.arange(NUM_ITEMS) + 1)
+    loaded = TwoTowerTrainer.load_checkpoint(path)
+    assert loaded.config() == trainer.config()
+    assert loaded.step == trainer.step
+    np.testing.assert_array_equal(loaded.user_embeddings, trainer.user_embeddings)
+    np.testing.assert_array_equal(loaded.item_adam.v, trainer.item_adam.v)
+    np.testing.assert_array_equal(loaded.positives([3, 4, 5]), [False, True, True])
+
+
+@pytest.fixture
+def online(data_dir):
+    data = load_movielens(data_dir)
+    interactions = InteractionMatrix.from_movielens(data)
+    trainer = TwoTowerTrainer(data.num_users, data.num_items, embedding_dim=8, min_rating=4)
+    positive = trainer.positives(data.ratings)
+    trainer.fit(data.user_index[positive], data.item_index[positive], epochs=2)
+    return data, interactions, trainer
+
+
+def test_online_update_adds_new_user(online):
+    data, interactions, trainer = online
+    updater = OnlineUserUpdater(data, interactions, trainer)
+    mean_user = trainer.user_embeddings.mean(axis=0)
+    liked = [2, 4, 6]
+
+    result = updater.apply_events([7001, 7001, 7001, 7002, 7001], liked + [2, 99999],
+                                  [5, 5, 4, 1, 5], [1, 2, 3, 4, 5])
+    assert result['applied'] == 4 and result['skipped'] == 1
+    assert result['new_users'] == [7001, 7002]
+
+    new_user, low_user = data.user_to_index([7001, 7002])
+    assert (new_user, low_user) == (NUM_USERS, NUM_USERS + 1)
+    assert trainer.num_users == interactions.num_users == NUM_USERS + 2
+    np.testing.assert_array_equal(np.sort(interactions.user_items(new_user)), data.item_to_index(liked))
+    assert new_user in interactions.item_raters(data.item_to_index([2])[0])
+
+    # A user with positives is refit towards their items; one without holds the mean user
+    vector = trainer.user_embeddings[new_user]
+    assert np.linalg.norm(vector) > 0
+    scores = trainer.item_embeddings @ vector
+    assert scores[data.item_to_index(liked)].mean() > np.median(scores)
+    np.testing.assert_allclose(trainer.user_embeddings[low_user], mean_user, atol=1e-6)
+
+
+def test_online_update_compacts_past_max_overlay(online):
+    data, interactions, trainer = online
+    updater = OnlineUserUpdater(data, interactions, trainer, max_overlay=2)
+    updater.apply_events([1, 2], [1, 2], [5, 5], [1, 2])
+    assert interactions.overlay_size == 2
+    updater.apply_events([3], [3], [5], [3])
+    assert interactions.overlay_size == 0
+    user = data.user_to_index([3])[0]
+    assert data.item_to_index([3])[0] in interactions.user_items(user)
+
+
+def test_evaluate_batch_matches_per_user_metrics():
+    rng = np.random.default_rng(0)
+    num_users, depth, ks = 50, 12, (1, 5, 10, 20)
+    recommendations = np.stack([rng.choice(100, depth, replace=False) for _ in range(num_users)])
+    recommendations[::7, 9:] = -1  # short lists
+    ground_truth = [rng.choice(100, rng.integers(0, 15), replace=False).tolist() for _ in range(num_users)]
+    evaluator = RecSysEvaluator(dict(enumerate(ground_truth)))
+
+    per_user = evaluator.evaluate_batch(recommendations, ground_truth, ks=ks, per_user=True)
+    means = evaluator.evaluate_batch(recommendations, ground_truth, ks=ks)
+    for k in ks:
+        for user, (recs, truth) in enumerate(zip(recommendations.tolist(), ground_truth)):
+            recs = [item for item in recs if item >= 0]
+            expected = evaluator.evaluate_all(recs, truth, k)
+            for name, value in expected.items():
+                assert per_user[name][user] == pytest.approx(value)
+            hits = [item in truth for item in recs[:k]]
+            assert per_user[f'hit_rate@{k}'][user] == float(any(hits))
+            assert per_user[f'mrr@{k}'][user] == pytest.approx(1 / (hits.index(True) + 1) if any(hits) else 0.0)
+            precisions = [sum(hits[:i + 1]) / (i + 1) for i, hit in enumerate(hits) if hit]
+            assert per_user[f'map@{k}'][user] == pytest.approx(
+                sum(precisions) / min(len(truth), k) if truth else 0.0)
+        assert means[f'ndcg@{k}'] == pytest.approx(per_user[f'ndcg@{k}'].mean())
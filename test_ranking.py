@@ -0,0 +1,211 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ann_index import ExactIndex, IVFIndex, RetrievalIndex, build_index, recall_report
+from attribute_index import AttributeIndex, all_rows, any_of, criteria_filter, term
+from criteria_scorer import EXCLUSION_PENALTY, GENRE_WEIGHT, THEME_WEIGHT, TONE_WEIGHT, CriteriaScorer
+from hybrid_scorer import normalize_rows
+from keyword_matcher import KeywordMatcher
+from llm_feature_extractor import GENRE_KEYWORDS, THEME_KEYWORDS, TONE_INDICATORS
+from rag_query_processor import (EXCLUSION_PHRASES, INTENT_KEYWORDS, QUERY_GENRE_KEYWORDS, QUERY_THEME_KEYWORDS,
+                                 TONE_PREFERENCE_KEYWORDS)
+from response_builder import ResponseBuilder
+
+GENRES = ['comedy', 'drama', 'horror', 'romance', 'sci-fi']
+THEMES = ['love', 'war', 'family', 'revenge']
+TONES = ['light', 'dark', 'serious']
+
+
+def _baseline_scan(vocabularies, text):
+    """The per-keyword substring test KeywordMatcher replaces"""
+    return {category: [label for label, keywords in vocabulary.items() if any(k in text for k in keywords)]
+            for category, vocabulary in vocabularies.items()}
+
+
+def _texts(vocabularies, count=200, seed=0):
+    """Texts stitched from keywords, keyword fragments and filler, so keywords overlap and abut"""
+    rng = np.random.default_rng(seed)
+    keywords = sorted({k for vocabulary in vocabularies.values() for ks in vocabulary.values() for k in ks})
+    filler = ['the', 'a', ' ', 'of', 'xy', '-', 'ing', 's']
+    texts = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.integers(0, 12)):
+            word = keywords[rng.integers(len(keywords))]
+            choice = rng.random()
+            if choice < 0.2:
+                word = word[:rng.integers(1, len(word) + 1)]
+            elif choice < 0.4:
+                word = filler[rng.integers(len(filler))]
+            parts.append(word)
+        texts.append((' ' if rng.random() < 0.5 else '').join(parts))
+    return texts
+
+
+@pytest.mark.parametrize('vocabularies', [
+    {'genres': GENRE_KEYWORDS, 'themes': THEME_KEYWORDS, 'tone': TONE_INDICATORS},
+    {'intent': INTENT_KEYWORDS, 'genres': QUERY_GENRE_KEYWORDS, 'exclusions': EXCLUSION_PHRASES,
+     'themes': QUERY_THEME_KEYWORDS, 'tone': TONE_PREFERENCE_KEYWORDS},
+    {'a': {'x': ['fight'], 'y': ['fighter', 'he']}, 'b': {'z': ['ghte', 'fig']}},
+], ids=['movie_features', 'query', 'overlapping'])
+def test_keyword_matcher_matches_substring_baseline(vocabularies):
+    matcher = KeywordMatcher(vocabularies)
+    texts = _texts(vocabularies) + ['', 'fighter', 'a love story about war and family']
+    batch = matcher.scan_batch(texts)
+    for i, text in enumerate(texts):
+        expected = _baseline_scan(vocabularies, text)
+        assert matcher.scan(text) == expected
+        for category, labels in matcher.labels.items():
+            assert [label for j, label in enumerate(labels) if batch[category][i, j]] == expected[category]
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    rng = np.random.default_rng(0)
+    size = 300
+
+    def pick(values, upto):
+        return [str(v) for v in rng.choice(values, rng.integers(0, upto + 1), replace=False)]
+
+    return pd.DataFrame({
+        'movieId': np.arange(size) + 1,
+        'title': [f'Movie "{i}" é' for i in range(size)],
+        'llm_genres': [pick(GENRES, 3) for _ in range(size)],
+        'llm_themes': [pick(THEMES, 2) for _ in range(size)],
+        'llm_tone': [TONES[i % len(TONES)] for i in range(size)],
+        'genres': [[g.capitalize() for g in pick(GENRES, 2)] for _ in range(size)],
+        'year': [1990 + i % 30 if i % 11 else np.nan for i in range(size)],
+    })
+
+
+def test_attribute_index_filters_match_pandas(catalog):
+    index = AttributeIndex.from_catalog(catalog)
+    has = {
+        'genre': catalog['llm_genres'].map(set),
+        'ml_genre': catalog['genres'].map(lambda genres: {g.lower() for g in genres}),
+        'theme': catalog['llm_themes'].map(set),
+    }
+    expression = (any_of('genre', ['Comedy', 'romance']) & ~term('ml_genre', 'horror')) | term('theme', 'war')
+    wanted = has['genre'].map(lambda g: bool(g & {'comedy', 'romance'}))
+    horror = has['ml_genre'].map(lambda g: 'horror' in g)
+    expected = ((wanted & ~horror) | has['theme'].map(lambda t: 'war' in t)).to_numpy()
+    np.testing.assert_array_equal(index.mask(expression), expected)
+    np.testing.assert_array_equal(index.rows(expression), np.flatnonzero(expected))
+    assert index.mask(all_rows()).all() and len(index.mask(all_rows())) == len(catalog)
+    assert not index.mask(term('genre', 'western')).any()
+
+    rows = np.arange(len(catalog))
+    np.testing.assert_array_equal(index.contains('tone', 'dark', rows), (catalog['llm_tone'] == 'dark').to_numpy())
+    assert index.count('genre', 'drama') == int(has['genre'].map(lambda g: 'drama' in g).sum())
+    assert index.values('tone') == sorted(TONES)
+
+    assert criteria_filter({'excluded_genres': []}) is None
+    excluded = index.mask(criteria_filter({'excluded_genres': ['horror']}))
+    np.testing.assert_array_equal(excluded, ~(has['genre'].map(lambda g: 'horror' in g)
+                                              | has['ml_genre'].map(lambda g: 'horror' in g)).to_numpy())
+
+
+def _match_score(movie, criteria):
+    """calculateMatchScore for one movie, as the browser client computes it"""
+    score = GENRE_WEIGHT * len(set(criteria['preferred_genres']) & set(movie['llm_genres']))
+    score += THEME_WEIGHT * len(set(criteria['preferred_themes']) & set(movie['llm_themes']))
+    score += TONE_WEIGHT * (criteria['preferred_tone'] == movie['llm_tone'])
+    if set(criteria.get('excluded_genres') or []) & set(movie['llm_genres']):
+        score *= EXCLUSION_PENALTY
+    return min(score, 1.0)
+
+
+def test_criteria_scorer_matches_per_movie_score(catalog):
+    scorer = CriteriaScorer(AttributeIndex.from_catalog(catalog))
+    criteria_list = [
+        {'preferred_genres': ['comedy', 'romance', 'comedy'], 'preferred_themes': ['love'], 'preferred_tone': 'light'},
+        {'preferred_genres': GENRES, 'preferred_themes': THEMES, 'preferred_tone': 'dark',
+         'excluded_genres': ['horror']},
+        {'preferred_genres': ['western'], 'preferred_themes': [], 'preferred_tone': 'unknown'},
+    ]
+    scores = scorer.score(criteria_list)
+    assert scores.shape == (len(criteria_list), len(catalog))
+    for i, criteria in enumerate(criteria_list):
+        expected = [_match_score(movie, criteria) for movie in catalog.to_dict('records')]
+        np.testing.assert_allclose(scores[i], expected, atol=1e-6)
+    assert scores.max() <= 1.0 and not scores[2].any()
+
+
+@pytest.fixture(scope='module')
+def clustered():
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((20, 16)).astype(np.float32)
+
+    def sample(count):
+        return normalize_rows(centers[rng.integers(0, 20, count)]
+                              + 0.3 * rng.standard_normal((count, 16)).astype(np.float32))
+
+    return sample(3000), sample(50)
+
+
+def test_ivf_recall_against_exact_search(clustered):
+    vectors, queries = clustered
+    exact_indices, exact_scores = ExactIndex(vectors).search(queries, 10)
+    index = IVFIndex(vectors, n_lists=30, n_probe=4)
+
+    # Probing every list is exact search
+    indices, scores = index.search(queries, 10, n_probe=index.n_lists)
+    np.testing.assert_array_equal(indices, exact_indices)
+    np.testing.assert_allclose(scores, exact_scores, atol=1e-5)
+
+    report = recall_report(index, queries, 10, [1, 4, 30])
+    recalls = [setting['recall@10'] for setting in report['settings']]
+    assert recalls == sorted(recalls) and recalls[-1] == 1.0
+    assert recalls[1] >= 0.9
+    single = np.concatenate([index.search(query, 10)[0] for query in queries])
+    np.testing.assert_array_equal(single, index.search(queries, 10)[0])
+
+
+def test_retrieval_index_save_and_load(clustered, tmp_path):
+    vectors, queries = clustered
+    for backend in ('exact', 'ivf'):
+        index = build_index(vectors, backend=backend)
+        path = str(tmp_path / f'{backend}.npz')
+        index.save(path)
+        loaded = RetrievalIndex.load(path)
+        assert type(loaded) is type(index) and len(loaded) == len(vectors)
+        np.testing.assert_array_equal(loaded.search(queries, 10)[0], index.search(queries, 10)[0])
+    with pytest.raises(ValueError):
+        build_index(vectors, backend='hnsw')
+
+
+def test_ivf_pads_missing_results():
+    vectors = np.eye(4, dtype=np.float32)
+    indices, scores = IVFIndex(vectors, n_lists=4, n_probe=1).search(vectors[:2], 3)
+    np.testing.assert_array_equal(indices, [[0, -1, -1], [1, -1, -1]])
+    assert np.isneginf(scores[:, 1:]).all()
+    empty_indices, _ = IVFIndex(np.zeros((0, 4), dtype=np.float32)).search(vectors, 3)
+    assert (empty_indices == -1).all()
+
+
+def test_response_builder_bodies_parse_to_expected_json(catalog):
+    builder = ResponseBuilder(catalog)
+    rows, scores, match_scores = np.array([5, 0, 11]), np.array([0.9, 0.5, 0.25], dtype=np.float32), [1.1, 0.6, 0.3]
+    criteria = {'preferred_genres': ['comedy'], 'search_vector': np.zeros(3)}
+
+    body = json.loads(builder.query_response('funny "films"', criteria, rows, scores, ['a', 'b', 'c'],
+                                             match_scores=match_scores))
+    assert body['query'] == 'funny "films"' and body['type'] == 'enhanced'
+    assert body['search_criteria'] == {'preferred_genres': ['comedy']}
+    for item, row, score, match, explanation in zip(body['recommendations'], rows, scores, match_scores, 'abc'):
+        movie = catalog.iloc[row]
+        assert item == {'title': movie['title'], 'genres': movie['llm_genres'], 'themes': movie['llm_themes'],
+                        'tone': movie['llm_tone'], 'year': int(movie['year']) if movie['year'] == movie['year'] else '',
+                        'score': pytest.approx(float(score)), 'match_score': match, 'explanation': explanation}
+    assert body['recommendations'][2]['year'] == ''
+
+    compact = json.loads(builder.query_response('q', criteria, rows, scores, compact=True))
+    assert compact['ids'] == (rows + 1).tolist() and 'match_scores' not in compact
+
+    user = json.loads(builder.user_response(42, [1, 2], [5, 4], rows, scores, 'two_tower'))
+    assert user['user_id'] == 42 and user['type'] == 'two_tower'
+    assert [item['rating'] for item in user['history']] == [5, 4]
+    assert [item['title'] for item in user['recommendations']] == catalog['title'].iloc[rows].tolist()
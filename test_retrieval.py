@@ -0,0 +1,132 @@
+import threading
+
+import numpy as np
+import pytest
+
+from hybrid_scorer import GATHER_FRACTION, HybridScorer, Tower
+from micro_batcher import MicroBatchScheduler
+
+NUM_ROWS, DIM, K = 500, 8, 10
+
+
+def _reference(llm, traditional, queries, alpha, candidates=None, bias=None):
+    """Brute-force top-K (indices, scores) per query, padded with -1 / -inf"""
+    def unit(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+    scores = unit(queries) @ (alpha * unit(llm) + (1 - alpha) * unit(traditional)).T
+    if bias is not None:
+        scores = scores + bias
+    if candidates is not None:
+        scores = np.where(candidates, scores, -np.inf)
+    indices = np.argsort(-scores, axis=1, kind='stable')[:, :K]
+    top = np.take_along_axis(scores, indices, axis=1)
+    return np.where(np.isfinite(top), indices, -1), top
+
+
+@pytest.fixture(scope='module')
+def towers():
+    rng = np.random.default_rng(0)
+    llm = rng.standard_normal((NUM_ROWS, DIM)).astype(np.float32)
+    traditional = rng.standard_normal((NUM_ROWS, DIM)).astype(np.float32)
+    queries = rng.standard_normal((4, DIM)).astype(np.float32)
+    bias = 0.3 * rng.random((4, NUM_ROWS)).astype(np.float32)
+    return llm, traditional, queries, bias
+
+
+def _masks(fraction, seed=1):
+    return np.random.default_rng(seed).random((4, NUM_ROWS)) < fraction
+
+
+@pytest.mark.parametrize('alpha', [0.0, 0.7, 1.0])
+@pytest.mark.parametrize('candidates', [
+    None,
+    _masks(0.6),                           # masked full pass
+    _masks(GATHER_FRACTION / 4),           # gathered rows
+    _masks(5 / NUM_ROWS, seed=2),          # fewer candidates than K
+    np.zeros((4, NUM_ROWS), dtype=bool),   # no candidates at all
+])
+@pytest.mark.parametrize('biased', [False, True])
+def test_top_k_matches_reference(towers, alpha, candidates, biased):
+    llm, traditional, queries, bias = towers
+    bias = bias if biased else None
+    scorer = HybridScorer(llm, traditional)
+    expected_indices, expected_scores = _reference(llm, traditional, queries, alpha, candidates, bias)
+
+    indices, scores = scorer.top_k_batch(queries, K, alpha, candidates=candidates, bias=bias)
+    np.testing.assert_array_equal(indices, expected_indices)
+    np.testing.assert_allclose(scores, expected_scores, atol=1e-5)
+
+    for i, query in enumerate(queries):
+        indices, scores = scorer.top_k(query, K, alpha,
+                                       candidates=None if candidates is None else candidates[i],
+                                       bias=None if bias is None else bias[i])
+        np.testing.assert_array_equal(indices, expected_indices[i])
+        np.testing.assert_allclose(scores, expected_scores[i], atol=1e-5)
+
+
+def test_coded_tower_matches_dense(towers):
+    llm, traditional, queries, bias = towers
+    codes = np.random.default_rng(3).integers(0, 50, NUM_ROWS)
+    dense = HybridScorer(llm[:50][codes], traditional)
+    coded = HybridScorer(Tower(llm[:50], codes), traditional)
+    mask = _masks(GATHER_FRACTION / 4)
+    for candidates in (None, mask):
+        expected = dense.top_k_batch(queries, K, 0.7, candidates=candidates, bias=bias)
+        actual = coded.top_k_batch(queries, K, 0.7, candidates=candidates, bias=bias)
+        np.testing.assert_allclose(actual[1], expected[1], atol=1e-5)
+
+
+def test_micro_batcher_batches_concurrent_requests():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatchScheduler(batch_fn, max_batch=8, max_wait_ms=50)
+    try:
+        futures = [batcher.submit(i) for i in range(8)]
+        assert [future.result(5) for future in futures] == [i * 2 for i in range(8)]
+        assert sum(len(call) for call in calls) == 8
+        assert len(calls) < 8
+    finally:
+        batcher.close()
+
+
+def test_micro_batcher_isolates_failing_items():
+    def batch_fn(items):
+        return [10 // item for item in items]
+
+    batcher = MicroBatchScheduler(batch_fn, max_batch=8, max_wait_ms=50)
+    try:
+        futures = [batcher.submit(item) for item in (1, 0, 5)]
+        assert futures[0].result(5) == 10
+        with pytest.raises(ZeroDivisionError):
+            futures[1].result(5)
+        assert futures[2].result(5) == 2
+    finally:
+        batcher.close()
+
+
+def test_micro_batcher_skips_cancelled_requests():
+    release = threading.Event()
+    seen = []
+
+    def batch_fn(items):
+        release.wait(5)
+        seen.extend(items)
+        return items
+
+    batcher = MicroBatchScheduler(batch_fn, max_batch=1, max_wait_ms=0)
+    try:
+        first = batcher.submit('first')
+        cancelled = batcher.submit('cancelled')
+        assert cancelled.cancel()
+        release.set()
+        assert first.result(5) == 'first'
+        assert batcher.submit('after').result(5) == 'after'
+        assert seen == ['first', 'after']
+    finally:
+        batcher.close()
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from asgi_app import MAX_BODY_BYTES, RecommenderASGI
+from llm_feature_extractor import LLMFeatureExtractor, ProductionLLMExtractor
+from llm_stub_server import start_stub_server
+from micro_batcher import MicroBatchScheduler
+from recommendation_service import RecommendationService
+
+OVERVIEWS = [
+    "A young couple falls in love during the war.",
+    "A detective hunts a serial killer through a dark city.",
+    "Aliens invade and a family fights to survive.",
+    "A funny road trip with friends.",
+] * 3
+
+
+class _Service:
+    """The slice of RecommendationService the ASGI app calls, over a real micro-batcher"""
+    parse_recommend = staticmethod(RecommendationService.parse_recommend)
+
+    def __init__(self, batch_wait_ms=50):
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+        self.query_batcher = MicroBatchScheduler(self._score_batch, max_batch=16, max_wait_ms=batch_wait_ms)
+        self.events = []
+        self.closed = False
+
+    def _score_batch(self, queries):
+        self.release.wait(5)
+        self.batches.append(len(queries))
+        return [(np.array([len(query)]), np.array([0.5]), np.array([0.75])) for query in queries]
+
+    def submit_query(self, query) -> Future:
+        return self.query_batcher.submit(query)
+
+    def query_response(self, query, rows, scores, match_scores, compact, explain):
+        return json.dumps({'query': query, 'ids': rows.tolist(), 'scores': scores.tolist(),
+                           'match_scores': match_scores.tolist(), 'compact': compact, 'explain': explain})
+
+    def handle_recommend(self, data):
+        return json.dumps({'user_id': int(data['user_id']), 'type': 'two_tower'})
+
+    def handle_events(self, data, text):
+        self.events.append(data if data is not None else text)
+        return {'applied': 1}
+
+    def metrics(self):
+        return {'query_batcher': self.query_batcher.stats()}
+
+    def close(self):
+        self.closed = True
+        self.query_batcher.close()
+
+
+async def _request(app, method, path, body=b'', content_type='application/json'):
+    """One HTTP request through the ASGI callable: (status, headers, decoded JSON body)"""
+    chunks = [body[i:i + 65536] for i in range(0, len(body), 65536)] or [b'']
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path,
+             'headers': [(b'content-type', content_type.encode())]}
+    await app(scope, receive, send)
+    return sent[0]['status'], dict(sent[0]['headers']), json.loads(sent[1]['body'])
+
+
+def _serve(scenario, service=None, **params):
+    """Run scenario(app, service) between the ASGI lifespan startup and shutdown"""
+    service = service or _Service()
+    app = RecommenderASGI(lambda: service, **params)
+
+    async def run():
+        startup = [{'type': 'lifespan.startup'}]
+        shutdown = asyncio.Event()
+        replies = []
+
+        async def receive():
+            if startup:
+                return startup.pop()
+            await shutdown.wait()
+            return {'type': 'lifespan.shutdown'}
+
+        async def send(message):
+            replies.append(message['type'])
+
+        assert (await _request(app, 'GET', '/ready'))[0] == 503
+        lifespan = asyncio.create_task(app({'type': 'lifespan'}, receive, send))
+        while not app.ready:
+            await asyncio.sleep(0.01)
+        try:
+            await scenario(app, service)
+        finally:
+            shutdown.set()
+            await lifespan
+        assert replies == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+    asyncio.run(run())
+    assert service.closed
+
+
+def test_asgi_routes_and_validation():
+    async def scenario(app, service):
+        assert (await _request(app, 'GET', '/health'))[2] == {'status': 'ok'}
+        status, _, body = await _request(app, 'GET', '/ready')
+        assert (status, body) == (200, {'ready': True})
+        assert (await _request(app, 'GET', '/nowhere'))[0] == 404
+        assert (await _request(app, 'POST', '/recommend', b'{"query": 5}'))[2] == {'error': "'query' must be a string"}
+        assert 'error' in (await _request(app, 'POST', '/recommend', b'not json'))[2]
+        assert 'error' in (await _request(app, 'POST', '/recommend', b'{"query": "x", "compact": "false"}'))[2]
+        assert (await _request(app, 'POST', '/recommend', b'x' * (MAX_BODY_BYTES + 1)))[0] == 413
+
+        status, _, body = await _request(app, 'POST', '/recommend', b'{"user_id": 7}')
+        assert (status, body) == (200, {'user_id': 7, 'type': 'two_tower'})
+        status, _, body = await _request(app, 'POST', '/events', b'1 2 5 100', content_type='text/plain')
+        assert (status, body, service.events) == (200, {'applied': 1}, ['1 2 5 100'])
+        status, _, body = await _request(app, 'GET', '/metrics')
+        assert body['server']['max_pending'] == 64 and 'query_batcher' in body
+
+    _serve(scenario)
+
+
+def test_asgi_batches_concurrent_queries():
+    async def scenario(app, service):
+        bodies = [json.dumps({'query': 'q' * (i + 1), 'compact': i % 2 == 0}).encode() for i in range(8)]
+        responses = await asyncio.gather(*[_request(app, 'POST', '/recommend', body) for body in bodies])
+        for i, (status, _, body) in enumerate(responses):
+            assert status == 200
+            assert body == {'query': 'q' * (i + 1), 'ids': [i + 1], 'scores': [0.5], 'match_scores': [0.75],
+                            'compact': i % 2 == 0, 'explain': True}
+        assert sum(service.batches) == 8 and len(service.batches) < 8
+
+    _serve(scenario, max_workers=2)
+
+
+def test_asgi_sheds_load_and_times_out():
+    service = _Service(batch_wait_ms=0)
+    service.release.clear()
+
+    async def scenario(app, service):
+        body = b'{"query": "slow"}'
+        pending = [asyncio.create_task(_request(app, 'POST', '/recommend', body)) for _ in range(2)]
+        while app.in_flight < 2:
+            await asyncio.sleep(0.01)
+        status, headers, _ = await _request(app, 'POST', '/recommend', body)
+        assert status == 429 and headers[b'retry-after'] == b'1'
+        assert [(await task)[0] for task in pending] == [503, 503]
+        assert (app.rejected, app.timed_out) == (1, 2)
+        service.release.set()
+
+    _serve(scenario, service, max_pending=2, request_timeout=0.2)
+
+
+@pytest.fixture
+def stub_server():
+    servers = []
+
+    def start(error_rate):
+        server = start_stub_server(latency_ms=0, error_rate=error_rate)
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_port}/generate"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+ANSWER_KEYS = ('genres', 'themes', 'tone', 'target_audience')
+
+
+def _expected_features(overview):
+    features = LLMFeatureExtractor()._simulate_llm_processing(overview, '')
+    return {key: features[key] for key in ANSWER_KEYS}
+
+
+def test_production_extractor_parses_stub_answers(stub_server):
+    server, url = stub_server(error_rate=0.0)
+    extractor = ProductionLLMExtractor(api_url=url, max_concurrency=4)
+    features = extractor.extract_features_batch(pd.Series(OVERVIEWS), pd.Series([f"T{i}" for i in range(12)]))
+    assert not features['fallback'].any()
+    for overview, row in zip(OVERVIEWS, features.to_dict('records')):
+        assert {key: row[key] for key in ANSWER_KEYS} == _expected_features(overview)
+    assert server.requests == len(OVERVIEWS) and extractor.retries == 0
+
+
+def test_production_extractor_retries_transient_errors(stub_server):
+    server, url = stub_server(error_rate=0.5)
+    extractor = ProductionLLMExtractor(api_url=url, max_concurrency=4, max_retries=30)
+    features = extractor.extract_features_batch(pd.Series(OVERVIEWS))
+    assert not features['fallback'].any() and extractor.failures == 0
+    assert extractor.retries > 0
+    assert server.requests == len(OVERVIEWS) + extractor.retries
+
+
+def test_production_extractor_falls_back_when_retries_run_out(stub_server, capsys):
+    server, url = stub_server(error_rate=1.0)
+    extractor = ProductionLLMExtractor(api_url=url, max_concurrency=4, max_retries=2)
+    features = extractor.extract_features_batch(pd.Series(OVERVIEWS[:4]), pd.Series(['A', 'B', 'C', 'D']))
+    assert features['fallback'].all()
+    assert extractor.failures == 4 and extractor.retries == 8
+    assert server.requests == 4 * 3
+    default = extractor._get_default_features('A')
+    assert features.iloc[0]['genres'] == default['genres']
+    assert 'LLM API error' in capsys.readouterr().out
+    # Empty overviews never reach the endpoint
+    assert extractor.extract_movie_features('', 'E') == extractor._get_default_features('E')
+    assert server.requests == 4 * 3
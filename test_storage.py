@@ -0,0 +1,171 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import query_cache
+from embedding_store import (_atomic_file, catalog_store_exists, load_catalog_store, open_embedding_file,
+                             save_catalog_store, store_lock, write_embedding_file)
+from feature_cache import FeatureCache
+from query_cache import QueryEmbeddingCache
+
+DIM = 6
+
+
+def test_embedding_file_round_trip(tmp_path):
+    path = str(tmp_path / 'vectors.emb')
+    ids = np.array([7, 3, 11])
+    matrix = np.random.default_rng(0).standard_normal((3, DIM)).astype(np.float32)
+    write_embedding_file(path, ids, matrix, {'model_name': 'test-model'})
+
+    mapped = open_embedding_file(path)
+    assert isinstance(mapped.vectors, np.memmap) and not mapped.vectors.flags.writeable
+    assert mapped.version == 1 and mapped.codes is None
+    assert mapped.metadata['model_name'] == 'test-model' and mapped.metadata['dim'] == DIM
+    np.testing.assert_array_equal(mapped.ids, ids)
+    np.testing.assert_array_equal(mapped.matrix, matrix)
+    np.testing.assert_array_equal(open_embedding_file(path, mmap=False).vectors, matrix)
+
+    with pytest.raises(ValueError):
+        write_embedding_file(path, ids, matrix[:2])
+    with open(path, 'r+b') as f:
+        f.write(b'NOTSTORE')
+    with pytest.raises(ValueError):
+        open_embedding_file(path)
+
+
+def test_catalog_store_deduplicates_repeated_vectors(tmp_path):
+    rng = np.random.default_rng(0)
+    distinct = rng.standard_normal((3, DIM)).astype(np.float32)
+    codes = np.array([2, 0, 2, 1, 0, 2, 2, 0])
+    llm = distinct[codes]
+    traditional = rng.standard_normal((len(codes), DIM)).astype(np.float32)
+    catalog = pd.DataFrame({'movieId': np.arange(len(codes)) * 10, 'title': [f"Movie {i}" for i in range(len(codes))],
+                            'llm_embedding': list(llm), 'traditional_embedding': list(traditional)})
+    store_dir = str(tmp_path / 'store')
+    assert not catalog_store_exists(store_dir)
+    save_catalog_store(store_dir, catalog, {'model_name': 'test-model'})
+    assert catalog_store_exists(store_dir)
+
+    loaded, llm_file, traditional_file = load_catalog_store(store_dir)
+    assert llm_file.version == 2 and len(llm_file.vectors) == 3
+    assert traditional_file.codes is None
+    np.testing.assert_array_equal(llm_file.matrix, llm)
+    np.testing.assert_array_equal(llm_file.vectors[llm_file.codes], llm)
+    np.testing.assert_array_equal(traditional_file.matrix, traditional)
+    assert loaded['title'].tolist() == catalog['title'].tolist()
+    assert 'llm_embedding' not in loaded
+
+
+def test_atomic_file_keeps_old_contents_on_failure(tmp_path):
+    path = tmp_path / 'catalog.json'
+    path.write_text('old')
+    with pytest.raises(RuntimeError):
+        with _atomic_file(str(path), 'w') as f:
+            f.write('partial')
+            raise RuntimeError
+    assert path.read_text() == 'old'
+    assert [p.name for p in tmp_path.iterdir()] == ['catalog.json']
+
+    with _atomic_file(str(path), 'w') as f:
+        f.write('new')
+    assert path.read_text() == 'new'
+    assert path.stat().st_mode & 0o777 == 0o644
+
+
+def test_store_lock_serializes_holders(tmp_path):
+    events = []
+
+    def hold(name):
+        with store_lock(str(tmp_path / 'store')):
+            events.append(('enter', name))
+            time.sleep(0.05)
+            events.append(('exit', name))
+
+    threads = [threading.Thread(target=hold, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(events) == 6
+    assert all(events[i][0] == 'enter' and events[i + 1] == ('exit', events[i][1]) for i in range(0, 6, 2))
+
+
+def _extractor(version='v1', model_name='test-model'):
+    return SimpleNamespace(extractor_version=version, model_name=model_name)
+
+
+def test_feature_cache_round_trip_and_keys(tmp_path):
+    path = str(tmp_path / 'features.sqlite')
+    features = {'genres': ['comedy'], 'themes': ['love'], 'tone': 'light', 'target_audience': 'general',
+                'processed_overview': 'A film.', 'fallback': False}
+    embedding = np.arange(DIM, dtype=np.float32)
+
+    with FeatureCache(path) as cache:
+        keys = cache.keys_for(_extractor(), ['A', 'B', None], ['one', 'two', None])
+        assert len(set(keys)) == 3
+        assert cache.put_many([(keys[0], features, embedding)]) == 1
+        assert cache.get_many(keys[1:]) == {}
+
+    with FeatureCache(path) as cache:
+        found = cache.get_many([keys[0], keys[0], keys[1]])
+        assert list(found) == [keys[0]]
+        stored, vector = found[keys[0]]
+        assert 'fallback' not in stored and stored['genres'] == ['comedy']
+        np.testing.assert_array_equal(vector, embedding)
+        assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+        # Any change to the text, extractor version or model is a different entry
+        assert cache.keys_for(_extractor(), ['A'], ['one']) == keys[:1]
+        assert cache.keys_for(_extractor(), ['A'], ['one!']) != keys[:1]
+        assert cache.keys_for(_extractor('v2'), ['A'], ['one']) != keys[:1]
+        assert cache.keys_for(_extractor(model_name='other'), ['A'], ['one']) != keys[:1]
+        cache.clear()
+        assert len(cache) == 0
+
+
+def test_query_cache_evicts_least_recently_used():
+    cache = QueryEmbeddingCache(max_entries=2)
+    cache.put('a', np.zeros(4))
+    cache.put('b', np.ones(4))
+    assert cache.get('a') is not None          # 'b' is now the oldest
+    cache.put('c', np.ones(4))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats()['evictions'] == 1
+
+    sized = QueryEmbeddingCache(max_bytes=100)
+    for key in range(5):
+        sized.put(key, np.zeros(4, dtype=np.float64))  # 32 bytes each
+    assert len(sized) == 3 and sized.stats()['bytes'] == 96
+    assert sized.get(0) is None and sized.get(4) is not None
+
+
+def test_query_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache.time, 'monotonic', lambda: now[0])
+    cache = QueryEmbeddingCache(ttl_seconds=10)
+    cache.put('q', np.zeros(2))
+    now[0] += 9
+    assert cache.get('q') is not None
+    now[0] += 2
+    assert cache.get('q') is None
+    assert cache.stats()['expirations'] == 1 and len(cache) == 0
+
+
+def test_query_cache_computes_once_and_shares_read_only_arrays():
+    calls = []
+    cache = QueryEmbeddingCache()
+
+    def compute():
+        calls.append(1)
+        return np.arange(3.0)
+
+    first = cache.get_or_compute(query_cache.normalize_query('  Funny   MOVIES '), compute)
+    second = cache.get_or_compute(query_cache.normalize_query('funny movies'), compute)
+    assert len(calls) == 1 and first is second
+    assert not first.flags.writeable
+    assert cache.stats()['hit_rate'] == 0.5
@@ -0,0 +1,279 @@
+import argparse
+import json
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from model_registry import DEFAULT_MODEL_NAME, get_embedding_model
+from movielens import DEFAULT_DATA_DIR, load_movielens
+
+LOSSES = ('softmax', 'bpr')
+DEFAULT_CHECKPOINT = 'data/two_tower_checkpoint.npz'
+
+
+class AdamState:
+    def __init__(self, shape, beta1: float = 0.9, beta2: float = 0.999, epsilon: float = 1e-8):
+        """
+        Lazy (sparse) Adam moments for one embedding table: only rows that
+        received a gradient in a step are updated, as in TF's LazyAdam.
+        """
+        self.m = np.zeros(shape, dtype=np.float32)
+        self.v = np.zeros(shape, dtype=np.float32)
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+
+    def apply(self, table: np.ndarray, rows: np.ndarray, grads: np.ndarray, learning_rate: float, step: int):
+        m = self.beta1 * self.m[rows] + (1 - self.beta1) * grads
+        v = self.beta2 * self.v[rows] + (1 - self.beta2) * grads * grads
+        self.m[rows] = m
+        self.v[rows] = v
+        m_hat = m / (1 - self.beta1 ** step)
+        v_hat = v / (1 - self.beta2 ** step)
+        table[rows] -= learning_rate * m_hat / (np.sqrt(v_hat) + self.epsilon)
+
+
+def _sum_rows(index: np.ndarray, grads: np.ndarray):
+    """Sum gradient rows that share an index: (unique rows, summed grads)"""
+    rows, inverse = np.unique(index, return_inverse=True)
+    summed = np.zeros((len(rows), grads.shape[1]), dtype=np.float32)
+    np.add.at(summed, inverse, grads)
+    return rows, summed
+
+
+def softmax_loss_and_grads(user_vectors: np.ndarray, item_vectors: np.ndarray):
+    """
+    In-batch sampled softmax: every other positive item in the batch is a negative.
+    logits = U @ I^T, labels on the diagonal. Returns (loss, dU, dI).
+    """
+    logits = user_vectors @ item_vectors.T
+    logits -= logits.max(axis=1, keepdims=True)
+    probs = np.exp(logits)
+    probs /= probs.sum(axis=1, keepdims=True)
+
+    batch = len(user_vectors)
+    diagonal = np.arange(batch)
+    loss = -np.mean(np.log(probs[diagonal, diagonal] + 1e-12))
+
+    dlogits = probs
+    dlogits[diagonal, diagonal] -= 1
+    dlogits /= batch
+    return loss, dlogits @ item_vectors, dlogits.T @ user_vectors
+
+
+def bpr_loss_and_grads(user_vectors: np.ndarray, positive_vectors: np.ndarray, negative_vectors: np.ndarray):
+    """BPR pairwise loss -log(sigmoid(u.i+ - u.i-)). Returns (loss, dU, dI+, dI-)."""
+    margin = np.sum(user_vectors * (positive_vectors - negative_vectors), axis=1)
+    loss = np.mean(np.logaddexp(0, -margin))
+    dmargin = (-1.0 / (1.0 + np.exp(margin)) / len(margin)).astype(np.float32)[:, None]
+    return (loss, dmargin * (positive_vectors - negative_vectors),
+            dmargin * user_vectors, -dmargin * user_vectors)
+
+
+class TwoTowerTrainer:
+    def __init__(self, num_users: int, num_items: int, embedding_dim: int = 32, loss: str = 'softmax',
+                 learning_rate: float = 0.01, batch_size: int = 512, l2: float = 0.0, seed: int = 0,
+                 min_rating: int = 0):
+        """
+        Collaborative two-tower model over MovieLens ids, trained with NumPy.
+        User tower: user index -> embedding. Item tower: item index -> embedding.
+        Score: dot product. loss='softmax' uses in-batch negatives, loss='bpr' samples
+        one uniform negative per positive. Both tables are updated with lazy Adam.
+        Ratings of at least min_rating are the positives (see positives()); it is
+        checkpointed so online updates treat new ratings the same way.
+
+        To use the item vectors as RAGTwoTowerRecommender's traditional_embedding column,
+        embedding_dim must match the sentence encoder (384 for all-MiniLM-L6-v2).
+        """
+        if loss not in LOSSES:
+            raise ValueError(f"Unknown loss '{loss}', expected one of {LOSSES}")
+        self.num_users = num_users
+        self.num_items = num_items
+        self.embedding_dim = embedding_dim
+        self.loss = loss
+        self.learning_rate = learning_rate
+        self.batch_size = batch_size
+        self.l2 = l2
+        self.seed = seed
+        self.min_rating = min_rating
+        self.rng = np.random.default_rng(seed)
+
+        self.user_embeddings = self.rng.normal(0, 0.05, (num_users, embedding_dim)).astype(np.float32)
+        self.item_embeddings = self.rng.normal(0, 0.05, (num_items, embedding_dim)).astype(np.float32)
+        self.user_adam = AdamState(self.user_embeddings.shape)
+        self.item_adam = AdamState(self.item_embeddings.shape)
+        self.step = 0
+        # Raw ids behind the user/item indices, filled in from checkpoints
+        self.index_user_ids = None
+        self.movie_ids = None
+
+    def positives(self, ratings) -> np.ndarray:
+        """Bool mask of the ratings this model trains on as positives"""
+        return np.asarray(ratings) >= self.min_rating
+
+    def add_users(self, vectors: np.ndarray) -> np.ndarray:
+        """Append user rows initialized to vectors (fresh optimizer state); returns their indices"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.embedding_dim)
+        users = np.arange(self.num_users, self.num_users + len(vectors))
+        self.user_embeddings = np.concatenate([self.user_embeddings, vectors])
+        padding = np.zeros_like(vectors)
+        self.user_adam.m = np.concatenate([self.user_adam.m, padding])
+        self.user_adam.v = np.concatenate([self.user_adam.v, padding])
+        self.num_users += len(vectors)
+        return users
+
+    def compute_gradients(self, users: np.ndarray, items: np.ndarray, negatives: Optional[np.ndarray] = None):
+        """Loss plus summed (rows, grads) for each table for one minibatch"""
+        user_vectors = self.user_embeddings[users]
+        if self.loss == 'softmax':
+            loss, user_grads, item_grads = softmax_loss_and_grads(user_vectors, self.item_embeddings[items])
+            item_index = items
+        else:
+            if negatives is None:
+                negatives = self.rng.integers(0, self.num_items, len(users))
+            loss, user_grads, positive_grads, negative_grads = bpr_loss_and_grads(
+                user_vectors, self.item_embeddings[items], self.item_embeddings[negatives])
+            item_index = np.concatenate([items, negatives])
+            item_grads = np.concatenate([positive_grads, negative_grads])
+
+        if self.l2:
+            user_grads = user_grads + self.l2 * user_vectors
+            item_grads = item_grads + self.l2 * self.item_embeddings[item_index]
+        return loss, _sum_rows(users, user_grads), _sum_rows(item_index, item_grads)
+
+    def apply_gradients(self, user_update, item_update) -> None:
+        self.step += 1
+        self.user_adam.apply(self.user_embeddings, *user_update, self.learning_rate, self.step)
+        self.item_adam.apply(self.item_embeddings, *item_update, self.learning_rate, self.step)
+
+    def train_step(self, users: np.ndarray, items: np.ndarray) -> float:
+        """One optimizer step on a minibatch of (user index, positive item index) pairs"""
+        loss, user_update, item_update = self.compute_gradients(users, items)
+        self.apply_gradients(user_update, item_update)
+        return float(loss)
+
+    def fit(self, user_index: np.ndarray, item_index: np.ndarray, epochs: int = 10,
+            callback: Optional[Callable[[int, float], None]] = None) -> List[float]:
+        """Train for a number of epochs over shuffled minibatches; returns mean loss per epoch"""
+        user_index = np.asarray(user_index)
+        item_index = np.asarray(item_index)
+        history = []
+        for epoch in range(epochs):
+            order = self.rng.permutation(len(user_index))
+            losses = [
+                self.train_step(user_index[batch], item_index[batch])
+                for batch in np.array_split(order, max(1, len(order) // self.batch_size))
+            ]
+            history.append(float(np.mean(losses)))
+            if callback is not None:
+                callback(epoch, history[-1])
+        return history
+
+    def score_users(self, users) -> np.ndarray:
+        """Dot-product scores against every item: (len(users), num_items)"""
+        return self.user_embeddings[np.asarray(users)] @ self.item_embeddings.T
+
+    def config(self) -> Dict:
+        return {'num_users': self.num_users, 'num_items': self.num_items,
+                'embedding_dim': self.embedding_dim, 'loss': self.loss,
+                'learning_rate': self.learning_rate, 'batch_size': self.batch_size,
+                'l2': self.l2, 'seed': self.seed, 'min_rating': self.min_rating}
+
+    def save_checkpoint(self, path: str, index_user_ids=None, movie_ids=None) -> None:
+        """Save embeddings, optimizer state and the id indexers needed to serve them"""
+        arrays = {
+            'user_embeddings': self.user_embeddings, 'item_embeddings': self.item_embeddings,
+            'user_m': self.user_adam.m, 'user_v': self.user_adam.v,
+            'item_m': self.item_adam.m, 'item_v': self.item_adam.v,
+            'step': np.array(self.step), 'config': np.array(json.dumps(self.config())),
+        }
+        if index_user_ids is not None:
+            arrays['index_user_ids'] = np.asarray(index_user_ids)
+        if movie_ids is not None:
+            arrays['movie_ids'] = np.asarray(movie_ids)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load_checkpoint(cls, path: str) -> 'TwoTowerTrainer':
+        with np.load(path, allow_pickle=False) as checkpoint:
+            trainer = cls(**json.loads(str(checkpoint['config'])))
+            trainer.user_embeddings = checkpoint['user_embeddings']
+            trainer.item_embeddings = checkpoint['item_embeddings']
+            trainer.user_adam.m, trainer.user_adam.v = checkpoint['user_m'], checkpoint['user_v']
+            trainer.item_adam.m, trainer.item_adam.v = checkpoint['item_m'], checkpoint['item_v']
+            trainer.step = int(checkpoint['step'])
+            trainer.index_user_ids = checkpoint['index_user_ids'] if 'index_user_ids' in checkpoint else None
+            trainer.movie_ids = checkpoint['movie_ids'] if 'movie_ids' in checkpoint else None
+        return trainer
+
+    def item_vectors_for(self, movie_ids, trained_movie_ids) -> np.ndarray:
+        """
+        Item vectors in the row order of movie_ids, e.g. a catalog's movieId column.
+        Movies the model never saw get a zero vector.
+        """
+        trained_movie_ids = np.asarray(trained_movie_ids)
+        order = np.argsort(trained_movie_ids)
+        positions = np.searchsorted(trained_movie_ids, movie_ids, sorter=order)
+        positions = order[np.minimum(positions, len(order) - 1)]
+        found = trained_movie_ids[positions] == np.asarray(movie_ids)
+        vectors = np.zeros((len(positions), self.embedding_dim), dtype=np.float32)
+        vectors[found] = self.item_embeddings[positions[found]]
+        return vectors
+
+
+def with_traditional_embeddings(enhanced_movies_df: pd.DataFrame, trainer: TwoTowerTrainer,
+                                trained_movie_ids) -> pd.DataFrame:
+    """
+    Copy of an enriched catalog whose traditional_embedding column holds trained item
+    vectors. Both towers are scored against the same query embedding, so the trainer's
+    embedding_dim must equal the catalog's LLM embedding dimension.
+    """
+    if len(enhanced_movies_df) and 'llm_embedding' in enhanced_movies_df:
+        encoder_dim = len(enhanced_movies_df['llm_embedding'].iloc[0])
+        if trainer.embedding_dim != encoder_dim:
+            raise ValueError(f"Trained item vectors have dimension {trainer.embedding_dim}, but the catalog's "
+                             f"LLM embeddings have {encoder_dim}; train with --embedding-dim {encoder_dim}")
+    vectors = trainer.item_vectors_for(enhanced_movies_df['movieId'].to_numpy(), trained_movie_ids)
+    result = enhanced_movies_df.copy()
+    result['traditional_embedding'] = list(vectors)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the collaborative two-tower model on MovieLens")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--output', default=DEFAULT_CHECKPOINT)
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--embedding-dim', type=int,
+                        help="defaults to the sentence encoder's dimension, so item vectors can serve as the "
+                             "traditional tower")
+    parser.add_argument('--model-name', default=DEFAULT_MODEL_NAME, help="encoder whose dimension is the default")
+    parser.add_argument('--batch-size', type=int, default=512)
+    parser.add_argument('--learning-rate', type=float, default=0.01)
+    parser.add_argument('--loss', choices=LOSSES, default='softmax')
+    parser.add_argument('--min-rating', type=int, default=4,
+                        help="ratings below this are not positives, in training or in online updates")
+    args = parser.parse_args()
+
+    data = load_movielens(args.data_dir)
+    embedding_dim = args.embedding_dim or get_embedding_model(args.model_name).get_sentence_embedding_dimension()
+    trainer = TwoTowerTrainer(data.num_users, data.num_items, embedding_dim=embedding_dim,
+                              loss=args.loss, learning_rate=args.learning_rate, batch_size=args.batch_size,
+                              min_rating=args.min_rating)
+
+    positive = trainer.positives(data.ratings)
+    start = time.perf_counter()
+    trainer.fit(data.user_index[positive], data.item_index[positive], epochs=args.epochs,
+                callback=lambda epoch, loss: print(f"Epoch {epoch + 1}/{args.epochs}: loss {loss:.4f}"))
+    elapsed = time.perf_counter() - start
+    print(f"Trained on {int(positive.sum())} of {data.num_ratings} ratings in {elapsed:.1f}s "
+          f"({int(positive.sum()) * args.epochs / elapsed:,.0f} examples/s)")
+
+    trainer.save_checkpoint(args.output, index_user_ids=data.index_user_ids, movie_ids=data.movie_ids)
+    print(f"Checkpoint saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()